@@ -0,0 +1,196 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from revisions import NOT_DELETED, trip_key
+
+TRIP_ACCESS_TTL_SECONDS = float(os.environ.get("TRIP_ACCESS_TTL_SECONDS", "5"))
+TRIP_ACCESS_MAX_ENTRIES = int(os.environ.get("TRIP_ACCESS_MAX_ENTRIES", "10000"))
+
+# Only what is needed to answer "may this user touch this trip"
+ACCESS_PROJECTION = {"userId": 1, "collaborators.userId": 1, "collaborators.role": 1}
+
+def live_trip_query(trip_id: str) -> dict:
+    return {"_id": trip_key(trip_id), **NOT_DELETED}
+
+class TripAccess:
+    """Owner and member roles of one trip"""
+
+    __slots__ = ("trip_id", "owner_id", "members")
+
+    def __init__(self, trip_id: str, owner_id: str, members: Dict[str, str]):
+        self.trip_id = trip_id
+        self.owner_id = owner_id
+        self.members = members
+
+    @classmethod
+    def from_doc(cls, trip: dict) -> "TripAccess":
+        members = {c["userId"]: c.get("role", "editor") for c in trip.get("collaborators", [])}
+        return cls(str(trip["_id"]), trip["userId"], members)
+
+    def role_of(self, user_id: str) -> Optional[str]:
+        if user_id == self.owner_id:
+            return "owner"
+        return self.members.get(user_id)
+
+class TTLCache:
+    """Bounded TTL/LRU cache used for trip access and per-user trip sets"""
+
+    def __init__(self, max_entries: int = TRIP_ACCESS_MAX_ENTRIES,
+                 ttl_seconds: float = TRIP_ACCESS_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self._clock():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+
+        self._entries[key] = (self._clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+trip_access_cache = TTLCache()
+user_trips_cache = TTLCache()
+
+def invalidate_trip_access(trip_id: str, user_ids: Iterable[str] = ()):
+    """Call after any change to a trip's owner, collaborators or existence.
+
+    user_ids are the users whose set of reachable trips changed (new owner,
+    added or removed collaborators, every member of a deleted trip).
+    """
+    trip_access_cache.invalidate(str(trip_id))
+    for user_id in user_ids:
+        user_trips_cache.invalidate(user_id)
+
+async def get_trip_access(trip_id: str, db: AsyncIOMotorDatabase) -> Optional[TripAccess]:
+    access = trip_access_cache.get(trip_id)
+    if access is not None:
+        return access
+
+    trip = await db.trips.find_one(live_trip_query(trip_id), ACCESS_PROJECTION)
+    if not trip:
+        return None
+
+    access = TripAccess.from_doc(trip)
+    trip_access_cache.set(access.trip_id, access)
+    return access
+
+async def check_trip_access(trip_id: str, user_id: str, db: AsyncIOMotorDatabase) -> TripAccess:
+    """Check if user has access to trip"""
+    access = await get_trip_access(trip_id, db)
+
+    if access is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+    if access.role_of(user_id) is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    return access
+
+async def get_trip_roles(trip_ids: Iterable[str], user_id: str, db: AsyncIOMotorDatabase) -> Dict[str, Optional[str]]:
+    """Batch form: the user's role on each trip (None if missing or no access).
+
+    Cached trips cost nothing; the rest are resolved with one $in query.
+    """
+    roles: Dict[str, Optional[str]] = {}
+    missing = []
+    for trip_id in trip_ids:
+        access = trip_access_cache.get(trip_id)
+        if access is None:
+            missing.append(trip_id)
+            roles[trip_id] = None
+        else:
+            roles[trip_id] = access.role_of(user_id)
+
+    if missing:
+        async for trip in db.trips.find({"_id": {"$in": [trip_key(t) for t in missing]}, **NOT_DELETED}, ACCESS_PROJECTION):
+            access = TripAccess.from_doc(trip)
+            trip_access_cache.set(access.trip_id, access)
+            roles[access.trip_id] = access.role_of(user_id)
+
+    return roles
+
+def member_query(user_id: str) -> dict:
+    """Live trips where user is owner or collaborator"""
+    return {
+        "$or": [
+            {"userId": user_id},
+            {"collaborators.userId": user_id}
+        ],
+        **NOT_DELETED
+    }
+
+async def accessible_trip_ids(db: AsyncIOMotorDatabase, user_id: str, refresh: bool = False) -> List[str]:
+    """Ids of every trip the user may touch, cached with the access TTL"""
+    trip_ids = None if refresh else user_trips_cache.get(user_id)
+    if trip_ids is None:
+        trip_ids = [str(trip["_id"]) async for trip in db.trips.find(member_query(user_id), {"_id": 1})]
+        user_trips_cache.set(user_id, trip_ids)
+    return trip_ids
+
+async def write_trip_child(
+    db: AsyncIOMotorDatabase,
+    collection: AsyncIOMotorCollection,
+    child_id: str,
+    user_id: str,
+    label: str,
+    write: Callable[[dict], Awaitable[Optional[dict]]]
+) -> dict:
+    """Run a find_one_and_* write on one child after checking its trip's access.
+
+    The child's tripId is read first, access to that trip is checked through
+    the cache, and write receives {_id, tripId}. 404 if the child or its
+    trip is gone (a tombstoned trip included); a denial is rechecked once
+    against the database, since the cached entry may predate an invite.
+    """
+    try:
+        oid = ObjectId(child_id)
+    except Exception:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+
+    child = await collection.find_one({"_id": oid}, {"tripId": 1})
+    if not child:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+
+    trip_id = child["tripId"]
+    try:
+        await check_trip_access(trip_id, user_id, db)
+    except HTTPException as e:
+        if e.status_code != 403:
+            raise
+        trip_access_cache.invalidate(trip_id)
+        await check_trip_access(trip_id, user_id, db)
+
+    doc = await write({"_id": oid, "tripId": trip_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail=f"{label} not found")
+    return doc
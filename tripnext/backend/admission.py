@@ -0,0 +1,186 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+from fastapi import HTTPException, Request
+from metrics import REGISTRY, CounterMetric, GaugeMetric
+
+logger = logging.getLogger(__name__)
+
+# Token buckets: sustained rate per minute plus a burst allowance
+AUTH_RATE_PER_IP_PER_MINUTE = float(os.environ.get("AUTH_RATE_PER_IP_PER_MINUTE", "30"))
+AUTH_BURST_PER_IP = float(os.environ.get("AUTH_BURST_PER_IP", "10"))
+AUTH_RATE_PER_SESSION_ID_PER_MINUTE = float(os.environ.get("AUTH_RATE_PER_SESSION_ID_PER_MINUTE", "6"))
+AUTH_BURST_PER_SESSION_ID = float(os.environ.get("AUTH_BURST_PER_SESSION_ID", "3"))
+AUTH_RATE_MAX_KEYS = int(os.environ.get("AUTH_RATE_MAX_KEYS", "100000"))
+# Logins handled at once, and how many may wait (and for how long) for a slot
+AUTH_MAX_CONCURRENCY = int(os.environ.get("AUTH_MAX_CONCURRENCY", "16"))
+AUTH_MAX_QUEUE = int(os.environ.get("AUTH_MAX_QUEUE", "64"))
+AUTH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("AUTH_QUEUE_TIMEOUT_SECONDS", "5"))
+AUTH_SHED_RETRY_AFTER_SECONDS = int(os.environ.get("AUTH_SHED_RETRY_AFTER_SECONDS", "2"))
+# Set this when deploying behind a reverse proxy or ingress: the number of
+# proxies in front of the app that append to X-Forwarded-For. Left at 0
+# behind a proxy, every client shares the proxy's address and one per-IP
+# bucket throttles all logins (a warning is logged when that is detected).
+# The client address is the entry the outermost trusted proxy appended;
+# anything to its left was sent by the client and is ignored.
+# AUTH_TRUST_FORWARDED_FOR=true is the older spelling of one hop.
+AUTH_TRUST_FORWARDED_FOR = os.environ.get("AUTH_TRUST_FORWARDED_FOR", "false").lower() == "true"
+AUTH_TRUSTED_PROXY_HOPS = int(os.environ.get("AUTH_TRUSTED_PROXY_HOPS", "1" if AUTH_TRUST_FORWARDED_FOR else "0"))
+
+auth_shed = CounterMetric("tripnext_auth_shed_total", "Auth requests rejected by admission control", ("reason",))
+auth_in_flight = GaugeMetric("tripnext_auth_in_flight", "Logins currently being handled")
+auth_queued = GaugeMetric("tripnext_auth_queue_depth", "Logins waiting for a slot")
+REGISTRY.extend([auth_shed, auth_in_flight, auth_queued])
+
+class TokenBucket:
+    """Per-key token buckets with a bounded, least-recently-used key table.
+
+    Each key refills at rate_per_minute up to burst tokens; a request takes
+    one token or learns how long until one is available.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, max_keys: int = AUTH_RATE_MAX_KEYS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def take(self, key: str) -> float:
+        """0 if the request may proceed, else seconds until it could"""
+        if not self.enabled:
+            return 0.0
+
+        now = self._clock()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+
+        # A forgotten key just starts again with a full bucket
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class ConcurrencyLimiter:
+    """At most max_concurrent holders; up to max_queue more wait, each for at most queue_timeout"""
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _update_gauges(self):
+        auth_in_flight.set((), self.in_flight)
+        auth_queued.set((), self.waiting)
+
+    async def __aenter__(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                shed("queue_full", 503, AUTH_SHED_RETRY_AFTER_SECONDS)
+            self.waiting += 1
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                shed("queue_timeout", 503, AUTH_SHED_RETRY_AFTER_SECONDS)
+            finally:
+                self.waiting -= 1
+                self._update_gauges()
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self._update_gauges()
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self._semaphore.release()
+        self._update_gauges()
+
+def shed(reason: str, status_code: int, retry_after: float):
+    auth_shed.inc((reason,))
+    detail = "Too many login attempts" if status_code == 429 else "Login service is busy"
+    raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+def client_ip(request: Request, hops: int = AUTH_TRUSTED_PROXY_HOPS) -> str:
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded:
+        return peer
+    if hops <= 0:
+        warn_untrusted_proxy(peer)
+        return peer
+
+    addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+    # Fewer entries than proxies means the request skipped one; fall back to the peer
+    return addresses[-hops] if len(addresses) >= hops else peer
+
+proxy_warning = {"logged": False, "peer": None}
+
+def warn_untrusted_proxy(peer: str):
+    """Logged once: requests arrive through a proxy, so per-IP limits apply to the proxy"""
+    if not proxy_warning["logged"]:
+        proxy_warning.update(logged=True, peer=peer)
+        logger.error(
+            f"Auth requests carry X-Forwarded-For but AUTH_TRUSTED_PROXY_HOPS is 0; every client behind "
+            f"proxy {peer} shares one per-IP login rate limit. Set AUTH_TRUSTED_PROXY_HOPS to the number of proxies."
+        )
+
+class AuthAdmission:
+    """Rate limits and a bounded login queue in front of the auth routes"""
+
+    def __init__(self):
+        self.by_ip = TokenBucket(AUTH_RATE_PER_IP_PER_MINUTE, AUTH_BURST_PER_IP)
+        self.by_session_id = TokenBucket(AUTH_RATE_PER_SESSION_ID_PER_MINUTE, AUTH_BURST_PER_SESSION_ID)
+        self.logins = ConcurrencyLimiter(AUTH_MAX_CONCURRENCY, AUTH_MAX_QUEUE, AUTH_QUEUE_TIMEOUT_SECONDS)
+
+    def check_rate(self, request: Request):
+        """429 with Retry-After once the client IP or the presented session id runs out of tokens"""
+        wait = self.by_ip.take(client_ip(request))
+        if wait:
+            shed("rate_ip", 429, wait)
+        session_id = request.headers.get("X-Session-ID")
+        if session_id:
+            wait = self.by_session_id.take(session_id)
+            if wait:
+                shed("rate_session_id", 429, wait)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "inFlight": self.logins.in_flight,
+            "queued": self.logins.waiting,
+            "maxConcurrency": self.logins.max_concurrent,
+            "maxQueue": self.logins.max_queue,
+            "trackedIps": len(self.by_ip),
+            "trackedSessionIds": len(self.by_session_id),
+            "trustedProxyHops": AUTH_TRUSTED_PROXY_HOPS,
+            "untrustedProxySeen": proxy_warning["peer"],
+            "shed": {labels[0]: int(count) for labels, count in auth_shed.values().items()},
+        }
+
+auth_admission = AuthAdmission()
+
+async def admit_login(request: Request):
+    """Rate-limit, then queue for one of the login slots; holds the slot for the whole request"""
+    auth_admission.check_rate(request)
+    async with auth_admission.logins:
+        yield
@@ -1,16 +1,22 @@
 from fastapi import APIRouter, HTTPException, Response, Request, Depends
 from datetime import datetime, timezone, timedelta
-import requests
 import logging
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import User, Session, UserResponse
 from database import get_database
+from session_cache import session_cache
+from session_tokens import SESSION_MODE, session_denylist, session_signer
+from auth_client import AuthServiceClient, AuthServiceError, get_auth_client
+from admission import admit_login
 
 logger = logging.getLogger(__name__)
 
 auth_router = APIRouter(prefix="/auth", tags=["auth"])
 
-EMERGENT_AUTH_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+def as_utc(value: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes; make them comparable with aware ones"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
 
 async def get_current_user(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)) -> User:
     """Get current user from session token in cookie or Authorization header"""
@@ -28,21 +34,45 @@ async def get_current_user(request: Request, db: AsyncIOMotorDatabase = Depends(
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    # Find session in database
-    session = await db.sessions.find_one({"sessionToken": session_token})
-    if not session or session["expiresAt"] < datetime.now(timezone.utc):
-        raise HTTPException(status_code=401, detail="Session expired or invalid")
+    # Signed tokens are checked in memory on every request, before the cache,
+    # so a revocation takes effect even for users cached on this worker
+    claims = None
+    if session_signer.enabled and session_signer.is_signed(session_token):
+        claims = session_signer.verify(session_token)
+        if claims is None or session_denylist.is_revoked(claims):
+            raise HTTPException(status_code=401, detail="Session expired or invalid")
     
-    # Get user
-    user = await db.users.find_one({"_id": session["userId"]})
+    # Serve repeat requests from the in-process cache
+    cached_user = session_cache.get(session_token)
+    if cached_user is not None:
+        return cached_user
+    
+    if claims is not None:
+        user_id, expires_at = claims.user_id, claims.expires
+    else:
+        # Find session in database
+        session = await db.sessions.find_one({"sessionToken": session_token})
+        if not session or as_utc(session["expiresAt"]) < datetime.now(timezone.utc):
+            raise HTTPException(status_code=401, detail="Session expired or invalid")
+        user_id, expires_at = session["userId"], session["expiresAt"]
+    
+    # Get user (sessions store the id as a string)
+    user = await db.users.find_one({"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
     user["_id"] = str(user["_id"])
-    return User(**user)
+    current_user = User(**user)
+    session_cache.set(session_token, current_user, expires_at)
+    return current_user
 
-@auth_router.post("/session")
-async def create_session(request: Request, response: Response, db: AsyncIOMotorDatabase = Depends(get_database)):
+@auth_router.post("/session", dependencies=[Depends(admit_login)])
+async def create_session(
+    request: Request,
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    auth_service: AuthServiceClient = Depends(get_auth_client)
+):
     """Process session_id from Emergent Auth and create session"""
     try:
         # Get session_id from header
@@ -51,14 +81,11 @@ async def create_session(request: Request, response: Response, db: AsyncIOMotorD
             raise HTTPException(status_code=400, detail="Session ID required")
         
         # Call Emergent Auth API
-        headers = {"X-Session-ID": session_id}
-        auth_response = requests.get(EMERGENT_AUTH_URL, headers=headers, timeout=10)
+        auth_data = await auth_service.fetch_session_data(session_id)
         
-        if auth_response.status_code != 200:
+        if auth_data is None:
             raise HTTPException(status_code=400, detail="Invalid session ID")
         
-        auth_data = auth_response.json()
-        
         # Check if user exists
         existing_user = await db.users.find_one({"email": auth_data["email"]})
         
@@ -78,16 +105,21 @@ async def create_session(request: Request, response: Response, db: AsyncIOMotorD
             user_id = str(result.inserted_id)
         
         # Create session
-        session_token = auth_data["session_token"]
-        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-        
-        session_data = {
-            "userId": user_id,
-            "sessionToken": session_token,
-            "expiresAt": expires_at,
-            "createdAt": datetime.now(timezone.utc)
-        }
-        await db.sessions.insert_one(session_data)
+        if SESSION_MODE == "signed":
+            # Self-contained token: nothing to store, nothing to prune
+            session_token, expires_at = session_signer.issue(user_id)
+        else:
+            session_token = auth_data["session_token"]
+            expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+            
+            session_data = {
+                "userId": user_id,
+                "sessionToken": session_token,
+                "expiresAt": expires_at,
+                "createdAt": datetime.now(timezone.utc)
+            }
+            await db.sessions.insert_one(session_data)
+            session_cache.invalidate(session_token)
         
         # Set cookie
         response.set_cookie(
@@ -96,21 +128,20 @@ async def create_session(request: Request, response: Response, db: AsyncIOMotorD
             httponly=True,
             secure=True,
             samesite="none",
-            max_age=7 * 24 * 60 * 60,  # 7 days
+            max_age=int((expires_at - datetime.now(timezone.utc)).total_seconds()),
             path="/"
         )
         
-        # Get user data
-        user = await db.users.find_one({"_id": user_id})
-        
         return {
             "id": user_id,
             "email": auth_data["email"],
             "name": auth_data["name"],
             "avatar": auth_data.get("picture")
         }
-        
-    except requests.RequestException as e:
+    
+    except HTTPException:
+        raise
+    except AuthServiceError as e:
         logger.error(f"Error calling Emergent Auth: {e}")
         raise HTTPException(status_code=500, detail="Authentication failed")
     except Exception as e:
@@ -133,8 +164,13 @@ async def logout(request: Request, response: Response, db: AsyncIOMotorDatabase
     session_token = request.cookies.get("session_token")
     
     if session_token:
-        # Delete session from database
-        await db.sessions.delete_one({"sessionToken": session_token})
+        claims = session_signer.verify(session_token) if session_signer.is_signed(session_token) else None
+        if claims is not None:
+            await session_denylist.revoke_session(db, claims)
+        else:
+            # Delete session from database
+            await db.sessions.delete_one({"sessionToken": session_token})
+        session_cache.invalidate(session_token)
     
     # Clear cookie
     response.delete_cookie(key="session_token", path="/")
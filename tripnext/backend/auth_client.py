@@ -0,0 +1,93 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EMERGENT_AUTH_URL = os.environ.get(
+    "EMERGENT_AUTH_URL",
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+AUTH_HTTP_TIMEOUT_SECONDS = float(os.environ.get("AUTH_HTTP_TIMEOUT_SECONDS", "10"))
+AUTH_HTTP_RETRIES = int(os.environ.get("AUTH_HTTP_RETRIES", "2"))
+AUTH_HTTP_MAX_CONCURRENCY = int(os.environ.get("AUTH_HTTP_MAX_CONCURRENCY", "32"))
+AUTH_HTTP_MAX_CONNECTIONS = int(os.environ.get("AUTH_HTTP_MAX_CONNECTIONS", "32"))
+AUTH_HTTP_MAX_KEEPALIVE = int(os.environ.get("AUTH_HTTP_MAX_KEEPALIVE", "16"))
+
+class AuthServiceError(Exception):
+    """The auth service could not be reached or kept failing after retries"""
+
+class AuthServiceClient:
+    """Async client for the Emergent session-data exchange.
+
+    One keep-alive connection pool is shared by all requests on the worker,
+    in-flight calls are capped by a semaphore, and transport errors / 5xx
+    responses are retried with exponential backoff within the retry budget.
+    """
+
+    def __init__(self, base_url: str = EMERGENT_AUTH_URL,
+                 timeout: float = AUTH_HTTP_TIMEOUT_SECONDS,
+                 retries: int = AUTH_HTTP_RETRIES,
+                 max_concurrency: int = AUTH_HTTP_MAX_CONCURRENCY,
+                 max_connections: int = AUTH_HTTP_MAX_CONNECTIONS,
+                 max_keepalive: int = AUTH_HTTP_MAX_KEEPALIVE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.max_concurrency = max_concurrency
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool and semaphore bind to the running loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self._limits,
+                transport=self._transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def fetch_session_data(self, session_id: str) -> Optional[dict]:
+        """Exchange a session_id for user data; None if the service rejects it"""
+        client = self._get_client()
+        headers = {"X-Session-ID": session_id}
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.get(self.base_url, headers=headers)
+            except httpx.HTTPError as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code < 500:
+                    return None
+                error = AuthServiceError(f"auth service returned {response.status_code}")
+
+            if attempt < self.retries:
+                logger.warning(f"Auth service call failed (attempt {attempt + 1}): {error}")
+                await asyncio.sleep(0.1 * (2 ** attempt))
+
+        raise AuthServiceError(str(error))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+auth_client = AuthServiceClient()
+
+async def get_auth_client() -> AuthServiceClient:
+    return auth_client
@@ -0,0 +1,346 @@
+"""Latency, throughput and MongoDB commands per request for every router.
+
+Seeds a dedicated database with benchmarks.dataset, then drives the app
+in-process through an ASGI client (no lifespan, so the trip reaper and
+event broker stay idle and every counted command belongs to a request).
+
+Run from the backend directory:
+
+    python -m benchmarks.api [--mongo-url mongodb://localhost:27017] [--output run.json]
+    python -m benchmarks.api --mock          # in-memory stand-in, needs mongomock_motor
+    python -m benchmarks.api --baseline old.json --output new.json
+
+The --db database is dropped and reseeded on every run. With --mock,
+commands are counted per collection call (an approximation: cursor
+getMores are not seen) and geo queries are skipped.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import threading
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from pymongo import monitoring
+
+class CommandCounter(monitoring.CommandListener):
+    """Commands started, by name; fed from the driver's threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands: Counter = Counter()
+
+    def count(self, command_name: str):
+        with self._lock:
+            self.commands[command_name] += 1
+
+    def started(self, event):
+        self.count(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.commands)
+
+# mongomock emits no command events; count the collection calls that map
+# onto one server command each instead
+MOCK_COMMANDS = {
+    "find": "find", "find_one": "find", "count_documents": "aggregate", "aggregate": "aggregate",
+    "insert_one": "insert", "insert_many": "insert", "bulk_write": "update",
+    "update_one": "update", "update_many": "update", "replace_one": "update",
+    "delete_one": "delete", "delete_many": "delete",
+    "find_one_and_update": "findAndModify", "find_one_and_delete": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+}
+
+def count_mock_commands(counter: CommandCounter):
+    from mongomock.collection import Collection
+    local = threading.local()
+
+    def counted(method, command):
+        def wrapper(self, *args, **kwargs):
+            # mongomock builds some calls on others (find_one -> find); count the outer one
+            if getattr(local, "inside", False):
+                return method(self, *args, **kwargs)
+            counter.count(command)
+            local.inside = True
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                local.inside = False
+        return wrapper
+
+    for name, command in MOCK_COMMANDS.items():
+        setattr(Collection, name, counted(getattr(Collection, name), command))
+
+class Scenario:
+    """One endpoint under test.
+
+    request(i) picks the trip (and child document) for the i-th request;
+    requests are spread round-robin over trips, then over each trip's
+    children, so writes and deletes never hit the same document twice
+    until a trip's children run out (limit caps the request count there).
+    """
+
+    def __init__(self, name: str, method: str, path: str, body: Optional[Callable] = None, status: int = 200,
+                 child: Optional[str] = None, token: str = "member", conditional: bool = False, geo: bool = False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.status = status
+        self.child = child
+        self.token = token
+        self.conditional = conditional
+        self.geo = geo
+
+    def limit(self, trips: List[dict]) -> Optional[int]:
+        """Most requests that keep hitting distinct documents, for deletes"""
+        if self.method != "DELETE":
+            return None
+        per_trip = min(len(trip[self.child]) for trip in trips) if self.child else 1
+        return len(trips) * per_trip
+
+    def request(self, trips: List[dict], expired_tokens: List[str], i: int) -> dict:
+        trip = trips[i % len(trips)]
+        rotation = i // len(trips)
+        doc = trip[self.child][rotation % len(trip[self.child])] if self.child else None
+        if self.token == "expired":
+            token = expired_tokens[i % len(expired_tokens)]
+        elif self.token == "owner":
+            token = trip["tokens"][0]
+        else:
+            token = trip["tokens"][rotation % len(trip["tokens"])]
+        lat, lng = trip["center"]
+        path = self.path.format(trip=trip["id"], doc=str(doc["_id"]) if doc else "", lat=lat, lng=lng,
+                                south=lat - 0.1, west=lng - 0.1, north=lat + 0.1, east=lng + 0.1)
+        return {
+            "method": self.method,
+            "url": path,
+            "headers": {"Authorization": f"Bearer {token}"},
+            "json": self.body(doc, i) if self.body else None,
+        }
+
+def _destination(doc: Optional[dict], i: int) -> dict:
+    base = doc or {"lat": 48.85, "lng": 2.35, "day": 1, "order": 0}
+    return {"name": f"Bench stop {i}", "address": "1 Bench Street", "lat": base["lat"], "lng": base["lng"],
+            "type": "attraction", "day": base["day"], "time": "10:00", "duration": 60, "order": base["order"]}
+
+def _flight(doc: Optional[dict], i: int) -> dict:
+    return {"airline": "Bench Air", "flightNumber": f"BB{i}", "from": "CDG", "to": "LHR",
+            "departTime": "09:00", "arriveTime": "10:15", "date": "2024-06-01T00:00:00Z", "price": 120.0}
+
+def _expense(doc: Optional[dict], i: int) -> dict:
+    return {"category": "food", "amount": 10.0 + i % 50, "description": f"Bench expense {i}", "date": "2024-06-01T00:00:00Z"}
+
+def _trip(doc: Optional[dict], i: int) -> dict:
+    return {"name": f"Bench trip {i}", "destination": "Bench City", "budget": 2500.0}
+
+SCENARIOS = [
+    Scenario("auth.me", "GET", "/api/auth/me"),
+    Scenario("auth.me.expired", "GET", "/api/auth/me", status=401, token="expired"),
+    Scenario("trips.list", "GET", "/api/trips"),
+    Scenario("trips.get", "GET", "/api/trips/{trip}"),
+    Scenario("trips.get.304", "GET", "/api/trips/{trip}", status=304, conditional=True),
+    Scenario("trips.bundle", "GET", "/api/trips/{trip}/bundle"),
+    Scenario("trips.create", "POST", "/api/trips", _trip),
+    Scenario("trips.update", "PUT", "/api/trips/{trip}", _trip),
+    Scenario("destinations.list", "GET", "/api/destinations/trip/{trip}"),
+    Scenario("destinations.list.304", "GET", "/api/destinations/trip/{trip}", status=304, conditional=True),
+    Scenario("destinations.timeline", "GET", "/api/destinations/trip/{trip}/timeline"),
+    Scenario("destinations.near", "GET", "/api/destinations/near?lat={lat}&lng={lng}&radius=5&tripId={trip}", geo=True),
+    Scenario("destinations.within", "GET", "/api/destinations/within?minLat={south}&minLng={west}&maxLat={north}&maxLng={east}&tripId={trip}", geo=True),
+    Scenario("destinations.create", "POST", "/api/destinations/trip/{trip}", _destination),
+    Scenario("destinations.update", "PUT", "/api/destinations/{doc}", _destination, child="destinations"),
+    Scenario("destinations.optimize", "POST", "/api/destinations/trip/{trip}/optimize", lambda doc, i: {}),
+    Scenario("flights.list", "GET", "/api/flights/trip/{trip}"),
+    Scenario("flights.create", "POST", "/api/flights/trip/{trip}", _flight),
+    Scenario("flights.update", "PUT", "/api/flights/{doc}", _flight, child="flights"),
+    Scenario("expenses.list", "GET", "/api/expenses/trip/{trip}"),
+    Scenario("expenses.summary", "GET", "/api/expenses/trip/{trip}/summary"),
+    Scenario("expenses.create", "POST", "/api/expenses/trip/{trip}", _expense),
+    Scenario("expenses.bulk", "POST", "/api/expenses/trip/{trip}/bulk",
+             lambda doc, i: {"operations": [{"op": "create", "data": _expense(None, i * 5 + k)} for k in range(5)]}),
+    Scenario("expenses.update", "PUT", "/api/expenses/{doc}", _expense, child="expenses"),
+    Scenario("expenses.delete", "DELETE", "/api/expenses/{doc}", child="expenses"),
+    Scenario("flights.delete", "DELETE", "/api/flights/{doc}", child="flights"),
+    Scenario("destinations.delete", "DELETE", "/api/destinations/{doc}", child="destinations"),
+    Scenario("trips.delete", "DELETE", "/api/trips/{trip}", token="owner"),
+]
+
+async def run_scenario(client, scenario: Scenario, data, counter: CommandCounter, requests: int, concurrency: int, warmup: int) -> dict:
+    limit = scenario.limit(data.trips)
+    if limit is not None:
+        requests, warmup = min(requests, limit), 0
+    calls = [scenario.request(data.trips, data.expired_tokens, i) for i in range(warmup + requests)]
+
+    if scenario.conditional:
+        # Learn each URL's current ETag so the timed requests revalidate
+        etags: Dict[tuple, str] = {}
+        for call in calls:
+            key = (call["url"], call["headers"]["Authorization"])
+            if key not in etags:
+                etags[key] = (await client.get(call["url"], headers=call["headers"])).headers.get("etag", "")
+            call["headers"]["If-None-Match"] = etags[key]
+
+    for call in calls[:warmup]:
+        await client.request(**call)
+    calls = calls[warmup:]
+
+    latencies = np.zeros(len(calls))
+    statuses: Counter = Counter()
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(calls):
+            index = position
+            position += 1
+            started = time.perf_counter()
+            response = await client.request(**calls[index])
+            latencies[index] = time.perf_counter() - started
+            statuses[response.status_code] += 1
+
+    before = counter.snapshot()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    commands = counter.snapshot() - before
+
+    p50, p95, p99 = np.percentile(latencies * 1e3, [50, 95, 99]) if len(calls) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(calls),
+        "errors": sum(count for status, count in statuses.items() if status != scenario.status),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughputRps": round(len(calls) / elapsed, 1) if elapsed else 0.0,
+        "meanMs": round(float(latencies.mean() * 1e3), 3) if len(calls) else 0.0,
+        "p50Ms": round(float(p50), 3),
+        "p95Ms": round(float(p95), 3),
+        "p99Ms": round(float(p99), 3),
+        "commandsPerRequest": round(sum(commands.values()) / len(calls), 2) if len(calls) else 0.0,
+        "commands": {name: round(count / len(calls), 2) for name, count in sorted(commands.items())} if len(calls) else {},
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]):
+    print(f"{'endpoint':<24} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cmds':>6} {'errors':>6}")
+    for name, result in results.items():
+        line = (f"{name:<24} {result['throughputRps']:>8.1f} {result['p50Ms']:>8.2f} {result['p95Ms']:>8.2f} "
+                f"{result['p99Ms']:>8.2f} {result['commandsPerRequest']:>6.1f} {result['errors']:>6}")
+        old = (baseline or {}).get(name)
+        if old and old["p50Ms"]:
+            line += f"   p50 {result['p50Ms'] / old['p50Ms']:5.2f}x  cmds {result['commandsPerRequest'] - old['commandsPerRequest']:+.1f}"
+        print(line)
+
+async def open_database(args, counter: Optional[CommandCounter] = None):
+    """Point database.py at an empty --db on --mongo-url, or at mongomock with --mock"""
+    import database
+
+    if args.mock:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--mock needs the mongomock_motor package")
+        if counter is not None:
+            count_mock_commands(counter)
+        database.client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        listeners = [database.pool_stats] + ([counter] if counter is not None else [])
+        database.client = AsyncIOMotorClient(args.mongo_url, event_listeners=listeners, **database.pool_options())
+        await database.client.drop_database(args.db)
+    database.db = database.client[args.db]
+    return database.db
+
+async def run(args) -> dict:
+    # Imported here so MONGO_URL/DB_NAME are set before database.py reads them
+    import database
+    from server import app
+    from indexes import ensure_indexes
+    from benchmarks.dataset import generate, load
+    import httpx
+
+    counter = CommandCounter()
+    db = await open_database(args, counter)
+
+    data = generate(args.seed, args.users, args.trips_per_user, args.collaborators,
+                    args.destinations, args.flights, args.expenses, args.expired_sessions)
+    await ensure_indexes(db)
+    await load(db, data)
+
+    selected = [s for s in SCENARIOS if not args.only or any(s.name.startswith(prefix) for prefix in args.only)]
+    results: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scenario in selected:
+            if scenario.geo and args.mock:
+                continue
+            results[scenario.name] = await run_scenario(client, scenario, data, counter, args.requests, args.concurrency, args.warmup)
+
+    database.close()
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "startedAt": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongomock" if args.mock else "mongod",
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "documents": data.counts(),
+        },
+        "endpoints": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="tripnext_bench", help="dropped and reseeded on every run")
+    parser.add_argument("--mock", action="store_true", help="use the in-memory mongomock_motor stand-in")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--trips-per-user", type=int, default=4)
+    parser.add_argument("--collaborators", type=int, default=2)
+    parser.add_argument("--destinations", type=int, default=30)
+    parser.add_argument("--flights", type=int, default=4)
+    parser.add_argument("--expenses", type=int, default=60)
+    parser.add_argument("--expired-sessions", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="+", help="endpoint name prefixes, e.g. trips expenses.summary")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", args.mongo_url)
+    os.environ.setdefault("DB_NAME", args.db)
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["endpoints"]
+    print_report(report["endpoints"], baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Seeded synthetic data for the API benchmarks.
+
+The same seed and sizes always produce the same documents (ids included),
+so runs against different versions of the code read identical data.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from geo import geo_point
+from trip_summary import schedule_entry
+
+CATEGORIES = ["food", "transport", "lodging", "activities", "shopping", "other"]
+PLACE_TYPES = ["attraction", "restaurant", "hotel", "museum", "park"]
+AIRPORTS = ["CDG", "LHR", "JFK", "NRT", "SIN", "DXB", "FRA", "AMS"]
+
+# Fixed epoch instead of "now" keeps the documents identical between runs;
+# session expiry is the exception, since it has to be relative to the run
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+class Dataset:
+    """Documents per collection plus the handles scenarios need to address them.
+
+    trips holds one entry per trip: its id, the tokens of its members
+    (owner first) and its child documents, so a request can be aimed at any
+    trip as any member.
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, List[dict]] = {name: [] for name in ("users", "sessions", "trips", "destinations", "flights", "expenses")}
+        self.trips: List[dict] = []
+        self.expired_tokens: List[str] = []
+
+    def counts(self) -> Dict[str, int]:
+        return {name: len(docs) for name, docs in self.docs.items()}
+
+def _object_id(rng: np.random.Generator) -> ObjectId:
+    return ObjectId(rng.bytes(12))
+
+def generate(seed: int = 7, users: int = 50, trips_per_user: int = 4, collaborators: int = 2,
+             destinations: int = 30, flights: int = 4, expenses: int = 60, expired_sessions: int = 50) -> Dataset:
+    """Build users with a live session each, their trips (with collaborators
+    drawn from the other users) and every trip's children"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    data = Dataset()
+
+    people = []
+    for i in range(users):
+        user_id = _object_id(rng)
+        user = {"_id": user_id, "email": f"user{i}@bench.example", "name": f"User {i}", "createdAt": EPOCH, "updatedAt": EPOCH}
+        data.docs["users"].append(user)
+        token = f"bench-live-{seed}-{i}"
+        data.docs["sessions"].append({"userId": str(user_id), "sessionToken": token, "expiresAt": now + timedelta(days=7), "createdAt": EPOCH})
+        people.append((user, token))
+
+    for i in range(expired_sessions):
+        user, _ = people[i % users]
+        token = f"bench-expired-{seed}-{i}"
+        data.docs["sessions"].append({"userId": str(user["_id"]), "sessionToken": token, "expiresAt": now - timedelta(days=1), "createdAt": EPOCH})
+        data.expired_tokens.append(token)
+
+    for owner_index, (owner, owner_token) in enumerate(people):
+        for t in range(trips_per_user):
+            others = [j for j in range(users) if j != owner_index]
+            picked = rng.choice(others, size=min(collaborators, len(others)), replace=False) if others else []
+            members = [(owner, owner_token, "owner")] + [(*people[j], "editor") for j in picked]
+
+            trip_id = _object_id(rng)
+            trip_key = str(trip_id)
+            start = EPOCH + timedelta(days=int(rng.integers(0, 365)))
+            days = max(1, destinations // 6)
+            # Each trip happens around its own city
+            center_lat, center_lng = rng.uniform(-60, 60), rng.uniform(-170, 170)
+
+            trip_destinations = []
+            for d in range(destinations):
+                lat = float(center_lat + rng.normal(0, 0.05))
+                lng = float(center_lng + rng.normal(0, 0.05))
+                trip_destinations.append({
+                    "_id": _object_id(rng), "tripId": trip_key, "name": f"Stop {d}", "address": f"{d} Bench Street",
+                    "lat": lat, "lng": lng, "location": geo_point(lat, lng),
+                    "type": PLACE_TYPES[int(rng.integers(len(PLACE_TYPES)))], "day": d % days + 1,
+                    "time": f"{8 + int(rng.integers(0, 12)):02d}:{int(rng.choice([0, 15, 30, 45])):02d}",
+                    "notes": None, "duration": int(rng.choice([30, 60, 90, 120])), "order": d // days,
+                    "createdAt": EPOCH, "updatedAt": EPOCH,
+                })
+
+            trip_flights = []
+            for f in range(flights):
+                origin, destination = rng.choice(AIRPORTS, size=2, replace=False)
+                trip_flights.append({
+                    "_id": _object_id(rng), "tripId": trip_key, "airline": "Bench Air", "flightNumber": f"BA{100 + f}",
+                    "from_": str(origin), "to": str(destination), "departTime": "09:00", "arriveTime": "13:30",
+                    "date": start + timedelta(days=f), "price": round(float(rng.uniform(80, 900)), 2), "status": "Confirmed",
+                    "createdAt": EPOCH, "updatedAt": EPOCH,
+                })
+
+            trip_expenses = []
+            for e in range(expenses):
+                payer = members[int(rng.integers(len(members)))][0]
+                trip_expenses.append({
+                    "_id": _object_id(rng), "tripId": trip_key, "category": CATEGORIES[int(rng.integers(len(CATEGORIES)))],
+                    "amount": round(float(rng.uniform(2, 250)), 2), "description": f"Expense {e}",
+                    "date": start + timedelta(days=int(rng.integers(0, days))), "paidBy": str(payer["_id"]),
+                    "createdAt": EPOCH, "updatedAt": EPOCH,
+                })
+
+            data.docs["trips"].append({
+                "_id": trip_id, "userId": str(owner["_id"]), "name": f"Trip {owner_index}-{t}", "destination": "Bench City",
+                "startDate": start, "endDate": start + timedelta(days=days), "coverImage": None,
+                "budget": 5000.0, "spent": round(sum(e["amount"] for e in trip_expenses), 2), "version": 0,
+                "summary": {"destinations": len(trip_destinations), "flights": len(trip_flights), "expenses": len(trip_expenses)},
+                "flightSchedule": {str(f["_id"]): schedule_entry(f) for f in trip_flights},
+                "collaborators": [
+                    {"userId": str(user["_id"]), "email": user["email"], "name": user["name"], "avatar": None, "role": role}
+                    for user, _, role in members
+                ],
+                "createdAt": EPOCH, "updatedAt": EPOCH,
+            })
+            data.docs["destinations"] += trip_destinations
+            data.docs["flights"] += trip_flights
+            data.docs["expenses"] += trip_expenses
+            data.trips.append({
+                "id": trip_key,
+                "tokens": [token for _, token, _ in members],
+                "center": (float(center_lat), float(center_lng)),
+                "destinations": trip_destinations,
+                "flights": trip_flights,
+                "expenses": trip_expenses,
+            })
+
+    return data
+
+async def load(db: AsyncIOMotorDatabase, data: Dataset, batch_size: int = 1000):
+    """Insert every generated document (collections are expected to be empty)"""
+    for name, docs in data.docs.items():
+        for start in range(0, len(docs), batch_size):
+            await db[name].insert_many([dict(doc) for doc in docs[start:start + batch_size]], ordered=False)
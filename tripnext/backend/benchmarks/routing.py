@@ -0,0 +1,46 @@
+"""Route optimizer cost and quality for one day's worth of stops.
+
+Run from the backend directory: python -m benchmarks.routing [--stops 10 50 200 500]
+"""
+import time
+import argparse
+from typing import Callable
+import numpy as np
+from routing import haversine_matrix, route_length, solve_route
+
+def city_stops(count: int, seed: int):
+    # Scattered over roughly 20 x 20 km, like a city itinerary
+    rng = np.random.default_rng(seed)
+    return 48.80 + rng.random(count) * 0.18, 2.25 + rng.random(count) * 0.27
+
+def best_ms(run: Callable, repeat: int) -> float:
+    run()  # warm up
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best * 1e3
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stops", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for count in args.stops:
+        lat, lng = city_stops(count, args.seed)
+        dist = haversine_matrix(lat, lng)
+        matrix_ms = best_ms(lambda: haversine_matrix(lat, lng), args.repeat)
+        solve_ms = best_ms(lambda: solve_route(dist), args.repeat)
+        pinned_ms = best_ms(lambda: solve_route(dist, 0, count - 1), args.repeat)
+
+        # Insertion order stands in for an unplanned manual itinerary
+        before = route_length(dist, range(count))
+        after = route_length(dist, solve_route(dist))
+        print(f"{count:>5} stops  matrix {matrix_ms:7.2f} ms  solve {solve_ms:7.2f} ms  "
+              f"pinned {pinned_ms:7.2f} ms  {before:8.1f} -> {after:6.1f} km")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Per-row cost of the list read path, before and after the lean serializer.
+
+Run from the backend directory: python -m benchmarks.serialization [--rows N]
+"""
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import Callable, List
+from bson import ObjectId
+from pydantic import TypeAdapter
+from models import Destination, Expense
+from serialization import list_adapter
+
+def destination_docs(rows: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [{
+        "_id": ObjectId(),
+        "tripId": "0" * 24,
+        "name": f"Stop {i}",
+        "address": f"{i} Main Street",
+        "lat": 48.85 + i * 1e-4,
+        "lng": 2.35 + i * 1e-4,
+        "type": "attraction",
+        "day": i // 10 + 1,
+        "time": "10:00 AM",
+        "notes": "Bring a camera",
+        "duration": 90,
+        "order": i % 10,
+        "createdAt": now,
+        "updatedAt": now,
+    } for i in range(rows)]
+
+def expense_docs(rows: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [{
+        "_id": ObjectId(),
+        "tripId": "0" * 24,
+        "category": "food",
+        "amount": 12.5 + i,
+        "description": f"Meal {i}",
+        "date": now,
+        "createdAt": now,
+        "updatedAt": now,
+    } for i in range(rows)]
+
+def legacy_path(model, docs: List[dict]) -> bytes:
+    # Handler builds models, then FastAPI dumps them, validates against
+    # response_model again and encodes with json.dumps (JSONResponse)
+    items = []
+    for doc in docs:
+        doc = dict(doc)
+        doc["id"] = str(doc["_id"])
+        items.append(model(**doc))
+    adapter = TypeAdapter(List[model])
+    dumped = [item.model_dump(by_alias=True) for item in items]
+    validated = adapter.validate_python(dumped)
+    content = adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+def lean_path(model, docs: List[dict]) -> bytes:
+    items = [model(**dict(doc)) for doc in docs]
+    return list_adapter(model).dump_json(items, by_alias=True)
+
+def measure(path: Callable, model, docs: List[dict], repeat: int) -> float:
+    path(model, docs)  # warm up adapters
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        path(model, docs)
+        best = min(best, time.perf_counter() - started)
+    return best / len(docs) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, model, docs in [
+        ("destinations", Destination, destination_docs(args.rows)),
+        ("expenses", Expense, expense_docs(args.rows)),
+    ]:
+        legacy = measure(legacy_path, model, docs, args.repeat)
+        lean = measure(lean_path, model, docs, args.repeat)
+        print(f"{name:<13} legacy {legacy:7.2f} us/row   lean {lean:7.2f} us/row   {legacy / lean:4.1f}x")
+
+if __name__ == "__main__":
+    main()
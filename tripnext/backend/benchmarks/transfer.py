@@ -0,0 +1,151 @@
+"""Streaming export and import on one synthetic trip with ~100k child rows.
+
+Seeds a single trip, then for each format times the export generator
+(draining it to a temporary file) and, for JSON lines and CSV, the import
+reading that file back in 64 KiB chunks into a fresh trip. A second pass
+under tracemalloc reports peak Python memory; the buffered baseline loads
+every child page at once, which is what the streaming path avoids.
+
+Run from the backend directory:
+
+    python -m benchmarks.transfer [--mongo-url mongodb://localhost:27017]
+    python -m benchmarks.transfer --mock --destinations 6000 --flights 100 --expenses 3900
+
+Peak memory should not grow with --destinations/--expenses against mongod.
+With --mock it does: mongomock materializes and sorts each whole result
+set itself, so only the timings are meaningful there.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+READ_CHUNK_BYTES = 64 * 1024
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+async def measure(step: Callable[[], Awaitable[dict]], trace: bool) -> Tuple[float, dict, Optional[int]]:
+    """Seconds, the step's own figures and, when traced, peak allocated bytes"""
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = await step()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return elapsed, result, peak
+
+async def run(args):
+    # Imported here so MONGO_URL/DB_NAME are set before database.py reads them
+    import database
+    from bson import ObjectId
+    from indexes import ensure_indexes
+    from benchmarks.api import open_database
+    from benchmarks.dataset import generate, load
+    from destinations import list_destinations
+    from flights import list_flights
+    from expenses import list_expenses
+    from serialization import list_adapter
+    from models import Destination, Expense, Flight
+    from trips import TRIP_PROJECTION, trip_from_doc
+    from transfer import EXPORT_FORMATS, IMPORT_FORMATS, export_chunks, import_rows
+
+    db = await open_database(args)
+    data = generate(args.seed, users=1, trips_per_user=1, collaborators=0, destinations=args.destinations,
+                    flights=args.flights, expenses=args.expenses, expired_sessions=0)
+    await ensure_indexes(db)
+    await load(db, data)
+    source = data.trips[0]["id"]
+    owner = str(data.docs["users"][0]["_id"])
+    rows = sum(len(data.trips[0][kind]) for kind in ("destinations", "flights", "expenses"))
+    trip = trip_from_doc(await db.trips.find_one({"_id": ObjectId(source)}, TRIP_PROJECTION))
+    del data
+
+    async def buffered() -> dict:
+        pages = await asyncio.gather(list_destinations(db, source), list_flights(db, source), list_expenses(db, source))
+        size = sum(len(list_adapter(model).dump_json(items, by_alias=True)) for model, (items, _) in zip((Destination, Flight, Expense), pages))
+        return {"bytes": size}
+
+    def exporter(format: str, path: str) -> Callable[[], Awaitable[dict]]:
+        async def step() -> dict:
+            size = chunks = 0
+            with open(path, "wb") as out:
+                async for chunk in export_chunks(db, trip, format):
+                    out.write(chunk)
+                    size += len(chunk)
+                    chunks += 1
+            return {"bytes": size, "chunks": chunks}
+        return step
+
+    def importer(format: str, path: str) -> Callable[[], Awaitable[dict]]:
+        async def step() -> dict:
+            target = str((await db.trips.insert_one({"userId": owner, "name": "Import", "destination": "Bench City", "version": 0})).inserted_id)
+            result = await import_rows(db, target, owner, read_file(path), format)
+            # Leave the source trip as the only one, so every pass sees the same data
+            for collection in ("destinations", "flights", "expenses"):
+                await db[collection].delete_many({"tripId": target})
+            await db.trips.delete_one({"_id": ObjectId(target)})
+            return {"inserted": sum(result.inserted.model_dump().values()), "rejected": result.rejected}
+        return step
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        files = {format: os.path.join(workdir, f"trip.{format}") for format in EXPORT_FORMATS}
+        steps = [("buffered baseline", buffered)]
+        steps += [(f"export {format}", exporter(format, path)) for format, path in files.items()]
+        steps += [(f"import {format}", importer(format, files[format])) for format in IMPORT_FORMATS]
+
+        for name, step in steps:
+            elapsed, figures, _ = await measure(step, trace=False)
+            results[name] = {"seconds": elapsed, **figures}
+        if not args.no_memory:
+            for name, step in steps:
+                _, _, peak = await measure(step, trace=True)
+                results[name]["peakBytes"] = peak
+
+    database.close()
+    return rows, results
+
+def print_report(rows: int, results: Dict[str, dict]):
+    print(f"{rows} rows in one trip")
+    print(f"{'step':<18} {'seconds':>8} {'rows/s':>9} {'MiB out':>8} {'peak MiB':>9}")
+    for name, figures in results.items():
+        size = f"{figures['bytes'] / 2**20:.1f}" if "bytes" in figures else "-"
+        peak = f"{figures['peakBytes'] / 2**20:.1f}" if "peakBytes" in figures else "-"
+        print(
+            f"{name:<18} {figures['seconds']:8.2f} {rows / figures['seconds']:9.0f} {size:>8} {peak:>9}"
+            + (f"   inserted {figures['inserted']}, rejected {figures['rejected']}" if "inserted" in figures else "")
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="tripnext_bench_transfer", help="dropped and reseeded on every run")
+    parser.add_argument("--mock", action="store_true", help="use the in-memory mongomock_motor stand-in")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--destinations", type=int, default=60000)
+    parser.add_argument("--flights", type=int, default=1000)
+    parser.add_argument("--expenses", type=int, default=39000)
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slower) tracemalloc pass")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", args.mongo_url)
+    os.environ.setdefault("DB_NAME", args.db)
+
+    rows, results = asyncio.run(run(args))
+    print_report(rows, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from motor.motor_asyncio import AsyncIOMotorCollection
+from models import BulkItemResult, BulkResponse
+
+MAX_BULK_OPERATIONS = 1000
+# Set by a batch on the targets its guarded writes matched; removed before run_bulk returns
+BULK_TAG_FIELD = "_bulkTag"
+
+class BulkOutcome:
+    """Per-item results plus what was applied, for updating derived fields"""
+
+    def __init__(self, results: List[BulkItemResult], applied: List[Tuple[str, Optional[dict], Optional[dict]]]):
+        self.results = results
+        # (op, document before the write or None, fields written or None)
+        self.applied = applied
+
+    def applied_ids(self) -> List[str]:
+        return [str(fields["_id"]) if op == "create" else str(before["_id"]) for op, before, fields in self.applied]
+
+    def count_delta(self) -> int:
+        """Net change in the number of documents"""
+        return sum(1 if op == "create" else -1 if op == "delete" else 0 for op, _, _ in self.applied)
+
+    def response(self) -> BulkResponse:
+        counts = {"create": 0, "update": 0, "delete": 0}
+        for op, _, _ in self.applied:
+            counts[op] += 1
+        return BulkResponse(
+            ok=all(r.status == "ok" for r in self.results),
+            inserted=counts["create"],
+            updated=counts["update"],
+            deleted=counts["delete"],
+            results=self.results
+        )
+
+def validate_operations(operations: Sequence) -> None:
+    """Reject the whole batch before any write if an operation is malformed"""
+    if len(operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations per batch")
+
+    errors = []
+    for index, operation in enumerate(operations):
+        if operation.op in ("update", "delete") and not (operation.id and ObjectId.is_valid(operation.id)):
+            errors.append(f"{index}: valid id required for {operation.op}")
+        if operation.op in ("create", "update") and operation.data is None:
+            errors.append(f"{index}: data required for {operation.op}")
+    if errors:
+        raise HTTPException(status_code=400, detail="Invalid batch: " + "; ".join(errors))
+
+async def run_bulk(
+    collection: AsyncIOMotorCollection,
+    trip_id: str,
+    operations: Sequence,
+    ordered: bool = True,
+    pre_image_fields: Sequence[str] = (),
+    prepare: Optional[Callable[[dict], dict]] = None,
+) -> BulkOutcome:
+    """Apply create/update/delete operations on a trip's children.
+
+    Creates go out together in one insert_many. Updates and deletes read
+    their targets' pre-images in one find, then write in one bulk_write
+    with each op guarded by its pre-image (updatedAt plus pre_image_fields),
+    so callers diff against what was really replaced. An op whose target
+    changed in between does not match; only those are retried one by one
+    with find_one_and_*, and a target that is gone gets a per-item Not found.
+    With ordered=True runs of creates and of updates/deletes are applied in
+    sequence and processing stops at the first failure, later items are
+    skipped (a target that vanishes between the read and the bulk_write
+    is only noticed after the rest of its run was written).
+    prepare, if given, may add derived fields to each insert document and $set.
+    """
+    validate_operations(operations)
+    # Stored datetimes have millisecond precision; the guards compare against this
+    now = datetime.now(timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    projection = {"_id": 1, "updatedAt": 1, **{field: 1 for field in pre_image_fields}}
+
+    results: List[Optional[BulkItemResult]] = [None] * len(operations)
+    applied: Dict[int, Tuple[str, Optional[dict], Optional[dict]]] = {}
+
+    def fail(index: int, error: str):
+        operation = operations[index]
+        results[index] = BulkItemResult(index=index, op=operation.op, status="error", id=operation.id, error=error)
+
+    def succeed(index: int, before: dict, fields: Optional[dict]):
+        operation = operations[index]
+        results[index] = BulkItemResult(index=index, op=operation.op, status="ok", id=operation.id)
+        applied[index] = (operation.op, before, fields)
+
+    def update_fields(index: int) -> dict:
+        fields = operations[index].data.dict(exclude_unset=True)
+        fields["updatedAt"] = now
+        return prepare(fields) if prepare else fields
+
+    async def insert(indexes: List[int]) -> bool:
+        docs = []
+        for index in indexes:
+            doc = operations[index].data.dict()
+            doc["_id"] = ObjectId()
+            doc["tripId"] = trip_id
+            doc["createdAt"] = now
+            doc["updatedAt"] = now
+            docs.append(prepare(doc) if prepare else doc)
+
+        write_errors = {}
+        try:
+            await collection.insert_many(docs, ordered=ordered)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+
+        first_error = min(write_errors) if write_errors and ordered else None
+        for position, (index, doc) in enumerate(zip(indexes, docs)):
+            if position in write_errors:
+                results[index] = BulkItemResult(index=index, op="create", status="error", id=str(doc["_id"]), error=write_errors[position])
+            elif first_error is not None and position > first_error:
+                results[index] = BulkItemResult(index=index, op="create", status="skipped", id=str(doc["_id"]))
+            else:
+                results[index] = BulkItemResult(index=index, op="create", status="ok", id=str(doc["_id"]))
+                applied[index] = ("create", None, doc)
+        return not write_errors
+
+    async def modify(index: int) -> bool:
+        """One update or delete on whatever the target is now"""
+        operation = operations[index]
+        query = {"_id": ObjectId(operation.id), "tripId": trip_id}
+        fields = None
+        try:
+            if operation.op == "update":
+                fields = update_fields(index)
+                before = await collection.find_one_and_update(query, {"$set": fields}, projection=projection)
+            else:
+                before = await collection.find_one_and_delete(query, projection=projection)
+        except OperationFailure as e:
+            fail(index, (e.details or {}).get("errmsg", "Write failed"))
+            return False
+
+        if before is None:
+            fail(index, "Not found")
+            return False
+        succeed(index, before, fields)
+        return True
+
+    async def modify_many(indexes: List[int]) -> bool:
+        """Updates and deletes as one guarded bulk_write, retrying the ops that did not match"""
+        ids = {ObjectId(operations[index].id) for index in indexes}
+        pre_images = {doc["_id"]: doc async for doc in collection.find({"_id": {"$in": list(ids)}, "tripId": trip_id}, projection)}
+
+        batch: List[Tuple[int, dict, Optional[dict]]] = []
+        retries: List[int] = []
+        seen = set()
+        succeeded = True
+        for index in indexes:
+            oid = ObjectId(operations[index].id)
+            if oid not in pre_images:
+                fail(index, "Not found")
+                succeeded = False
+                if ordered:
+                    # Nothing after the first failure may be written
+                    break
+            elif oid in seen:
+                # A second op on one target only makes sense against the first op's result
+                retries.append(index)
+            else:
+                seen.add(oid)
+                batch.append((index, pre_images[oid], update_fields(index) if operations[index].op == "update" else None))
+
+        if batch:
+            tag = ObjectId()
+            writes = []
+            for index, before, fields in batch:
+                guard = {"_id": before["_id"], "tripId": trip_id, "updatedAt": before.get("updatedAt"),
+                         **{field: before.get(field) for field in pre_image_fields}}
+                # Deletes are claimed here and removed below, so the tag says exactly which ones matched
+                writes.append(UpdateOne(guard, {"$set": {**(fields or {"updatedAt": now}), BULK_TAG_FIELD: tag}}))
+
+            errors: Dict[int, str] = {}
+            try:
+                matched = (await collection.bulk_write(writes, ordered=False)).matched_count
+            except BulkWriteError as e:
+                errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+                matched = e.details.get("nMatched", 0)
+
+            if matched == len(batch) - len(errors):
+                tagged = {before["_id"] for position, (_, before, _) in enumerate(batch) if position not in errors}
+            else:
+                tagged = {doc["_id"] async for doc in collection.find({"_id": {"$in": [before["_id"] for _, before, _ in batch]}, BULK_TAG_FIELD: tag}, {"_id": 1})}
+
+            claimed = [before["_id"] for index, before, _ in batch if before["_id"] in tagged and operations[index].op == "delete"]
+            updated = [before["_id"] for index, before, _ in batch if before["_id"] in tagged and operations[index].op == "update"]
+            if claimed:
+                await collection.delete_many({"_id": {"$in": claimed}, BULK_TAG_FIELD: tag})
+            if updated:
+                await collection.update_many({"_id": {"$in": updated}, BULK_TAG_FIELD: tag}, {"$unset": {BULK_TAG_FIELD: ""}})
+
+            for position, (index, before, fields) in enumerate(batch):
+                if position in errors:
+                    fail(index, errors[position])
+                    succeeded = False
+                elif before["_id"] in tagged:
+                    succeed(index, before, fields)
+                else:
+                    retries.append(index)
+
+        for index in sorted(retries):
+            if not await modify(index):
+                succeeded = False
+                if ordered:
+                    break
+        return succeeded
+
+    if ordered:
+        position = 0
+        while position < len(operations):
+            creating = operations[position].op == "create"
+            end = position
+            while end < len(operations) and (operations[end].op == "create") == creating:
+                end += 1
+            run = list(range(position, end))
+            succeeded = await (insert(run) if creating else modify_many(run))
+            position = end
+            if not succeeded:
+                break
+    else:
+        creates = [index for index, operation in enumerate(operations) if operation.op == "create"]
+        changes = [index for index, operation in enumerate(operations) if operation.op != "create"]
+        await asyncio.gather(*([insert(creates)] if creates else []), *([modify_many(changes)] if changes else []))
+
+    for index, operation in enumerate(operations):
+        if results[index] is None:
+            results[index] = BulkItemResult(index=index, op=operation.op, status="skipped", id=operation.id)
+
+    return BulkOutcome(results, [applied[index] for index in sorted(applied)])
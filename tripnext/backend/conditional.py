@@ -0,0 +1,56 @@
+import hashlib
+from typing import Dict, Iterable, Optional
+from fastapi import HTTPException, Request, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from access import live_trip_query
+from pagination import wants_ndjson
+
+# Browsers keep the body but must revalidate it (If-None-Match) before reuse
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(request: Request, *state) -> str:
+    """Strong ETag for this URL and representation at the given data state"""
+    variant = (request.url.path, sorted(request.query_params.multi_items()), wants_ndjson(request))
+    digest = hashlib.blake2b(repr((variant, state)).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def etag_headers(etag: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    return {**(headers or {}), "ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    candidates = (tag.strip().removeprefix("W/") for tag in header.split(","))
+    return etag in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
+
+async def live_trip(db: AsyncIOMotorDatabase, trip_id: str, projection: dict) -> dict:
+    """The trip's projected fields; 404 once it is deleted"""
+    trip = await db.trips.find_one(live_trip_query(trip_id), projection)
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip
+
+async def trip_version(db: AsyncIOMotorDatabase, trip_id: str) -> int:
+    """Projected version lookup; every write to a trip or its children bumps it"""
+    trip = await live_trip(db, trip_id, {"version": 1})
+    return trip.get("version", 0)
+
+async def trip_etag(db: AsyncIOMotorDatabase, trip_id: str, request: Request) -> str:
+    """ETag of a trip-scoped read.
+
+    Call it before loading the data: if a write lands in between, the
+    response carries an older tag than its content, which only costs a
+    later full response, never a wrong 304.
+    """
+    return make_etag(request, trip_id, await trip_version(db, trip_id))
+
+def trips_state(trips: Iterable[dict]) -> list:
+    """(id, version) of every trip in a listing, as ETag state"""
+    return [(str(trip["_id"]), trip.get("version", 0)) for trip in trips]
@@ -1,14 +1,138 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from typing import Optional
 import os
+import time
+import threading
 from dotenv import load_dotenv
+from metrics import command_metrics
 
 load_dotenv()
 
 mongo_url = os.environ['MONGO_URL']
 db_name = os.environ['DB_NAME']
 
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Pool tuning; unset variables keep the driver defaults
+POOL_SETTINGS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "compressors": ("MONGO_COMPRESSORS", str),
+}
+
+def pool_options() -> dict:
+    options = {}
+    for option, (env_var, cast) in POOL_SETTINGS.items():
+        value = os.environ.get(env_var)
+        if value:
+            options[option] = cast(value)
+    return options
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters, fed by pymongo's CMAP events.
+
+    Events arrive on the driver's executor threads, so updates take a lock.
+    Checkout wait is measured between CheckOutStarted and CheckedOut/Failed,
+    which pymongo emits on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.waiting = 0
+
+    def _end_wait(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        waited = time.perf_counter() - started if started is not None else 0.0
+        self.waiting -= 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._end_wait()
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._end_wait()
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.open,
+                "checkedOut": self.checked_out,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "checkoutFailures": self.checkout_failures,
+                "waitSecondsTotal": self.wait_seconds_total,
+                "waitSecondsMax": self.wait_seconds_max,
+                "waitSecondsAvg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+pool_stats = PoolStats()
+
+client: Optional[AsyncIOMotorClient] = None
+db: Optional[AsyncIOMotorDatabase] = None
+
+def connect() -> AsyncIOMotorDatabase:
+    """Create the process-wide client; called from the app lifespan"""
+    global client, db
+    if client is None:
+        client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_stats, command_metrics], **pool_options())
+        db = client[db_name]
+    return db
+
+def close():
+    global client, db
+    if client is not None:
+        client.close()
+        client = None
+        db = None
 
 async def get_database() -> AsyncIOMotorDatabase:
-    return db
\ No newline at end of file
+    # Scripts (manage.py) run without the lifespan, so connect on first use
+    return db if db is not None else connect()
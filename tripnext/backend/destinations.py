@@ -1,47 +1,172 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+import os
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import Dict, List, Optional, Tuple
+import asyncio
 from datetime import datetime, timezone
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import Destination, DestinationCreate, User
+from pymongo import ReturnDocument, UpdateOne
+from models import (
+    Destination, DestinationCreate, DestinationBulkRequest, DestinationOrderRequest,
+    DestinationOrderResponse, DestinationOptimizeDay, DestinationOptimizeDayResult, DestinationOptimizeRequest,
+    DestinationOptimizeResponse, TimelineResponse, BulkResponse, User
+)
 from auth import get_current_user
 from database import get_database
+from pagination import MAX_PAGE_SIZE, fetch_page, next_cursor_headers, stream_ndjson, wants_ndjson
+from serialization import model_list_response, model_response, projection_for
+from bulk import run_bulk
+from revisions import bump_trip_version
+from reaper import bump_child_version
+from access import TTLCache, accessible_trip_ids, check_trip_access, write_trip_child
+from geo import LOCATION_FIELD, box_filter, near_filter, set_location
+from routing import haversine_matrix, route_length, solve_route
+from timeline import SPEED_MODELS, build_timeline
+from events import publish_change
+from trip_summary import count_inc
+from conditional import etag_headers, is_not_modified, make_etag, not_modified, trip_etag, trip_version
 
 destinations_router = APIRouter(prefix="/destinations", tags=["destinations"])
 
-async def check_trip_access(trip_id: str, user_id: str, db: AsyncIOMotorDatabase):
-    """Check if user has access to trip"""
-    try:
-        trip = await db.trips.find_one({"_id": ObjectId(trip_id)})
-    except:
-        trip = await db.trips.find_one({"_id": trip_id})
-    
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    has_access = trip["userId"] == user_id or any(
-        c["userId"] == user_id for c in trip.get("collaborators", [])
+DESTINATION_PROJECTION = projection_for(Destination)
+DESTINATION_SORT = [("day", 1), ("order", 1), ("_id", 1)]
+
+# Just what the route optimizer reads
+ROUTE_PROJECTION = {"day": 1, "order": 1, "lat": 1, "lng": 1}
+TIMELINE_PROJECTION = {"name": 1, "day": 1, "time": 1, "duration": 1, "order": 1, "lat": 1, "lng": 1}
+
+TIMELINE_CACHE_TTL_SECONDS = float(os.environ.get("TIMELINE_CACHE_TTL_SECONDS", "300"))
+TIMELINE_CACHE_MAX_ENTRIES = int(os.environ.get("TIMELINE_CACHE_MAX_ENTRIES", "1000"))
+
+# (trip id, trip version, speed mode) -> TimelineResponse. Destination
+# writes bump the version, so old entries are simply never read again.
+timeline_cache = TTLCache(TIMELINE_CACHE_MAX_ENTRIES, TIMELINE_CACHE_TTL_SECONDS)
+
+def destination_from_doc(dest: dict) -> Destination:
+    return Destination(**dest)
+
+async def backfill_locations(db: AsyncIOMotorDatabase) -> int:
+    """Add the GeoJSON location to destinations saved before it existed; returns documents updated"""
+    result = await db.destinations.update_many(
+        {
+            LOCATION_FIELD: {"$exists": False},
+            "lat": {"$gte": -90, "$lte": 90},
+            "lng": {"$gte": -180, "$lte": 180}
+        },
+        [{"$set": {LOCATION_FIELD: {"type": "Point", "coordinates": ["$lng", "$lat"]}}}]
     )
-    if not has_access:
-        raise HTTPException(status_code=403, detail="Access denied")
+    return result.modified_count
+
+async def map_scope(db: AsyncIOMotorDatabase, user_id: str, trip_id: Optional[str]) -> dict:
+    """tripId filter for map queries: one trip, or every trip the user can see"""
+    if trip_id:
+        await check_trip_access(trip_id, user_id, db)
+        return {"tripId": trip_id}
+    return {"tripId": {"$in": await accessible_trip_ids(db, user_id)}}
+
+async def list_destinations(
+    db: AsyncIOMotorDatabase,
+    trip_id: str,
+    limit: Optional[int] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Destination], Optional[str]]:
+    """Load a page of a trip's destinations in itinerary order"""
+    destinations, next_cursor = await fetch_page(db.destinations, {"tripId": trip_id}, DESTINATION_SORT, limit, after, DESTINATION_PROJECTION)
     
-    return trip
+    return [destination_from_doc(dest) for dest in destinations], next_cursor
 
 @destinations_router.get("/trip/{trip_id}", response_model=List[Destination])
 async def get_destinations(
     trip_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get destinations for a trip, paged by limit/after or streamed as NDJSON"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    
+    # An unchanged poll costs one projected version lookup
+    etag = await trip_etag(db, trip_id, request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    if wants_ndjson(request):
+        response = stream_ndjson(db.destinations, {"tripId": trip_id}, DESTINATION_SORT, destination_from_doc, limit, after, DESTINATION_PROJECTION)
+        response.headers.update(etag_headers(etag))
+        return response
+    
+    destinations, next_cursor = await list_destinations(db, trip_id, limit, after)
+    
+    return model_list_response(Destination, destinations, etag_headers(etag, next_cursor_headers(next_cursor)))
+
+@destinations_router.get("/near", response_model=List[Destination])
+async def get_destinations_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=20000, description="Radius in km"),
+    tripId: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Destinations within radius km of a point, nearest first, in one trip or all of the user's trips"""
+    query = await map_scope(db, str(current_user.id), tripId)
+    query.update(near_filter(lat, lng, radius))
+    
+    destinations = await db.destinations.find(query, DESTINATION_PROJECTION).limit(limit).to_list(limit)
+    
+    return model_list_response(Destination, [destination_from_doc(dest) for dest in destinations])
+
+@destinations_router.get("/within", response_model=List[Destination])
+async def get_destinations_within(
+    minLat: float = Query(..., ge=-90, le=90),
+    minLng: float = Query(..., ge=-180, le=180),
+    maxLat: float = Query(..., ge=-90, le=90),
+    maxLng: float = Query(..., ge=-180, le=180),
+    tripId: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Destinations inside a map viewport, in one trip or all of the user's trips"""
+    if minLat > maxLat:
+        raise HTTPException(status_code=400, detail="minLat must not exceed maxLat")
+    
+    query = await map_scope(db, str(current_user.id), tripId)
+    query.update(box_filter(minLat, minLng, maxLat, maxLng))
+    
+    destinations = await db.destinations.find(query, DESTINATION_PROJECTION).limit(limit).to_list(limit)
+    
+    return model_list_response(Destination, [destination_from_doc(dest) for dest in destinations])
+
+@destinations_router.get("/trip/{trip_id}/timeline", response_model=TimelineResponse)
+async def get_timeline(
+    trip_id: str,
+    request: Request,
+    mode: str = Query("auto", description="Speed model: " + ", ".join(SPEED_MODELS)),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all destinations for a trip"""
+    """Per-day schedule with travel times between stops and overlap/reachability flags"""
+    if mode not in SPEED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    
     await check_trip_access(trip_id, str(current_user.id), db)
     
-    destinations = await db.destinations.find({"tripId": trip_id}).sort("day", 1).sort("order", 1).to_list(1000)
+    key = (trip_id, await trip_version(db, trip_id), mode)
+    etag = make_etag(request, *key)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
     
-    for dest in destinations:
-        dest["id"] = str(dest["_id"])
+    timeline = timeline_cache.get(key)
+    if timeline is None:
+        stops = await db.destinations.find({"tripId": trip_id}, TIMELINE_PROJECTION).to_list(None)
+        timeline = TimelineResponse(tripId=trip_id, version=key[1], mode=mode, days=build_timeline(stops, SPEED_MODELS[mode]))
+        timeline_cache.set(key, timeline)
     
-    return [Destination(**dest) for dest in destinations]
+    return model_response(timeline, etag_headers(etag))
 
 @destinations_router.post("/trip/{trip_id}", response_model=Destination)
 async def create_destination(
@@ -53,16 +178,161 @@ async def create_destination(
     """Add destination to trip"""
     await check_trip_access(trip_id, str(current_user.id), db)
     
-    dest_dict = destination_data.dict()
+    dest_dict = set_location(destination_data.dict())
     dest_dict["tripId"] = trip_id
     dest_dict["createdAt"] = datetime.now(timezone.utc)
     dest_dict["updatedAt"] = datetime.now(timezone.utc)
     
     result = await db.destinations.insert_one(dest_dict)
     dest_dict["id"] = str(result.inserted_id)
+    version = await bump_child_version(db, trip_id, inc=count_inc("destinations", 1))
+    await publish_change(trip_id, "destination", "created", [dest_dict["id"]], version)
     
     return Destination(**dest_dict)
 
+@destinations_router.post("/trip/{trip_id}/bulk", response_model=BulkResponse)
+async def bulk_destinations(
+    trip_id: str,
+    bulk_data: DestinationBulkRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Create, update and delete many destinations of a trip in one call"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    
+    outcome = await run_bulk(db.destinations, trip_id, bulk_data.operations, bulk_data.ordered, prepare=set_location)
+    if outcome.applied:
+        version = await bump_child_version(db, trip_id, inc=count_inc("destinations", outcome.count_delta()))
+        await publish_change(trip_id, "destination", "bulk", outcome.applied_ids(), version)
+    
+    return outcome.response()
+
+@destinations_router.patch("/trip/{trip_id}/order", response_model=DestinationOrderResponse)
+async def reorder_destinations(
+    trip_id: str,
+    order_data: DestinationOrderRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Apply a new (day, order) layout to many destinations at once"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    
+    if not all(ObjectId.is_valid(item.id) for item in order_data.items):
+        raise HTTPException(status_code=400, detail="Invalid destination id")
+    
+    ids = [ObjectId(item.id) for item in order_data.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicate destination id")
+    if await db.destinations.count_documents({"_id": {"$in": ids}, "tripId": trip_id}) != len(ids):
+        raise HTTPException(status_code=400, detail="Destination not in trip")
+    
+    # Claim the version first so a concurrent edit or reorder fails the precondition
+    version = await bump_trip_version(db, trip_id, expected_version=order_data.version)
+    if version is None:
+        # A deleted trip is a 404 (raised by the lookup), not a version conflict
+        await trip_version(db, trip_id)
+        raise HTTPException(status_code=409, detail="Trip was modified; reload and retry")
+    
+    now = datetime.now(timezone.utc)
+    result = await db.destinations.bulk_write([
+        UpdateOne(
+            {"_id": oid, "tripId": trip_id},
+            {"$set": {"day": item.day, "order": item.order, "updatedAt": now}}
+        )
+        for oid, item in zip(ids, order_data.items)
+    ], ordered=False)
+    await publish_change(trip_id, "destination", "reordered", [item.id for item in order_data.items], version)
+    
+    return DestinationOrderResponse(version=version, updated=result.modified_count)
+
+def plan_day(stops: List[dict], pins: Optional[DestinationOptimizeDay]) -> Tuple[List[dict], float, float]:
+    """Shortest visiting order for one day's stops; returns (stops in order, new km, current km)"""
+    ids = [str(stop["_id"]) for stop in stops]
+    first = ids.index(pins.firstId) if pins and pins.firstId else None
+    last = ids.index(pins.lastId) if pins and pins.lastId else None
+    
+    dist = haversine_matrix([stop["lat"] for stop in stops], [stop["lng"] for stop in stops])
+    current = list(range(len(stops)))
+    route = solve_route(dist, first, last)
+    
+    previous_km = route_length(dist, current)
+    new_km = route_length(dist, route)
+    # The heuristic is not optimal; never replace a better manual order that honours the pins
+    keeps_pins = (first in (None, 0)) and (last in (None, len(stops) - 1))
+    if keeps_pins and previous_km <= new_km:
+        route, new_km = current, previous_km
+    
+    return [stops[i] for i in route], new_km, previous_km
+
+@destinations_router.post("/trip/{trip_id}/optimize", response_model=DestinationOptimizeResponse)
+async def optimize_destinations(
+    trip_id: str,
+    optimize_data: Optional[DestinationOptimizeRequest] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Reorder each day's destinations into a short route (nearest neighbour + 2-opt)"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    optimize_data = optimize_data or DestinationOptimizeRequest()
+    
+    pins: Dict[int, DestinationOptimizeDay] = {}
+    for options in optimize_data.days or []:
+        if options.day in pins:
+            raise HTTPException(status_code=400, detail=f"Day {options.day} is listed more than once")
+        if options.firstId and options.firstId == options.lastId:
+            raise HTTPException(status_code=400, detail=f"Day {options.day}: firstId and lastId must be different destinations")
+        pins[options.day] = options
+    query = {"tripId": trip_id}
+    if optimize_data.days is not None:
+        query["day"] = {"$in": list(pins)}
+    
+    days: Dict[int, List[dict]] = {}
+    async for stop in db.destinations.find(query, ROUTE_PROJECTION).sort(DESTINATION_SORT):
+        days.setdefault(stop["day"], []).append(stop)
+    
+    for day, options in pins.items():
+        stop_ids = {str(stop["_id"]) for stop in days.get(day, [])}
+        for pinned in (options.firstId, options.lastId):
+            if pinned and pinned not in stop_ids:
+                raise HTTPException(status_code=400, detail=f"Destination {pinned} is not on day {day}")
+    
+    # Solving is CPU-bound; keep it off the event loop
+    plans = await asyncio.to_thread(lambda: {day: plan_day(stops, pins.get(day)) for day, stops in days.items()})
+    
+    version = await bump_trip_version(db, trip_id, expected_version=optimize_data.version)
+    if version is None:
+        # A deleted trip is a 404 (raised by the lookup), not a version conflict
+        await trip_version(db, trip_id)
+        raise HTTPException(status_code=409, detail="Trip was modified; reload and retry")
+    
+    now = datetime.now(timezone.utc)
+    moved = [
+        (stop["_id"], order)
+        for ordered, _, _ in plans.values()
+        for order, stop in enumerate(ordered)
+        if stop.get("order") != order
+    ]
+    updates = [UpdateOne({"_id": oid, "tripId": trip_id}, {"$set": {"order": order, "updatedAt": now}}) for oid, order in moved]
+    updated = 0
+    if updates:
+        result = await db.destinations.bulk_write(updates, ordered=False)
+        updated = result.modified_count
+    await publish_change(trip_id, "destination", "optimized", [oid for oid, _ in moved], version)
+    
+    return DestinationOptimizeResponse(
+        version=version,
+        updated=updated,
+        days=[
+            DestinationOptimizeDayResult(
+                day=day,
+                order=[str(stop["_id"]) for stop in ordered],
+                distanceKm=round(new_km, 3),
+                previousDistanceKm=round(previous_km, 3)
+            )
+            for day, (ordered, new_km, previous_km) in sorted(plans.items())
+        ]
+    )
+
 @destinations_router.put("/{destination_id}", response_model=Destination)
 async def update_destination(
     destination_id: str,
@@ -71,26 +341,21 @@ async def update_destination(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update destination"""
-    try:
-        destination = await db.destinations.find_one({"_id": ObjectId(destination_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    
-    if not destination:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    
-    await check_trip_access(destination["tripId"], str(current_user.id), db)
-    
-    update_data = destination_data.dict(exclude_unset=True)
+    update_data = set_location(destination_data.dict(exclude_unset=True))
     update_data["updatedAt"] = datetime.now(timezone.utc)
     
-    await db.destinations.update_one(
-        {"_id": ObjectId(destination_id)},
-        {"$set": update_data}
+    # Access is part of the filter, so the happy path is a single round trip
+    updated_dest = await write_trip_child(
+        db, db.destinations, destination_id, str(current_user.id), "Destination",
+        lambda query: db.destinations.find_one_and_update(
+            query,
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER
+        )
     )
-    
-    updated_dest = await db.destinations.find_one({"_id": ObjectId(destination_id)})
     updated_dest["id"] = str(updated_dest["_id"])
+    version = await bump_child_version(db, updated_dest["tripId"])
+    await publish_change(updated_dest["tripId"], "destination", "updated", [updated_dest["id"]], version)
     
     return Destination(**updated_dest)
 
@@ -101,16 +366,11 @@ async def delete_destination(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete destination"""
-    try:
-        destination = await db.destinations.find_one({"_id": ObjectId(destination_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    
-    if not destination:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    
-    await check_trip_access(destination["tripId"], str(current_user.id), db)
-    
-    await db.destinations.delete_one({"_id": ObjectId(destination_id)})
+    deleted = await write_trip_child(
+        db, db.destinations, destination_id, str(current_user.id), "Destination",
+        lambda query: db.destinations.find_one_and_delete(query, projection={"tripId": 1})
+    )
+    version = await bump_child_version(db, deleted["tripId"], inc=count_inc("destinations", -1))
+    await publish_change(deleted["tripId"], "destination", "deleted", [destination_id], version)
     
     return {"message": "Destination deleted successfully"}
\ No newline at end of file
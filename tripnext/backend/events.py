@@ -0,0 +1,325 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models import User
+from auth import get_current_user
+from database import get_database
+from access import check_trip_access, trip_access_cache
+from conditional import trip_version
+
+logger = logging.getLogger(__name__)
+
+# memory: one worker only; changestream: replica set; capped: any mongod
+EVENTS_BROKER = os.environ.get("EVENTS_BROKER", "memory")
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "64"))
+EVENTS_MAX_SUBSCRIBERS = int(os.environ.get("EVENTS_MAX_SUBSCRIBERS", "10000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "20"))
+EVENTS_MAX_IDS = int(os.environ.get("EVENTS_MAX_IDS", "50"))
+EVENTS_COLLECTION = os.environ.get("EVENTS_COLLECTION", "trip_events")
+EVENTS_CAPPED_BYTES = int(os.environ.get("EVENTS_CAPPED_BYTES", str(16 * 1024 * 1024)))
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+class Subscription:
+    """One stream's mailbox.
+
+    At most `max_events` encoded events are held; when a slow client falls
+    behind, the backlog is dropped and replaced by a single resync marker,
+    so memory per connection stays bounded and the client refetches (cheap
+    with ETags) instead of replaying.
+    """
+
+    __slots__ = ("trip_id", "max_events", "_events", "_ready", "overflowed")
+
+    def __init__(self, trip_id: str, max_events: int = EVENTS_QUEUE_SIZE):
+        self.trip_id = trip_id
+        self.max_events = max_events
+        self._events: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+        self.overflowed = 0
+
+    def offer(self, payload: bytes):
+        if len(self._events) >= self.max_events:
+            self._events.clear()
+            self._events.append(encode_event({"type": "resync", "tripId": self.trip_id}))
+            self.overflowed += 1
+        else:
+            self._events.append(payload)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """Next event, or None if nothing arrived within timeout"""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+class InProcessBroker:
+    """Fans events out to this worker's subscribers"""
+
+    def __init__(self, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, trip_id: str) -> Subscription:
+        if self._count >= self.max_subscribers:
+            raise HTTPException(status_code=503, detail="Too many event subscribers")
+        subscription = Subscription(trip_id)
+        self._subscribers.setdefault(trip_id, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.trip_id)
+        if subscribers and subscription in subscribers:
+            subscribers.discard(subscription)
+            self._count -= 1
+            self.overflows += subscription.overflowed
+            if not subscribers:
+                del self._subscribers[subscription.trip_id]
+
+    def deliver(self, trip_id: str, payload: bytes):
+        for subscription in self._subscribers.get(trip_id, ()):
+            subscription.offer(payload)
+            self.delivered += 1
+
+    async def publish(self, trip_id: str, event: dict):
+        self.published += 1
+        self.deliver(trip_id, encode_event(event))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "broker": type(self).__name__,
+            "subscribers": self._count,
+            "trips": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows + sum(s.overflowed for subs in self._subscribers.values() for s in subs),
+        }
+
+class EventPosition:
+    """How far a listener has read each publisher's events in the capped collection.
+
+    Every broker numbers what it publishes 1, 2, 3... under its own source
+    id. Concurrent inserts can land out of order, so besides the highest
+    contiguous number per source the few numbers already seen above it are
+    kept; a resumed tail skips exactly those and misses nothing. ObjectIds
+    from different workers are not ordered, so they are not used for this.
+    """
+
+    def __init__(self, max_pending: int = 1024):
+        self.max_pending = max_pending
+        self._contiguous: Dict[str, int] = {}
+        self._pending: Dict[str, Set[int]] = {}
+
+    def seen(self, source: str, seq: int) -> bool:
+        return seq <= self._contiguous.get(source, 0) or seq in self._pending.get(source, ())
+
+    def mark(self, source: str, seq: int):
+        done = self._contiguous.get(source, 0)
+        pending = self._pending.setdefault(source, set())
+        pending.add(seq)
+        if len(pending) > self.max_pending:
+            # A publish that never landed (its insert failed); stop waiting for it
+            done = min(pending) - 1
+        while done + 1 in pending:
+            done += 1
+            pending.discard(done)
+        pending.difference_update([n for n in pending if n <= done])
+        self._contiguous[source] = done
+
+    def skip_through(self, source: str, seq: int):
+        """Treat everything a source published up to seq as already read"""
+        self._contiguous[source] = max(seq, self._contiguous.get(source, 0))
+
+    def query(self) -> dict:
+        """Events not read yet (anything from an unknown source counts)"""
+        query = {"source": {"$exists": True}}
+        if self._contiguous:
+            query["$nor"] = [{"source": source, "seq": {"$lte": seq}} for source, seq in self._contiguous.items()]
+        return query
+
+class MongoBroker(InProcessBroker):
+    """Shares events between workers through a MongoDB collection.
+
+    publish() inserts into a capped EVENTS_COLLECTION (so it never grows)
+    and every worker listens for inserts, then fans out locally. With
+    use_change_stream the listener is a change stream (replica sets);
+    otherwise it is a tailable cursor, which works on a standalone mongod.
+    """
+
+    def __init__(self, use_change_stream: bool, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        super().__init__(max_subscribers)
+        self.use_change_stream = use_change_stream
+        self._collection = None
+        self._listener: Optional[asyncio.Task] = None
+        # Identifies this broker's events; seq numbers them in publish order
+        self.source = str(ObjectId())
+        self._seq = 0
+        self._position: Optional[EventPosition] = None
+        self._resume_token = None
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        self._collection = db[EVENTS_COLLECTION]
+        try:
+            await db.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass  # already there
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def publish(self, trip_id: str, event: dict):
+        self.published += 1
+        self._seq += 1
+        await self._collection.insert_one({"tripId": trip_id, "event": event, "source": self.source, "seq": self._seq})
+
+    async def _listen(self):
+        while True:
+            try:
+                if self.use_change_stream:
+                    await self._follow_change_stream()
+                else:
+                    await self._follow_capped()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Event listener failed, restarting: {e}")
+            # A tailable cursor on an empty collection dies at once; do not spin
+            await asyncio.sleep(1)
+
+    async def _follow_change_stream(self):
+        # After a restart pick up where the last stream stopped
+        async with self._collection.watch([{"$match": {"operationType": "insert"}}], resume_after=self._resume_token) as stream:
+            async for change in stream:
+                doc = change["fullDocument"]
+                self.deliver(doc["tripId"], encode_event(doc["event"]))
+                self._resume_token = stream.resume_token
+
+    async def _follow_capped(self):
+        if self._position is None:
+            # First start: begin after every event already there rather than replaying history
+            position = EventPosition()
+            async for row in self._collection.aggregate([{"$group": {"_id": "$source", "seq": {"$max": "$seq"}}}]):
+                if row["_id"] is not None:
+                    position.skip_through(row["_id"], row["seq"])
+            self._position = position
+
+        # The cursor follows natural (insertion) order while it lives; the
+        # query only decides where a new cursor starts
+        cursor = self._collection.find(self._position.query(), cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for doc in cursor:
+                if self._position.seen(doc["source"], doc["seq"]):
+                    continue
+                self._position.mark(doc["source"], doc["seq"])
+                self.deliver(doc["tripId"], encode_event(doc["event"]))
+            await asyncio.sleep(0.1)
+
+def encode_event(event: dict) -> bytes:
+    return json.dumps(event, separators=(",", ":"), default=str).encode()
+
+def create_broker(kind: str = EVENTS_BROKER) -> InProcessBroker:
+    if kind == "changestream":
+        return MongoBroker(use_change_stream=True)
+    if kind == "capped":
+        return MongoBroker(use_change_stream=False)
+    return InProcessBroker()
+
+broker = create_broker()
+
+async def publish_change(trip_id: str, resource: str, op: str, ids: Iterable = (), version: Optional[int] = None):
+    """Tell a trip's subscribers what changed; never fails the write that triggered it"""
+    ids = [str(i) for i in ids]
+    event = {"type": f"{resource}.{op}", "tripId": trip_id, "version": version, "at": datetime.now(timezone.utc).isoformat()}
+    if len(ids) > EVENTS_MAX_IDS:
+        event["count"] = len(ids)
+    elif ids:
+        event["ids"] = ids
+    try:
+        await broker.publish(trip_id, event)
+    except Exception as e:
+        logger.error(f"Publishing {event['type']} for trip {trip_id} failed: {e}")
+
+events_router = APIRouter(prefix="/events", tags=["events"])
+
+@events_router.get("/trip/{trip_id}")
+async def stream_trip_events(
+    trip_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Server-sent events for every change to a trip and its children"""
+    user_id = str(current_user.id)
+    await check_trip_access(trip_id, user_id, db)
+    version = await trip_version(db, trip_id)
+    subscription = broker.subscribe(trip_id)
+
+    async def still_allowed(fresh: bool) -> bool:
+        # Trip events may carry a membership change, so skip the cached answer for those
+        if fresh:
+            trip_access_cache.invalidate(trip_id)
+        try:
+            await check_trip_access(trip_id, user_id, db)
+        except HTTPException:
+            return False
+        return True
+
+    async def stream() -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        checked = loop.time()
+        try:
+            # Clients compare this version with what they hold to decide on a refetch
+            yield b"retry: 5000\nevent: ready\ndata: " + encode_event({"tripId": trip_id, "version": version}) + b"\n\n"
+            while True:
+                payload = await subscription.next(EVENTS_HEARTBEAT_SECONDS)
+                trip_event = payload is not None and json.loads(payload).get("type", "").startswith("trip.")
+                # Access is re-checked on trip-level events and at least every heartbeat,
+                # so a collaborator who is removed stops receiving events
+                if trip_event or loop.time() - checked >= EVENTS_HEARTBEAT_SECONDS:
+                    checked = loop.time()
+                    if not await still_allowed(fresh=trip_event):
+                        yield b"event: revoked\ndata: " + encode_event({"tripId": trip_id}) + b"\n\n"
+                        return
+                if payload is None:
+                    # Comment line keeps proxies from closing idle streams
+                    yield b": ping\n\n"
+                else:
+                    yield b"data: " + payload + b"\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
@@ -1,37 +1,222 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+import os
+from fastapi import APIRouter, Depends, Query, Request
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import Expense, ExpenseCreate, User
+from pymongo import ReturnDocument
+from models import (
+    Expense, ExpenseCreate, ExpenseBulkRequest, ExpenseSummaryResponse, ExpenseGroupTotal,
+    ExpenseCollaboratorTotal, BulkResponse, User
+)
 from auth import get_current_user
 from database import get_database
-from destinations import check_trip_access
+from access import TTLCache, check_trip_access, write_trip_child
+from pagination import MAX_PAGE_SIZE, fetch_page, next_cursor_headers, stream_ndjson, wants_ndjson
+from serialization import model_list_response, model_response, projection_for
+from bulk import run_bulk
+from revisions import bump_trip_version, trip_key
+from reaper import bump_child_version
+from events import publish_change
+from trip_summary import count_inc
+from conditional import etag_headers, is_not_modified, live_trip, make_etag, not_modified, trip_etag
 
 expenses_router = APIRouter(prefix="/expenses", tags=["expenses"])
 
+EXPENSE_PROJECTION = projection_for(Expense)
+EXPENSE_SORT = [("date", -1), ("_id", -1)]
+
+# Conditional fixes per trip before reconcile gives up on a busy trip until the next run
+RECONCILE_ATTEMPTS = 3
+
+EXPENSE_SUMMARY_TTL_SECONDS = float(os.environ.get("EXPENSE_SUMMARY_TTL_SECONDS", "300"))
+EXPENSE_SUMMARY_MAX_ENTRIES = int(os.environ.get("EXPENSE_SUMMARY_MAX_ENTRIES", "1000"))
+
+# (trip id, trip version) -> aggregated totals. Every expense write bumps the
+# version, so a stale entry is never looked up again and just ages out.
+summary_cache = TTLCache(EXPENSE_SUMMARY_MAX_ENTRIES, EXPENSE_SUMMARY_TTL_SECONDS)
+
+SUMMARY_TRIP_PROJECTION = {"budget": 1, "version": 1, "collaborators.userId": 1, "collaborators.name": 1}
+
+async def apply_spent_delta(db: AsyncIOMotorDatabase, trip_id: str, delta: float, count_delta: int = 0) -> int:
+    """Record an expense change on its trip: adjust spent, the expense count and the version in one atomic update"""
+    inc = {"spent": delta} if delta else {}
+    return await bump_child_version(db, trip_id, inc={**inc, **count_inc("expenses", count_delta)})
+
+async def expense_total(db: AsyncIOMotorDatabase, trip_id: str) -> float:
+    rows = await db.expenses.aggregate([
+        {"$match": {"tripId": trip_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]).to_list(1)
+    return rows[0]["total"] if rows else 0.0
+
+async def repair_spent(db: AsyncIOMotorDatabase, trip_id: str) -> Optional[int]:
+    """Set one trip's spent to the sum of its expenses; returns the new version, None if nothing was fixed.
+    
+    The version is read before the expenses are summed and the fix is a
+    version bump conditioned on it. Every expense write bumps the version,
+    so one that lands in between makes the fix retry instead of being
+    overwritten, and the bump retires cached reads keyed on the version.
+    """
+    for _ in range(RECONCILE_ATTEMPTS):
+        trip = await db.trips.find_one({"_id": trip_key(trip_id)}, {"spent": 1, "version": 1})
+        if not trip:
+            return None
+        total = await expense_total(db, trip_id)
+        if abs(trip.get("spent", 0.0) - total) <= 1e-6:
+            return None
+        version = await bump_trip_version(db, trip_id, expected_version=trip.get("version", 0), update={"$set": {"spent": total}})
+        if version is not None:
+            await publish_change(trip_id, "trip", "updated", [trip_id], version)
+            return version
+    return None
+
+async def reconcile_spent(db: AsyncIOMotorDatabase, trip_ids: Optional[List[str]] = None) -> int:
+    """Recompute spent from the expenses collection and repair trips that drifted.
+    
+    One grouped aggregate finds the candidates; each is then rechecked and
+    fixed on its own with repair_spent, so concurrent expense writes are
+    never lost. Returns the number of trips whose stored total was corrected.
+    """
+    pipeline = [
+        {"$match": {"tripId": {"$in": trip_ids}} if trip_ids else {}},
+        {"$group": {"_id": "$tripId", "total": {"$sum": "$amount"}}}
+    ]
+    totals = {}
+    async for row in db.expenses.aggregate(pipeline):
+        totals[row["_id"]] = row["total"]
+    
+    trip_filter = {"_id": {"$in": [trip_key(t) for t in trip_ids]}} if trip_ids else {}
+    candidates = []
+    async for trip in db.trips.find(trip_filter, {"spent": 1}):
+        if abs(trip.get("spent", 0.0) - totals.get(str(trip["_id"]), 0.0)) > 1e-6:
+            candidates.append(str(trip["_id"]))
+    
+    repaired = 0
+    for trip_id in candidates:
+        if await repair_spent(db, trip_id) is not None:
+            repaired += 1
+    
+    return repaired
+
+def _group_totals(key: str) -> List[dict]:
+    return [{"$group": {"_id": key, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}]
+
+def summary_pipeline(trip_id: str) -> List[dict]:
+    """One pass over the trip's expenses (tripId prefix of the date index), grouped three ways"""
+    return [
+        {"$match": {"tripId": trip_id}},
+        {"$project": {
+            "_id": 0,
+            "category": 1,
+            "amount": 1,
+            "paidBy": 1,
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
+        }},
+        {"$facet": {
+            "all": _group_totals(None),
+            "byCategory": _group_totals("$category") + [{"$sort": {"total": -1, "_id": 1}}],
+            "byDay": _group_totals("$day") + [{"$sort": {"_id": 1}}],
+            "byCollaborator": _group_totals("$paidBy") + [{"$sort": {"total": -1, "_id": 1}}],
+        }}
+    ]
+
+async def aggregate_expenses(db: AsyncIOMotorDatabase, trip_id: str) -> dict:
+    """Total, count and per-category/day/collaborator groups of a trip's expenses"""
+    facets = (await db.expenses.aggregate(summary_pipeline(trip_id)).to_list(1))[0]
+    overall = facets["all"][0] if facets["all"] else {"total": 0.0, "count": 0}
+    
+    def rows(name: str) -> List[dict]:
+        return [{"key": row["_id"], "total": row["total"], "count": row["count"]} for row in facets[name]]
+    
+    return {
+        "total": overall["total"],
+        "count": overall["count"],
+        "byCategory": rows("byCategory"),
+        "byDay": rows("byDay"),
+        "byCollaborator": rows("byCollaborator"),
+    }
+
+def expense_from_doc(expense: dict) -> Expense:
+    return Expense(**expense)
+
+async def list_expenses(
+    db: AsyncIOMotorDatabase,
+    trip_id: str,
+    limit: Optional[int] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Expense], Optional[str]]:
+    """Load a page of a trip's expenses, newest first"""
+    expenses, next_cursor = await fetch_page(db.expenses, {"tripId": trip_id}, EXPENSE_SORT, limit, after, EXPENSE_PROJECTION)
+    
+    return [expense_from_doc(expense) for expense in expenses], next_cursor
+
 @expenses_router.get("/trip/{trip_id}", response_model=List[Expense])
 async def get_expenses(
     trip_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all expenses for a trip"""
+    """Get expenses for a trip, paged by limit/after or streamed as NDJSON"""
     await check_trip_access(trip_id, str(current_user.id), db)
     
-    expenses = await db.expenses.find({"tripId": trip_id}).sort("date", -1).to_list(1000)
+    # An unchanged poll costs one projected version lookup
+    etag = await trip_etag(db, trip_id, request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
     
-    # Calculate total spent and update trip
-    total_spent = sum(exp["amount"] for exp in expenses)
-    await db.trips.update_one(
-        {"_id": ObjectId(trip_id) if ObjectId.is_valid(trip_id) else trip_id},
-        {"$set": {"spent": total_spent}}
-    )
+    if wants_ndjson(request):
+        response = stream_ndjson(db.expenses, {"tripId": trip_id}, EXPENSE_SORT, expense_from_doc, limit, after, EXPENSE_PROJECTION)
+        response.headers.update(etag_headers(etag))
+        return response
+    
+    expenses, next_cursor = await list_expenses(db, trip_id, limit, after)
+    
+    return model_list_response(Expense, expenses, etag_headers(etag, next_cursor_headers(next_cursor)))
+
+@expenses_router.get("/trip/{trip_id}/summary", response_model=ExpenseSummaryResponse)
+async def get_expense_summary(
+    trip_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Budget analytics: totals by category, day and collaborator plus remaining budget"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    
+    trip = await live_trip(db, trip_id, SUMMARY_TRIP_PROJECTION)
+    
+    # Repeated dashboard loads reuse the aggregation until an expense changes
+    version = trip.get("version", 0)
+    etag = make_etag(request, trip_id, version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    totals = summary_cache.get((trip_id, version))
+    if totals is None:
+        totals = await aggregate_expenses(db, trip_id)
+        summary_cache.set((trip_id, version), totals)
     
-    for expense in expenses:
-        expense["id"] = str(expense["_id"])
+    # Budget and names are read fresh; the cache key only covers expenses
+    budget = trip.get("budget", 0.0)
+    names = {c["userId"]: c.get("name") for c in trip.get("collaborators", [])}
     
-    return [Expense(**expense) for expense in expenses]
+    summary = ExpenseSummaryResponse(
+        tripId=trip_id,
+        version=version,
+        budget=budget,
+        spent=totals["total"],
+        remaining=budget - totals["total"],
+        count=totals["count"],
+        byCategory=[ExpenseGroupTotal(**row) for row in totals["byCategory"]],
+        byDay=[ExpenseGroupTotal(**row) for row in totals["byDay"]],
+        byCollaborator=[ExpenseCollaboratorTotal(**row, name=names.get(row["key"])) for row in totals["byCollaborator"]]
+    )
+    
+    return model_response(summary, etag_headers(etag))
 
 @expenses_router.post("/trip/{trip_id}", response_model=Expense)
 async def create_expense(
@@ -44,6 +229,7 @@ async def create_expense(
     await check_trip_access(trip_id, str(current_user.id), db)
     
     expense_dict = expense_data.dict()
+    expense_dict["paidBy"] = expense_dict["paidBy"] or str(current_user.id)
     expense_dict["tripId"] = trip_id
     expense_dict["createdAt"] = datetime.now(timezone.utc)
     expense_dict["updatedAt"] = datetime.now(timezone.utc)
@@ -52,15 +238,43 @@ async def create_expense(
     expense_dict["id"] = str(result.inserted_id)
     
     # Update trip's spent amount
-    expenses = await db.expenses.find({"tripId": trip_id}).to_list(1000)
-    total_spent = sum(exp["amount"] for exp in expenses)
-    await db.trips.update_one(
-        {"_id": ObjectId(trip_id) if ObjectId.is_valid(trip_id) else trip_id},
-        {"$set": {"spent": total_spent}}
-    )
+    version = await apply_spent_delta(db, trip_id, expense_dict["amount"], 1)
+    await publish_change(trip_id, "expense", "created", [expense_dict["id"]], version)
     
     return Expense(**expense_dict)
 
+@expenses_router.post("/trip/{trip_id}/bulk", response_model=BulkResponse)
+async def bulk_expenses(
+    trip_id: str,
+    bulk_data: ExpenseBulkRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Create, update and delete many expenses of a trip in one call"""
+    user_id = str(current_user.id)
+    await check_trip_access(trip_id, user_id, db)
+    
+    for operation in bulk_data.operations:
+        if operation.op == "create" and operation.data and not operation.data.paidBy:
+            operation.data.paidBy = user_id
+    
+    outcome = await run_bulk(db.expenses, trip_id, bulk_data.operations, bulk_data.ordered, pre_image_fields=("amount",))
+    
+    # Fold every applied change into a single spent update for the batch
+    delta = 0.0
+    for op, before, fields in outcome.applied:
+        if op == "create":
+            delta += fields["amount"]
+        elif op == "update" and "amount" in fields:
+            delta += fields["amount"] - before["amount"]
+        elif op == "delete":
+            delta -= before["amount"]
+    if outcome.applied:
+        version = await apply_spent_delta(db, trip_id, delta, outcome.count_delta())
+        await publish_change(trip_id, "expense", "bulk", outcome.applied_ids(), version)
+    
+    return outcome.response()
+
 @expenses_router.put("/{expense_id}", response_model=Expense)
 async def update_expense(
     expense_id: str,
@@ -69,35 +283,25 @@ async def update_expense(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update expense"""
-    try:
-        expense = await db.expenses.find_one({"_id": ObjectId(expense_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    if not expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    await check_trip_access(expense["tripId"], str(current_user.id), db)
-    
     update_data = expense_data.dict(exclude_unset=True)
     update_data["updatedAt"] = datetime.now(timezone.utc)
     
-    await db.expenses.update_one(
-        {"_id": ObjectId(expense_id)},
-        {"$set": update_data}
+    # Take the pre-image atomically so the spent delta stays exact under concurrent edits
+    previous = await write_trip_child(
+        db, db.expenses, expense_id, str(current_user.id), "Expense",
+        lambda query: db.expenses.find_one_and_update(
+            query,
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
+        )
     )
     
-    updated_expense = await db.expenses.find_one({"_id": ObjectId(expense_id)})
+    updated_expense = {**previous, **update_data}
     updated_expense["id"] = str(updated_expense["_id"])
     
     # Update trip's spent amount
-    trip_id = expense["tripId"]
-    expenses = await db.expenses.find({"tripId": trip_id}).to_list(1000)
-    total_spent = sum(exp["amount"] for exp in expenses)
-    await db.trips.update_one(
-        {"_id": ObjectId(trip_id) if ObjectId.is_valid(trip_id) else trip_id},
-        {"$set": {"spent": total_spent}}
-    )
+    version = await apply_spent_delta(db, previous["tripId"], updated_expense["amount"] - previous["amount"])
+    await publish_change(previous["tripId"], "expense", "updated", [updated_expense["id"]], version)
     
     return Expense(**updated_expense)
 
@@ -108,25 +312,13 @@ async def delete_expense(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete expense"""
-    try:
-        expense = await db.expenses.find_one({"_id": ObjectId(expense_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    if not expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
-    await check_trip_access(expense["tripId"], str(current_user.id), db)
-    
-    trip_id = expense["tripId"]
-    await db.expenses.delete_one({"_id": ObjectId(expense_id)})
+    deleted = await write_trip_child(
+        db, db.expenses, expense_id, str(current_user.id), "Expense",
+        lambda query: db.expenses.find_one_and_delete(query, projection={"tripId": 1, "amount": 1})
+    )
     
     # Update trip's spent amount
-    expenses = await db.expenses.find({"tripId": trip_id}).to_list(1000)
-    total_spent = sum(exp["amount"] for exp in expenses)
-    await db.trips.update_one(
-        {"_id": ObjectId(trip_id) if ObjectId.is_valid(trip_id) else trip_id},
-        {"$set": {"spent": total_spent}}
-    )
+    version = await apply_spent_delta(db, deleted["tripId"], -deleted["amount"], -1)
+    await publish_change(deleted["tripId"], "expense", "deleted", [expense_id], version)
     
     return {"message": "Expense deleted successfully"}
\ No newline at end of file
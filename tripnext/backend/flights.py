@@ -1,31 +1,66 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import Flight, FlightCreate, User
+from pymongo import ReturnDocument
+from models import Flight, FlightCreate, FlightBulkRequest, BulkResponse, User
 from auth import get_current_user
 from database import get_database
-from destinations import check_trip_access
+from access import check_trip_access, write_trip_child
+from pagination import MAX_PAGE_SIZE, fetch_page, next_cursor_headers, stream_ndjson, wants_ndjson
+from serialization import model_list_response, projection_for
+from bulk import run_bulk
+from reaper import bump_child_version
+from events import publish_change
+from trip_summary import count_inc, schedule_update
+from conditional import etag_headers, is_not_modified, not_modified, trip_etag
 
 flights_router = APIRouter(prefix="/flights", tags=["flights"])
 
+FLIGHT_PROJECTION = projection_for(Flight, "from_")
+FLIGHT_SORT = [("date", 1), ("_id", 1)]
+
+def flight_from_doc(flight: dict) -> Flight:
+    flight["from"] = flight.pop("from_", flight.get("from", ""))
+    return Flight(**flight)
+
+async def list_flights(
+    db: AsyncIOMotorDatabase,
+    trip_id: str,
+    limit: Optional[int] = None,
+    after: Optional[str] = None
+) -> Tuple[List[Flight], Optional[str]]:
+    """Load a page of a trip's flights by date"""
+    flights, next_cursor = await fetch_page(db.flights, {"tripId": trip_id}, FLIGHT_SORT, limit, after, FLIGHT_PROJECTION)
+    
+    return [flight_from_doc(flight) for flight in flights], next_cursor
+
 @flights_router.get("/trip/{trip_id}", response_model=List[Flight])
 async def get_flights(
     trip_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all flights for a trip"""
+    """Get flights for a trip, paged by limit/after or streamed as NDJSON"""
     await check_trip_access(trip_id, str(current_user.id), db)
     
-    flights = await db.flights.find({"tripId": trip_id}).sort("date", 1).to_list(1000)
+    # An unchanged poll costs one projected version lookup
+    etag = await trip_etag(db, trip_id, request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    
+    if wants_ndjson(request):
+        response = stream_ndjson(db.flights, {"tripId": trip_id}, FLIGHT_SORT, flight_from_doc, limit, after, FLIGHT_PROJECTION)
+        response.headers.update(etag_headers(etag))
+        return response
     
-    for flight in flights:
-        flight["id"] = str(flight["_id"])
-        flight["from"] = flight.get("from_", flight.get("from", ""))
+    flights, next_cursor = await list_flights(db, trip_id, limit, after)
     
-    return [Flight(**flight) for flight in flights]
+    return model_list_response(Flight, flights, etag_headers(etag, next_cursor_headers(next_cursor)))
 
 @flights_router.post("/trip/{trip_id}", response_model=Flight)
 async def create_flight(
@@ -38,17 +73,41 @@ async def create_flight(
     await check_trip_access(trip_id, str(current_user.id), db)
     
     flight_dict = flight_data.dict()
-    flight_dict["from_"] = flight_dict.pop("from")
     flight_dict["tripId"] = trip_id
     flight_dict["createdAt"] = datetime.now(timezone.utc)
     flight_dict["updatedAt"] = datetime.now(timezone.utc)
     
     result = await db.flights.insert_one(flight_dict)
     flight_dict["id"] = str(result.inserted_id)
+    version = await bump_child_version(db, trip_id, inc=count_inc("flights", 1), update=schedule_update([flight_dict]))
+    await publish_change(trip_id, "flight", "created", [flight_dict["id"]], version)
     flight_dict["from"] = flight_dict.pop("from_")
     
     return Flight(**flight_dict)
 
+@flights_router.post("/trip/{trip_id}/bulk", response_model=BulkResponse)
+async def bulk_flights(
+    trip_id: str,
+    bulk_data: FlightBulkRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Create, update and delete many flights of a trip in one call"""
+    await check_trip_access(trip_id, str(current_user.id), db)
+    
+    outcome = await run_bulk(db.flights, trip_id, bulk_data.operations, bulk_data.ordered)
+    if outcome.applied:
+        written = [fields if op == "create" else {**fields, "_id": before["_id"]} for op, before, fields in outcome.applied if op != "delete"]
+        removed = [before["_id"] for op, before, _ in outcome.applied if op == "delete"]
+        version = await bump_child_version(
+            db, trip_id,
+            inc=count_inc("flights", outcome.count_delta()),
+            update=schedule_update(written, removed)
+        )
+        await publish_change(trip_id, "flight", "bulk", outcome.applied_ids(), version)
+    
+    return outcome.response()
+
 @flights_router.put("/{flight_id}", response_model=Flight)
 async def update_flight(
     flight_id: str,
@@ -57,31 +116,24 @@ async def update_flight(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Update flight"""
-    try:
-        flight = await db.flights.find_one({"_id": ObjectId(flight_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Flight not found")
-    
-    if not flight:
-        raise HTTPException(status_code=404, detail="Flight not found")
-    
-    await check_trip_access(flight["tripId"], str(current_user.id), db)
-    
     update_data = flight_data.dict(exclude_unset=True)
     if "from" in update_data:
         update_data["from_"] = update_data.pop("from")
     update_data["updatedAt"] = datetime.now(timezone.utc)
     
-    await db.flights.update_one(
-        {"_id": ObjectId(flight_id)},
-        {"$set": update_data}
+    updated_flight = await write_trip_child(
+        db, db.flights, flight_id, str(current_user.id), "Flight",
+        lambda query: db.flights.find_one_and_update(
+            query,
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER
+        )
     )
-    
-    updated_flight = await db.flights.find_one({"_id": ObjectId(flight_id)})
     updated_flight["id"] = str(updated_flight["_id"])
-    updated_flight["from"] = updated_flight.get("from_", updated_flight.get("from", ""))
+    version = await bump_child_version(db, updated_flight["tripId"], update=schedule_update([updated_flight]))
+    await publish_change(updated_flight["tripId"], "flight", "updated", [updated_flight["id"]], version)
     
-    return Flight(**updated_flight)
+    return flight_from_doc(updated_flight)
 
 @flights_router.delete("/{flight_id}")
 async def delete_flight(
@@ -90,16 +142,11 @@ async def delete_flight(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Delete flight"""
-    try:
-        flight = await db.flights.find_one({"_id": ObjectId(flight_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Flight not found")
-    
-    if not flight:
-        raise HTTPException(status_code=404, detail="Flight not found")
-    
-    await check_trip_access(flight["tripId"], str(current_user.id), db)
-    
-    await db.flights.delete_one({"_id": ObjectId(flight_id)})
+    deleted = await write_trip_child(
+        db, db.flights, flight_id, str(current_user.id), "Flight",
+        lambda query: db.flights.find_one_and_delete(query, projection={"tripId": 1})
+    )
+    version = await bump_child_version(db, deleted["tripId"], inc=count_inc("flights", -1), update=schedule_update(removed_ids=[deleted["_id"]]))
+    await publish_change(deleted["tripId"], "flight", "deleted", [flight_id], version)
     
     return {"message": "Flight deleted successfully"}
\ No newline at end of file
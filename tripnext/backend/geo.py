@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+# Destinations keep lat/lng for the API and mirror them into a GeoJSON
+# point (note the [lng, lat] order) so a 2dsphere index can serve them
+LOCATION_FIELD = "location"
+
+def geo_point(lat, lng) -> Optional[dict]:
+    """GeoJSON point for valid coordinates, None for anything Mongo would reject"""
+    if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return {"type": "Point", "coordinates": [float(lng), float(lat)]}
+
+def set_location(fields: dict) -> dict:
+    """Keep the GeoJSON mirror in step with lat/lng in an insert document or $set"""
+    if "lat" in fields and "lng" in fields:
+        fields[LOCATION_FIELD] = geo_point(fields["lat"], fields["lng"])
+    return fields
+
+def near_filter(lat: float, lng: float, radius_km: float) -> dict:
+    """Points within radius_km, nearest first"""
+    return {LOCATION_FIELD: {"$nearSphere": {
+        "$geometry": {"type": "Point", "coordinates": [lng, lat]},
+        "$maxDistance": radius_km * 1000
+    }}}
+
+# Counter-clockwise rings under this CRS mean "the inside of the ring", even
+# for boxes larger than a hemisphere (zoomed-out maps)
+_STRICT_WINDING_CRS = {"type": "name", "properties": {"name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}}
+
+def _box(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> dict:
+    return {LOCATION_FIELD: {"$geoWithin": {"$geometry": {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+        ]],
+        "crs": _STRICT_WINDING_CRS
+    }}}}
+
+def box_filter(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> dict:
+    """Points inside a map viewport; a box whose min_lng > max_lng crosses the antimeridian"""
+    spans = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+    boxes: List[dict] = []
+    for west, east in spans:
+        # Edges are geodesics, so keep each box under 180 degrees of longitude
+        if east - west > 180:
+            middle = (west + east) / 2
+            boxes += [_box(min_lat, west, max_lat, middle), _box(min_lat, middle, max_lat, east)]
+        else:
+            boxes.append(_box(min_lat, west, max_lat, east))
+    return boxes[0] if len(boxes) == 1 else {"$or": boxes}
@@ -0,0 +1,113 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from access import NOT_DELETED
+from geo import box_filter, near_filter
+
+logger = logging.getLogger(__name__)
+
+# Every index the routers rely on, keyed by collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "sessions": [
+        IndexModel([("sessionToken", ASCENDING)], name="sessionToken_1"),
+        # Mongo's TTL monitor removes sessions once expiresAt has passed
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "session_revocations": [
+        # Entries only matter until the tokens they revoke have expired
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_1"),
+    ],
+    "trips": [
+        # Both branches of the $or in get_trips need their own index; the
+        # trailing _id lets Mongo merge them in keyset order without a SORT
+        IndexModel([("userId", ASCENDING), ("_id", ASCENDING)], name="userId_1__id_1"),
+        IndexModel([("collaborators.userId", ASCENDING), ("_id", ASCENDING)], name="collaborators_userId_1__id_1"),
+        # Only tombstoned trips carry deletedAt, so the reaper's sweep stays cheap
+        IndexModel([("deletedAt", ASCENDING)], name="deletedAt_1", sparse=True),
+    ],
+    "destinations": [
+        IndexModel([("tripId", ASCENDING), ("day", ASCENDING), ("order", ASCENDING), ("_id", ASCENDING)],
+                   name="tripId_1_day_1_order_1__id_1"),
+        # Map queries always scope by tripId (one trip or $in the user's trips)
+        IndexModel([("tripId", ASCENDING), ("location", GEOSPHERE)], name="tripId_1_location_2dsphere"),
+    ],
+    "flights": [
+        IndexModel([("tripId", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)], name="tripId_1_date_1__id_1"),
+    ],
+    "expenses": [
+        IndexModel([("tripId", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], name="tripId_1_date_-1__id_-1"),
+    ],
+}
+
+_SAMPLE_ID = "000000000000000000000000"
+
+# Representative shape of every query issued by the routers, used by explain_queries
+QUERIES: List[dict] = [
+    {"name": "auth.session_by_token", "collection": "sessions", "filter": {"sessionToken": "token"}},
+    {"name": "auth.live_revocations", "collection": "session_revocations", "filter": {"expiresAt": {"$gt": datetime(2000, 1, 1)}}},
+    {"name": "auth.user_by_id", "collection": "users", "filter": {"_id": _SAMPLE_ID}},
+    {"name": "auth.user_by_email", "collection": "users", "filter": {"email": "user@example.com"}},
+    {"name": "trips.list_for_user", "collection": "trips", "filter": {
+        "$or": [{"userId": _SAMPLE_ID}, {"collaborators.userId": _SAMPLE_ID}], **NOT_DELETED
+    }, "sort": [("_id", ASCENDING)]},
+    {"name": "trips.by_id", "collection": "trips", "filter": {"_id": ObjectId(_SAMPLE_ID), **NOT_DELETED}},
+    {"name": "reaper.tombstones", "collection": "trips", "filter": {"deletedAt": {"$lte": datetime(2000, 1, 1)}}},
+    {"name": "destinations.list_for_trip", "collection": "destinations", "filter": {"tripId": _SAMPLE_ID},
+     "sort": [("day", ASCENDING), ("order", ASCENDING), ("_id", ASCENDING)]},
+    {"name": "destinations.near", "collection": "destinations",
+     "filter": {"tripId": {"$in": [_SAMPLE_ID]}, **near_filter(0.0, 0.0, 5.0)}},
+    {"name": "destinations.within_viewport", "collection": "destinations",
+     "filter": {"tripId": _SAMPLE_ID, **box_filter(-1.0, -1.0, 1.0, 1.0)}},
+    {"name": "flights.list_for_trip", "collection": "flights", "filter": {"tripId": _SAMPLE_ID},
+     "sort": [("date", ASCENDING), ("_id", ASCENDING)]},
+    {"name": "expenses.list_for_trip", "collection": "expenses", "filter": {"tripId": _SAMPLE_ID},
+     "sort": [("date", DESCENDING), ("_id", DESCENDING)]},
+]
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create every registered index; safe to run on every startup"""
+    for collection, indexes in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(indexes)
+            logger.info(f"Ensured indexes on {collection}: {', '.join(names)}")
+        except OperationFailure as e:
+            # An index with the same name but different options already exists
+            logger.error(f"Could not ensure indexes on {collection}: {e}")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+async def explain_queries(db: AsyncIOMotorDatabase) -> List[dict]:
+    """Explain each registered router query and flag the ones no index serves"""
+    report = []
+    for query in QUERIES:
+        cursor = db[query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explain = await cursor.explain()
+
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        # Slot-based engine nests the classic plan tree under queryPlan
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        stages = _plan_stages(winning_plan)
+
+        report.append({
+            "name": query["name"],
+            "collection": query["collection"],
+            "stages": stages,
+            "indexed": "COLLSCAN" not in stages,
+            "inMemorySort": "SORT" in stages,
+        })
+    return report
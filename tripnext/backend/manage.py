@@ -0,0 +1,90 @@
+"""Maintenance commands: python manage.py <command>"""
+import sys
+import asyncio
+import argparse
+from database import get_database
+from indexes import ensure_indexes, explain_queries
+from expenses import reconcile_spent
+from reaper import reap_all
+from destinations import backfill_locations
+from session_cache import SESSION_CACHE_TTL_SECONDS
+from session_tokens import SESSION_DENYLIST_REFRESH_SECONDS, revoke_user_sessions
+from trip_summary import rebuild_summaries
+
+async def cmd_ensure_indexes(args) -> int:
+    await ensure_indexes(await get_database())
+    return 0
+
+async def cmd_explain_indexes(args) -> int:
+    report = await explain_queries(await get_database())
+    unindexed = 0
+    for entry in report:
+        if not entry["indexed"]:
+            flag = "COLLSCAN"
+            unindexed += 1
+        elif entry["inMemorySort"]:
+            flag = "SORT"
+        else:
+            flag = "ok"
+        print(f"{flag:<9} {entry['name']:<32} {' <- '.join(entry['stages'])}")
+    return 1 if unindexed else 0
+
+async def cmd_reconcile_spent(args) -> int:
+    repaired = await reconcile_spent(await get_database(), args.trip or None)
+    print(f"Repaired spent on {repaired} trip(s)")
+    return 0
+
+async def cmd_reap_trips(args) -> int:
+    reaped = await reap_all(await get_database(), args.trip or None)
+    print(f"Reaped {reaped} deleted trip(s)")
+    return 0
+
+async def cmd_backfill_locations(args) -> int:
+    updated = await backfill_locations(await get_database())
+    print(f"Added location to {updated} destination(s)")
+    return 0
+
+async def cmd_rebuild_summaries(args) -> int:
+    changed = await rebuild_summaries(await get_database(), args.trip or None)
+    print(f"Rebuilt summary counters on {changed} trip(s)")
+    return 0
+
+async def cmd_revoke_sessions(args) -> int:
+    deleted = await revoke_user_sessions(await get_database(), args.user)
+    print(f"Signed out {len(args.user)} user(s); deleted {deleted} stored session(s)")
+    return 0
+
+def add_trip_filter(parser):
+    parser.add_argument("--trip", action="append", help="Limit to this trip id (repeatable)")
+
+# Running workers are not told directly: they drop the sessions as their caches expire
+REVOKE_SESSIONS_HELP = (
+    f"Sign users out everywhere; workers may accept a cached session for up to {SESSION_CACHE_TTL_SECONDS:g}s "
+    f"and a signed token for up to {SESSION_DENYLIST_REFRESH_SECONDS:g}s more"
+)
+
+COMMANDS = {
+    "ensure-indexes": (cmd_ensure_indexes, "Create all registered indexes", None),
+    "explain-indexes": (cmd_explain_indexes, "Explain router queries and flag collection scans", None),
+    "reconcile-spent": (cmd_reconcile_spent, "Recompute trips.spent from expenses and fix drift", add_trip_filter),
+    "backfill-locations": (cmd_backfill_locations, "Add GeoJSON locations to older destinations", None),
+    "reap-trips": (cmd_reap_trips, "Remove deleted trips and their children now", add_trip_filter),
+    "rebuild-summaries": (cmd_rebuild_summaries, "Recompute trip counters and flight schedules from child collections", add_trip_filter),
+    "revoke-sessions": (cmd_revoke_sessions, REVOKE_SESSIONS_HELP, lambda parser: parser.add_argument(
+        "--user", action="append", required=True, help="User id (repeatable)")),
+}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text, add_arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if add_arguments:
+            add_arguments(subparser)
+
+    args = parser.parse_args(argv)
+    handler = COMMANDS[args.command][0]
+    return asyncio.run(handler(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
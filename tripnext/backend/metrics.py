@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() != "false"
+# 0 disables slow-request logging
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "0"))
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+LOOP_LAG_WARN_SECONDS = float(os.environ.get("LOOP_LAG_WARN_SECONDS", "0.1"))
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Iterable[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A labelled Prometheus series family; values live in a dict keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def values(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = list(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in values]
+        return lines
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def set(self, labels: Labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def add(self, labels: Labels, amount: float):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class HistogramMetric(Metric):
+    """Per-bucket counts are kept non-cumulative and summed at render time"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in series:
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {running}")
+        return lines
+
+REQUEST_LABELS = ("method", "route")
+
+http_request_seconds = HistogramMetric("tripnext_http_request_duration_seconds", "Time from request to last response byte", REQUEST_LABELS)
+http_requests = CounterMetric("tripnext_http_requests_total", "Responses sent, by status code", REQUEST_LABELS + ("status",))
+http_in_progress = GaugeMetric("tripnext_http_requests_in_progress", "Requests being handled")
+request_mongo_commands = CounterMetric("tripnext_http_request_mongo_commands_total", "MongoDB commands issued while handling requests", REQUEST_LABELS)
+request_mongo_seconds = CounterMetric("tripnext_http_request_mongo_seconds_total", "MongoDB command time spent while handling requests", REQUEST_LABELS)
+mongo_commands = CounterMetric("tripnext_mongo_commands_total", "MongoDB commands, including background work", ("command", "outcome"))
+mongo_seconds = CounterMetric("tripnext_mongo_command_seconds_total", "MongoDB command round-trip time", ("command",))
+loop_lag_seconds = HistogramMetric("tripnext_event_loop_lag_seconds", "How late a periodic timer fires on the event loop", buckets=LAG_BUCKETS)
+loop_lag_last = GaugeMetric("tripnext_event_loop_lag_last_seconds", "Most recent event-loop lag sample")
+
+REGISTRY: List[Metric] = [
+    http_request_seconds, http_requests, http_in_progress, request_mongo_commands, request_mongo_seconds,
+    mongo_commands, mongo_seconds, loop_lag_seconds, loop_lag_last,
+]
+
+class RequestStats:
+    """Mongo work attributed to one request; updated from the driver's threads"""
+
+    __slots__ = ("_lock", "commands", "seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands: Counter = Counter()
+        self.seconds = 0.0
+
+    def record(self, command: str, seconds: float):
+        with self._lock:
+            self.commands[command] += 1
+            self.seconds += seconds
+
+    def breakdown(self) -> str:
+        return " ".join(f"{name}={count}" for name, count in self.commands.most_common())
+
+# Motor runs driver calls on its executor with a copy of the caller's
+# context, so listener callbacks see the request that issued the command
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts every command and charges it to the active request, if any"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "error")
+
+    def _record(self, event, outcome: str):
+        seconds = event.duration_micros / 1e6
+        mongo_commands.inc((event.command_name, outcome))
+        mongo_seconds.inc((event.command_name,), seconds)
+        stats = current_request.get()
+        if stats is not None:
+            stats.record(event.command_name, seconds)
+
+command_metrics = CommandMetrics()
+
+class MetricsMiddleware:
+    """Per-route latency, status counts and Mongo usage for every HTTP request.
+
+    Routes are labelled with their path template (/api/trips/{trip_id}),
+    read from the endpoint Starlette matched, so ids never become labels.
+    Server-sent event streams are counted but kept out of the latency
+    histogram, since they stay open for minutes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[Callable, str]] = None
+
+    def _route(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        response = {"status": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streaming"] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream") for name, value in message["headers"]
+                )
+            await send(message)
+
+        http_in_progress.add((), 1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_progress.add((), -1)
+            current_request.reset(token)
+            labels = (scope["method"], self._route(scope))
+            http_requests.inc(labels + (str(response["status"]),))
+            if not response["streaming"]:
+                http_request_seconds.observe(labels, elapsed)
+            if stats.commands:
+                request_mongo_commands.inc(labels, sum(stats.commands.values()))
+                request_mongo_seconds.inc(labels, stats.seconds)
+            if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS and not response["streaming"]:
+                logger.warning(
+                    f"Slow request {labels[0]} {scope['path']} ({labels[1]}) -> {response['status']} in {elapsed:.3f}s; "
+                    f"{sum(stats.commands.values())} Mongo commands in {stats.seconds:.3f}s [{stats.breakdown()}]"
+                )
+
+class LoopLagProbe:
+    """Measures how late a timer wakes up; anything blocking the loop shows up as lag"""
+
+    def __init__(self, interval_seconds: float = LOOP_LAG_INTERVAL_SECONDS, warn_seconds: float = LOOP_LAG_WARN_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.warn_seconds = warn_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and self.interval_seconds > 0 and METRICS_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(0.0, loop.time() - expected)
+            loop_lag_seconds.observe((), lag)
+            loop_lag_last.set((), lag)
+            if self.warn_seconds and lag >= self.warn_seconds:
+                logger.warning(f"Event loop blocked for {lag:.3f}s")
+
+loop_lag_probe = LoopLagProbe()
+
+def render_metrics(pool: Optional[Dict[str, float]] = None) -> str:
+    """Every registered metric, plus connection pool gauges, in Prometheus text format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    for key, value in (pool or {}).items():
+        name = "tripnext_mongo_pool_" + "".join("_" + c.lower() if c.isupper() else c for c in key)
+        lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,16 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 from bson import ObjectId
+from pydantic_core import core_schema
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str)
+        )
 
     @classmethod
     def validate(cls, v):
@@ -15,8 +19,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 # User Models
 class User(BaseModel):
@@ -84,6 +88,22 @@ class Trip(TripBase):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str, datetime: lambda v: v.isoformat()}
 
+class TripSummary(BaseModel):
+    destinations: int = 0
+    flights: int = 0
+    expenses: int = 0
+
+class TripNextFlight(BaseModel):
+    id: str
+    date: datetime
+    flightNumber: str
+    from_: str = Field(..., alias="from")
+    to: str
+    departTime: str
+
+    class Config:
+        populate_by_name = True
+
 class TripResponse(BaseModel):
     id: str
     name: str
@@ -94,6 +114,9 @@ class TripResponse(BaseModel):
     budget: float
     spent: float
     collaborators: List[Collaborator]
+    version: int = 0
+    summary: TripSummary = TripSummary()
+    nextFlight: Optional[TripNextFlight] = None  # earliest flight dated today or later
 
 # Destination Models
 class DestinationBase(BaseModel):
@@ -111,6 +134,65 @@ class DestinationBase(BaseModel):
 class DestinationCreate(DestinationBase):
     pass
 
+class DestinationOrderItem(BaseModel):
+    id: str
+    day: int
+    order: int
+
+class DestinationOrderRequest(BaseModel):
+    version: int  # trip version the layout was computed against
+    items: List[DestinationOrderItem] = Field(min_length=1)
+
+class DestinationOrderResponse(BaseModel):
+    version: int
+    updated: int
+
+class DestinationOptimizeDay(BaseModel):
+    day: int
+    firstId: Optional[str] = None  # pin this destination to the start of the day
+    lastId: Optional[str] = None  # pin this destination to the end of the day
+
+class DestinationOptimizeRequest(BaseModel):
+    version: Optional[int] = None  # if set, fail with 409 when the trip has moved on
+    days: Optional[List[DestinationOptimizeDay]] = None  # default: every day, nothing pinned
+
+class DestinationOptimizeDayResult(BaseModel):
+    day: int
+    order: List[str]  # destination ids in visiting order
+    distanceKm: float
+    previousDistanceKm: float
+
+class DestinationOptimizeResponse(BaseModel):
+    version: int
+    updated: int
+    days: List[DestinationOptimizeDayResult]
+
+class TimelineStop(BaseModel):
+    id: str
+    name: str
+    time: Optional[str] = None  # as entered
+    start: Optional[str] = None  # parsed HH:MM, None if time was not understood
+    end: Optional[str] = None
+    durationMinutes: int
+    distanceFromPreviousKm: Optional[float] = None
+    travelMinutesFromPrevious: Optional[float] = None
+    gapMinutes: Optional[int] = None  # free time after the previous stop ends
+    overlapsWith: Optional[str] = None  # id of an earlier stop still running at start
+    unreachable: bool = False  # gap shorter than the travel time from the previous stop
+
+class TimelineDay(BaseModel):
+    day: int
+    stops: List[TimelineStop]
+    totalDistanceKm: float
+    totalTravelMinutes: float
+    conflicts: int
+
+class TimelineResponse(BaseModel):
+    tripId: str
+    version: int
+    mode: str
+    days: List[TimelineDay]
+
 class Destination(DestinationBase):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     tripId: str
@@ -157,6 +239,7 @@ class ExpenseBase(BaseModel):
     amount: float
     description: str
     date: datetime = Field(default_factory=datetime.utcnow)
+    paidBy: Optional[str] = None  # user id; defaults to whoever records the expense
 
 class ExpenseCreate(ExpenseBase):
     pass
@@ -170,4 +253,83 @@ class Expense(ExpenseBase):
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str, datetime: lambda v: v.isoformat()}
\ No newline at end of file
+        json_encoders = {ObjectId: str, datetime: lambda v: v.isoformat()}
+
+# Budget analytics
+class ExpenseGroupTotal(BaseModel):
+    key: Optional[str] = None  # category, YYYY-MM-DD day or collaborator user id
+    total: float
+    count: int
+
+class ExpenseCollaboratorTotal(ExpenseGroupTotal):
+    name: Optional[str] = None
+
+class ExpenseSummaryResponse(BaseModel):
+    tripId: str
+    version: int
+    budget: float
+    spent: float
+    remaining: float
+    count: int
+    byCategory: List[ExpenseGroupTotal]
+    byDay: List[ExpenseGroupTotal]
+    byCollaborator: List[ExpenseCollaboratorTotal]
+
+# Trip bundle (trip detail page payload)
+class TripBundleResponse(BaseModel):
+    trip: TripResponse
+    destinations: Optional[List[Destination]] = None
+    flights: Optional[List[Flight]] = None
+    expenses: Optional[List[Expense]] = None
+
+# Bulk Models
+class BulkItemResult(BaseModel):
+    index: int
+    op: str
+    status: str  # ok, error or skipped
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    ok: bool
+    inserted: int
+    updated: int
+    deleted: int
+    results: List[BulkItemResult]
+
+class DestinationBulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Optional[DestinationCreate] = None
+
+class DestinationBulkRequest(BaseModel):
+    operations: List[DestinationBulkOperation]
+    ordered: bool = True
+
+class FlightBulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Optional[FlightCreate] = None
+
+class FlightBulkRequest(BaseModel):
+    operations: List[FlightBulkOperation]
+    ordered: bool = True
+
+class ExpenseBulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Optional[ExpenseCreate] = None
+
+class ExpenseBulkRequest(BaseModel):
+    operations: List[ExpenseBulkOperation]
+    ordered: bool = True
+# Import Models
+class TripImportError(BaseModel):
+    line: int
+    error: str
+
+class TripImportResponse(BaseModel):
+    version: Optional[int] = None
+    inserted: TripSummary
+    rejected: int
+    errors: List[TripImportError]  # the first few rejected lines
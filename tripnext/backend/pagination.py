@@ -0,0 +1,116 @@
+import json
+import base64
+import binascii
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from bson import json_util
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# A sort spec must end in a unique field (_id) so the keyset order is total
+SortSpec = List[Tuple[str, int]]
+
+def encode_cursor(doc: dict, sort: SortSpec) -> str:
+    """Opaque token holding the sort-key values of the last returned document"""
+    values = [doc.get(field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+def decode_cursor(token: str, sort: SortSpec) -> List[Any]:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def keyset_query(query: dict, sort: SortSpec, after: Optional[str]) -> dict:
+    """Restrict a query to documents strictly after the cursor in sort order"""
+    if not after:
+        return query
+
+    values = decode_cursor(after, sort)
+    # (a > va) or (a == va and b > vb) or ... with $lt for descending keys.
+    # A missing key is encoded as null and sorts below every value, but
+    # $gt/$lt never match across null, so those comparisons are spelled out.
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        ties = {prefix: values[j] for j, (prefix, _) in enumerate(sort[:i])}
+        value = values[i]
+        if direction == 1:
+            clauses.append({**ties, field: {"$ne": None} if value is None else {"$gt": value}})
+        elif value is not None:
+            clauses.append({**ties, field: {"$lt": value}})
+            clauses.append({**ties, field: None})
+
+    return {"$and": [query, {"$or": clauses}]}
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    sort: SortSpec,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of documents and the cursor for the next page, if any.
+
+    Without a limit every remaining document is returned.
+    """
+    cursor = collection.find(keyset_query(query, sort, after), projection).sort(sort)
+    if limit:
+        # One extra row tells us whether another page exists
+        cursor = cursor.limit(limit + 1)
+
+    docs = [doc async for doc in cursor]
+
+    next_cursor = None
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort)
+
+    return docs, next_cursor
+
+def next_cursor_headers(next_cursor: Optional[str]) -> Dict[str, str]:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def stream_ndjson(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    sort: SortSpec,
+    convert: Callable[[dict], BaseModel],
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> StreamingResponse:
+    """Stream one JSON document per line as the Motor cursor yields them.
+
+    The cursor header is sent before the rows are read, so with a limit the
+    page ends in a {"nextCursor": ...} line when another page exists.
+    """
+    cursor = collection.find(keyset_query(query, sort, after), projection).sort(sort)
+    if limit:
+        # One extra row tells us whether another page exists
+        cursor = cursor.limit(limit + 1)
+
+    async def lines() -> AsyncIterator[bytes]:
+        sent = 0
+        last = None
+        async for doc in cursor:
+            if limit and sent == limit:
+                yield json.dumps({"nextCursor": encode_cursor(last, sort)}).encode() + b"\n"
+                return
+            yield convert(doc).model_dump_json(by_alias=True).encode() + b"\n"
+            sent += 1
+            last = doc
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,243 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from access import TRIP_ACCESS_TTL_SECONDS
+from revisions import bump_trip_version, trip_key
+
+logger = logging.getLogger(__name__)
+
+REAPER_CONCURRENCY = int(os.environ.get("REAPER_CONCURRENCY", "4"))
+REAPER_RETRIES = int(os.environ.get("REAPER_RETRIES", "3"))
+REAPER_SWEEP_SECONDS = float(os.environ.get("REAPER_SWEEP_SECONDS", "60"))
+# Tombstones younger than this are left alone so workers with a stale access
+# cache cannot add children behind the reaper's back
+REAPER_GRACE_SECONDS = float(os.environ.get("REAPER_GRACE_SECONDS", str(TRIP_ACCESS_TTL_SECONDS)))
+# auto: use a transaction when connected to a replica set or mongos
+REAPER_TRANSACTIONS = os.environ.get("REAPER_TRANSACTIONS", "auto")
+
+CHILD_COLLECTIONS = ("destinations", "flights", "expenses")
+
+def tombstone_query(older_than: Optional[datetime] = None) -> dict:
+    if older_than is None:
+        return {"deletedAt": {"$exists": True}}
+    return {"deletedAt": {"$lte": older_than}}
+
+def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    if REAPER_TRANSACTIONS != "auto":
+        return REAPER_TRANSACTIONS.lower() in ("1", "true", "yes")
+    description = getattr(db.client, "topology_description", None)
+    return getattr(description, "topology_type_name", "") in ("ReplicaSetWithPrimary", "Sharded")
+
+async def delete_children(db: AsyncIOMotorDatabase, trip_id: str, session=None) -> Dict[str, int]:
+    counts = {}
+    for name in CHILD_COLLECTIONS:
+        result = await db[name].delete_many({"tripId": trip_id}, session=session)
+        counts[name] = result.deleted_count
+    return counts
+
+async def bump_child_version(db: AsyncIOMotorDatabase, trip_id: str, inc: Optional[dict] = None, update: Optional[dict] = None) -> int:
+    """bump_trip_version for a child write that passed its access check.
+
+    If the trip was deleted since that check, the reaper may already be done
+    with it, so the write would be left orphaned: the trip's children
+    (including this write) are removed here and the request is a 404.
+    """
+    version = await bump_trip_version(db, trip_id, inc=inc, update=update)
+    if version is None:
+        await delete_children(db, trip_id)
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return version
+
+async def reap_trip(db: AsyncIOMotorDatabase, trip_id: str, use_transaction: bool = False) -> Dict[str, int]:
+    """Remove a tombstoned trip's children, then the trip itself.
+
+    Children go first so a crash part-way leaves the tombstone in place and
+    the next sweep finishes the job. Returns deleted counts per collection.
+    """
+    async def delete_all(session=None) -> Dict[str, int]:
+        counts = await delete_children(db, trip_id, session)
+        # Only a tombstoned trip may be removed, never a live one
+        result = await db.trips.delete_one({"_id": trip_key(trip_id), **tombstone_query()}, session=session)
+        counts["trips"] = result.deleted_count
+        return counts
+
+    if not use_transaction:
+        return await delete_all()
+
+    async with await db.client.start_session() as session:
+        async with session.start_transaction():
+            return await delete_all(session)
+
+class TripReaper:
+    """Background worker that hard-deletes soft-deleted trips.
+
+    delete_trip only sets deletedAt and calls schedule(). Tombstones in the
+    database are the queue: each sweep reaps the ones past the grace period
+    with at most `concurrency` reaps in flight, retrying with exponential
+    backoff. A failed or interrupted reap leaves its tombstone for the next
+    sweep, and a periodic sweep collects trips deleted on other workers.
+    """
+
+    def __init__(self, concurrency: int = REAPER_CONCURRENCY,
+                 retries: int = REAPER_RETRIES,
+                 sweep_seconds: float = REAPER_SWEEP_SECONDS,
+                 grace_seconds: float = REAPER_GRACE_SECONDS):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.sweep_seconds = sweep_seconds
+        self.grace_seconds = grace_seconds
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        # trip id -> monotonic time its grace period ends
+        self._scheduled: Dict[str, float] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._next_sweep = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.backlog = 0
+        self.sweeps = 0
+        self.reaped = 0
+        self.failures = 0
+        self.retried = 0
+        self.deleted_children = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+        self.seconds_last = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        """Start on the running loop; the first sweep resumes tombstones left by earlier runs"""
+        if self.running:
+            return
+        self._db = db
+        self._next_sweep = 0.0
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sweeping and let in-flight reaps finish; anything else stays tombstoned"""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def schedule(self, trip_id: str):
+        """Reap a freshly tombstoned trip as soon as its grace period is over"""
+        due = time.monotonic() + self.grace_seconds
+        self._scheduled[trip_id] = due
+        self._next_sweep = min(self._next_sweep, due)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.sweep_seconds
+                try:
+                    await self._sweep()
+                except Exception as e:
+                    logger.error(f"Trip reaper sweep failed: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, self._next_sweep - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sweep(self):
+        self.sweeps += 1
+        # Trips whose grace period has ended are covered by this sweep's query
+        now = time.monotonic()
+        self._scheduled = {trip_id: due for trip_id, due in self._scheduled.items() if due > now}
+        self._next_sweep = min([self._next_sweep, *self._scheduled.values()])
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.grace_seconds)
+        trip_ids = [str(trip["_id"]) async for trip in self._db.trips.find(tombstone_query(cutoff), {"_id": 1})]
+        self.backlog = len(trip_ids)
+
+        for trip_id in trip_ids:
+            if trip_id in self._in_flight:
+                continue
+            # Waiting here keeps at most `concurrency` reaps (and tasks) alive
+            await self._semaphore.acquire()
+            self._in_flight.add(trip_id)
+            task = asyncio.create_task(self._reap(trip_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _reap(self, trip_id: str):
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            use_transaction = supports_transactions(self._db)
+            for attempt in range(self.retries + 1):
+                try:
+                    counts = await reap_trip(self._db, trip_id, use_transaction)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        # The tombstone stays, so the next sweep tries again
+                        self.failures += 1
+                        logger.error(f"Reaping trip {trip_id} failed: {e}")
+                        return
+                    self.retried += 1
+                    logger.warning(f"Reaping trip {trip_id} failed (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(0.1 * (2 ** attempt))
+
+            elapsed = time.perf_counter() - started
+            self.reaped += counts["trips"]
+            self.deleted_children += sum(counts[name] for name in CHILD_COLLECTIONS)
+            self.backlog = max(0, self.backlog - 1)
+            self.seconds_total += elapsed
+            self.seconds_max = max(self.seconds_max, elapsed)
+            self.seconds_last = elapsed
+        finally:
+            self.active -= 1
+            self._in_flight.discard(trip_id)
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "scheduled": len(self._scheduled),
+            "backlog": self.backlog,
+            "inFlight": self.active,
+            "sweeps": self.sweeps,
+            "reaped": self.reaped,
+            "deletedChildren": self.deleted_children,
+            "retries": self.retried,
+            "failures": self.failures,
+            "secondsTotal": round(self.seconds_total, 6),
+            "secondsMax": round(self.seconds_max, 6),
+            "secondsLast": round(self.seconds_last, 6),
+            "secondsAvg": round(self.seconds_total / self.reaped, 6) if self.reaped else 0.0,
+        }
+
+async def reap_all(db: AsyncIOMotorDatabase, trip_ids: Optional[List[str]] = None) -> int:
+    """Synchronously reap every tombstoned trip (or just trip_ids); returns trips removed"""
+    query = tombstone_query()
+    if trip_ids:
+        query["_id"] = {"$in": [trip_key(t) for t in trip_ids]}
+    use_transaction = supports_transactions(db)
+    reaped = 0
+    async for trip in db.trips.find(query, {"_id": 1}):
+        counts = await reap_trip(db, str(trip["_id"]), use_transaction)
+        reaped += counts["trips"]
+    return reaped
+
+trip_reaper = TripReaper()
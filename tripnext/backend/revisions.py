@@ -0,0 +1,43 @@
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Deleted trips keep a tombstone (deletedAt) until the reaper removes them;
+# every trip lookup must exclude them
+NOT_DELETED = {"deletedAt": {"$exists": False}}
+
+def trip_key(trip_id: str):
+    return ObjectId(trip_id) if ObjectId.is_valid(trip_id) else trip_id
+
+def version_filter(version: int) -> dict:
+    """Match a trip at the given version; trips that predate versioning count as 0"""
+    if version == 0:
+        return {"$or": [{"version": 0}, {"version": {"$exists": False}}]}
+    return {"version": version}
+
+async def bump_trip_version(
+    db: AsyncIOMotorDatabase,
+    trip_id: str,
+    expected_version: Optional[int] = None,
+    inc: Optional[dict] = None,
+    update: Optional[dict] = None
+) -> Optional[int]:
+    """Increment a trip's version, optionally only if it is still expected_version.
+
+    Extra counters in inc and other operators in update ($set/$unset of
+    derived fields) are applied in the same atomic update. Returns the new
+    version, or None when the trip is missing, deleted or the precondition
+    failed.
+    """
+    query = {"_id": trip_key(trip_id), **NOT_DELETED}
+    if expected_version is not None:
+        query.update(version_filter(expected_version))
+
+    trip = await db.trips.find_one_and_update(
+        query,
+        {**(update or {}), "$inc": {"version": 1, **(inc or {})}},
+        projection={"version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return trip["version"] if trip else None
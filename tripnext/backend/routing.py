@@ -0,0 +1,112 @@
+"""Shortest-visiting-order heuristics for a day's destinations"""
+from typing import List, Optional, Sequence
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# Safety valve for pathological inputs; 2-opt normally converges far sooner
+MAX_TWO_OPT_ROUNDS = 10000
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance in km, elementwise with NumPy broadcasting"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lng2) - np.radians(lng1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(lat: Sequence[float], lng: Sequence[float]) -> np.ndarray:
+    """Great-circle distance in km between every pair of points, in one vectorized pass"""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    return haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+
+def route_length(dist: np.ndarray, route: Sequence[int]) -> float:
+    route = np.asarray(route)
+    if len(route) < 2:
+        return 0.0
+    return float(dist[route[:-1], route[1:]].sum())
+
+def nearest_neighbour(dist: np.ndarray, start: int, end: Optional[int] = None) -> np.ndarray:
+    """Greedy path from start, always moving to the closest unvisited point; end (if any) goes last"""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    if end is not None:
+        visited[end] = True
+
+    route = [start]
+    current = start
+    for _ in range(n - int(visited.sum())):
+        candidates = np.where(visited, np.inf, dist[current])
+        current = int(candidates.argmin())
+        visited[current] = True
+        route.append(current)
+
+    if end is not None and end != start:
+        route.append(end)
+    return np.asarray(route)
+
+def two_opt(dist: np.ndarray, route: np.ndarray) -> np.ndarray:
+    """Improve a path with fixed endpoints by segment reversals until no reversal helps.
+
+    Each round scores every reversal at once: reversing route[i+1..j] swaps
+    edges (a, b) and (c, d) for (a, c) and (b, d). The best move per edge i
+    is kept, and all improving moves whose [i, j] spans do not overlap are
+    applied together, since they touch disjoint edges.
+    """
+    route = route.copy()
+    edges = len(route) - 1
+    if edges < 3:
+        return route
+
+    upper = np.triu(np.ones((edges, edges), dtype=bool), k=2)
+    rows = np.arange(edges)
+    for _ in range(MAX_TWO_OPT_ROUNDS):
+        a, b = route[:-1], route[1:]
+        current = dist[a, b]
+        gain = current[:, None] + current[None, :] - dist[a[:, None], a[None, :]] - dist[b[:, None], b[None, :]]
+        gain = np.where(upper, gain, 0.0)
+
+        best_j = gain.argmax(axis=1)
+        best_gain = gain[rows, best_j]
+        candidates = np.flatnonzero(best_gain > 1e-9)
+        if not len(candidates):
+            break
+
+        taken = np.zeros(edges, dtype=bool)
+        for i in candidates[np.argsort(-best_gain[candidates])]:
+            j = best_j[i]
+            if taken[i:j + 1].any():
+                continue
+            taken[i:j + 1] = True
+            route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+
+    return route
+
+def solve_route(dist: np.ndarray, first: Optional[int] = None, last: Optional[int] = None) -> List[int]:
+    """Short open path through every point, optionally pinned to a first and/or last point.
+
+    A free endpoint is modelled as a virtual depot at distance zero from
+    every point, so one fixed-endpoint solver covers all four cases.
+    """
+    n = len(dist)
+    if n <= 2:
+        order = list(range(n))
+        if first is not None and order and order[0] != first:
+            order.reverse()
+        elif last is not None and order and order[-1] != last:
+            order.reverse()
+        return order
+
+    size = n + (first is None) + (last is None)
+    padded = np.zeros((size, size))
+    padded[:n, :n] = dist
+    start = first if first is not None else n
+    end = last if last is not None else size - 1
+    if first is None and last is None:
+        # The two depots must never be neighbours
+        padded[start, end] = padded[end, start] = np.inf
+
+    route = nearest_neighbour(padded, start, end)
+    route = two_opt(padded, route)
+    return [int(point) for point in route if point < n]
@@ -0,0 +1,28 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+def projection_for(model: Type[BaseModel], *extra_fields: str) -> Dict[str, int]:
+    """Mongo projection limited to the fields a response model reads"""
+    projection = {field.alias or name: 1 for name, field in model.model_fields.items()}
+    projection.update({field: 1 for field in extra_fields})
+    return projection
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def json_response(content: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def model_list_response(model: Type[BaseModel], items: List[Any], headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize already-validated models straight to JSON bytes.
+
+    Returning a Response skips FastAPI's response_model pass, which would
+    dump every model to a dict, validate it again and then encode it.
+    """
+    return json_response(list_adapter(model).dump_json(items, by_alias=True), headers)
+
+def model_response(item: BaseModel, headers: Optional[Dict[str, str]] = None, **dump_options) -> Response:
+    return json_response(item.model_dump_json(by_alias=True, **dump_options).encode(), headers)
@@ -1,28 +1,53 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
+import hmac
 import logging
 from pathlib import Path
 
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
 # Import routers
 from auth import auth_router
 from trips import trips_router
 from destinations import destinations_router
 from flights import flights_router
 from expenses import expenses_router
+from events import events_router, broker
+from auth_client import auth_client
+from indexes import ensure_indexes
+from reaper import trip_reaper
+from admission import auth_admission
+from session_cache import session_cache
+from session_tokens import SESSION_MODE, session_denylist, session_signer
+from metrics import METRICS_ENABLED, PROMETHEUS_MEDIA_TYPE, MetricsMiddleware, loop_lag_probe, render_metrics
+import database
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One MongoDB client (and connection pool) per worker, shared by every router
+    db = database.connect()
+    await ensure_indexes(db)
+    # Resumes any trips tombstoned before this worker started
+    trip_reaper.start(db)
+    await broker.start(db)
+    if session_signer.enabled:
+        await session_denylist.start(db)
+    loop_lag_probe.start()
+    yield
+    await loop_lag_probe.stop()
+    await session_denylist.stop()
+    await broker.stop()
+    await trip_reaper.stop()
+    await auth_client.aclose()
+    database.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,22 +57,76 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "Wanderlog API"}
 
+# Operational counters are for operators only: callers must send this value
+# in X-Status-Token, and the endpoints do not exist while it is unset
+STATUS_TOKEN = os.environ.get("STATUS_TOKEN", "")
+
+async def require_status_token(x_status_token: str = Header("")):
+    if not STATUS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_status_token.encode(), STATUS_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid status token")
+
+status_router = APIRouter(prefix="/status", tags=["status"], dependencies=[Depends(require_status_token)])
+
+@status_router.get("/db-pool")
+async def db_pool_status():
+    """Connection pool usage, for sizing workers against MongoDB limits"""
+    return {"options": database.pool_options(), "stats": database.pool_stats.snapshot()}
+
+@status_router.get("/events")
+async def events_status():
+    """Event stream subscribers and fan-out counters for this worker"""
+    return broker.stats()
+
+@status_router.get("/sessions")
+async def sessions_status():
+    """Session mode, signing key ids and revocation/cache counters for this worker"""
+    return {
+        "mode": SESSION_MODE,
+        "signingKeys": list(session_signer.keys),
+        "denylist": session_denylist.stats(),
+        "cache": session_cache.stats(),
+    }
+
+@status_router.get("/auth")
+async def auth_status():
+    """Login admission control: slots in use, queue depth and shed counts"""
+    return auth_admission.stats()
+
+@status_router.get("/reaper")
+async def reaper_status():
+    """Backlog and timing of background trip deletion"""
+    return trip_reaper.stats()
+
 # Include all routers
+api_router.include_router(status_router)
 api_router.include_router(auth_router)
 api_router.include_router(trips_router)
 api_router.include_router(destinations_router)
 api_router.include_router(flights_router)
 api_router.include_router(expenses_router)
+api_router.include_router(events_router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    if not METRICS_ENABLED:
+        return PlainTextResponse("", status_code=404)
+    return PlainTextResponse(render_metrics(database.pool_stats.snapshot()), media_type=PROMETHEUS_MEDIA_TYPE)
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Configure logging
@@ -55,8 +134,4 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from models import User
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "10000"))
+
+class SessionCache:
+    """Bounded TTL/LRU cache of session token -> resolved User.
+
+    Entries never outlive the session's own expiresAt. Invalidations are
+    forwarded to registered listeners so other workers can be told to drop
+    the same token (see add_invalidation_listener).
+    """
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = SESSION_CACHE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._listeners: List[Callable[[str], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, session_token: str) -> Optional[User]:
+        """Return the cached user for a token, or None on miss/expiry"""
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        deadline, user = entry
+        if deadline <= self._clock():
+            del self._entries[session_token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user
+
+    def set(self, session_token: str, user: User, expires_at: datetime):
+        """Cache a resolved user until the TTL or the session expiry, whichever is first"""
+        if not self.enabled:
+            return
+
+        if expires_at.tzinfo is None:
+            # Mongo hands back naive datetimes that are implicitly UTC
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return
+
+        self._entries[session_token] = (self._clock() + min(self.ttl_seconds, remaining), user)
+        self._entries.move_to_end(session_token)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_token: str, broadcast: bool = True):
+        """Drop a token locally and, unless applying a remote message, notify listeners"""
+        self._entries.pop(session_token, None)
+
+        if broadcast:
+            for listener in self._listeners:
+                try:
+                    listener(session_token)
+                except Exception as e:
+                    logger.error(f"Session invalidation listener failed: {e}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]):
+        """Register a callback invoked with every locally invalidated token.
+
+        Multi-worker deployments use this to publish the token to the other
+        workers, which apply it with invalidate(token, broadcast=False).
+        """
+        self._listeners.append(listener)
+
+    def remove_invalidation_listener(self, listener: Callable[[str], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+session_cache = SessionCache()
@@ -0,0 +1,218 @@
+import os
+import hmac
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from session_cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+# database: opaque tokens looked up in `sessions`; signed: self-contained HMAC tokens
+SESSION_MODE = os.environ.get("SESSION_MODE", "database")
+# "kid:secret,kid:secret"; the first key signs, the rest only verify (rotation)
+SESSION_SIGNING_KEYS = os.environ.get("SESSION_SIGNING_KEYS", "")
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+SESSION_DENYLIST_REFRESH_SECONDS = float(os.environ.get("SESSION_DENYLIST_REFRESH_SECONDS", "30"))
+
+REVOCATIONS_COLLECTION = "session_revocations"
+TOKEN_VERSION = "s1"
+
+class SignedSession(NamedTuple):
+    user_id: str
+    issued_at: int
+    expires_at: int
+    token_id: str
+
+    @property
+    def expires(self) -> datetime:
+        return datetime.fromtimestamp(self.expires_at, timezone.utc)
+
+def parse_keys(spec: str) -> Dict[str, bytes]:
+    """Signing keys by key id, in configuration order"""
+    keys: Dict[str, bytes] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        kid, sep, secret = entry.partition(":")
+        if not sep or not kid or not secret or "." in kid:
+            raise ValueError(f"Malformed SESSION_SIGNING_KEYS entry for key id {kid!r}")
+        keys[kid] = secret.encode()
+    return keys
+
+def _signature(key: bytes, body: str) -> str:
+    digest = hmac.new(key, body.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+class SessionSigner:
+    """Issues and verifies s1.<kid>.<user>.<iat>.<exp>.<jti>.<hmac> tokens.
+
+    Verification is pure CPU: the key is picked by kid, the HMAC compared
+    in constant time, then the expiry checked. Rotate by putting a new key
+    first in SESSION_SIGNING_KEYS and dropping the old one once every token
+    it signed has expired.
+    """
+
+    def __init__(self, keys: Dict[str, bytes], ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.keys = keys
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    @staticmethod
+    def is_signed(token: str) -> bool:
+        return token.startswith(TOKEN_VERSION + ".")
+
+    def issue(self, user_id: str) -> Tuple[str, datetime]:
+        kid, key = next(iter(self.keys.items()))
+        issued_at = int(time.time())
+        expires_at = issued_at + self.ttl_seconds
+        body = f"{TOKEN_VERSION}.{kid}.{user_id}.{issued_at}.{expires_at}.{secrets.token_urlsafe(12)}"
+        return f"{body}.{_signature(key, body)}", datetime.fromtimestamp(expires_at, timezone.utc)
+
+    def verify(self, token: str) -> Optional[SignedSession]:
+        """Claims of a well-signed, unexpired token; None for anything else"""
+        parts = token.split(".")
+        if len(parts) != 7 or parts[0] != TOKEN_VERSION:
+            return None
+        key = self.keys.get(parts[1])
+        if key is None:
+            return None
+
+        body, signature = token.rpartition(".")[::2]
+        if not hmac.compare_digest(_signature(key, body), signature):
+            return None
+        try:
+            issued_at, expires_at = int(parts[3]), int(parts[4])
+        except ValueError:
+            return None
+        if expires_at <= time.time():
+            return None
+        return SignedSession(parts[2], issued_at, expires_at, parts[5])
+
+class SessionDenylist:
+    """Revoked signed sessions, held in memory and refreshed from MongoDB.
+
+    Two kinds of entries, both kept only until the tokens they cover have
+    expired (a TTL index prunes the collection): single token ids from
+    logout, and per-user cutoffs from a forced sign-out, which reject
+    every token issued before them. Revocations apply locally at once and
+    reach other workers within one refresh interval.
+    """
+
+    def __init__(self, refresh_seconds: float = SESSION_DENYLIST_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._token_ids: Dict[str, int] = {}
+        self._user_cutoffs: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def is_revoked(self, session: SignedSession) -> bool:
+        return session.token_id in self._token_ids or session.issued_at < self._user_cutoffs.get(session.user_id, 0)
+
+    async def revoke_session(self, db: AsyncIOMotorDatabase, session: SignedSession):
+        self._token_ids[session.token_id] = session.expires_at
+        await db[REVOCATIONS_COLLECTION].update_one(
+            {"_id": f"token:{session.token_id}"},
+            {"$set": {"tokenId": session.token_id, "expiresAt": session.expires}},
+            upsert=True
+        )
+
+    async def revoke_user(self, db: AsyncIOMotorDatabase, user_id: str, ttl_seconds: int = SESSION_TTL_SECONDS):
+        """Reject every token the user holds now; tokens issued from the next second on still work"""
+        cutoff = int(time.time()) + 1
+        self._user_cutoffs[user_id] = max(cutoff, self._user_cutoffs.get(user_id, 0))
+        await db[REVOCATIONS_COLLECTION].update_one(
+            {"_id": f"user:{user_id}"},
+            {"$max": {"before": cutoff, "expiresAt": datetime.fromtimestamp(cutoff + ttl_seconds, timezone.utc)},
+             "$set": {"userId": user_id}},
+            upsert=True
+        )
+
+    async def refresh(self, db: AsyncIOMotorDatabase):
+        """Merge in other workers' revocations and drop entries whose tokens have expired.
+
+        Revocations are never undone, so merging (rather than replacing) can
+        not lose one made here while the query was in flight.
+        """
+        now = datetime.now(timezone.utc)
+        loaded_tokens: Dict[str, int] = {}
+        loaded_users: Dict[str, int] = {}
+        # The TTL monitor runs about once a minute, so skip entries it has not removed yet
+        async for entry in db[REVOCATIONS_COLLECTION].find({"expiresAt": {"$gt": now}}):
+            if "tokenId" in entry:
+                loaded_tokens[entry["tokenId"]] = int(entry["expiresAt"].replace(tzinfo=timezone.utc).timestamp())
+            elif "userId" in entry:
+                loaded_users[entry["userId"]] = entry["before"]
+
+        # No awaits from here on, so nothing revoked locally can slip in between
+        horizon = now.timestamp()
+        token_ids = {token_id: expires_at for token_id, expires_at in self._token_ids.items() if expires_at > horizon}
+        token_ids.update(loaded_tokens)
+        user_cutoffs = {user_id: before for user_id, before in self._user_cutoffs.items() if before + SESSION_TTL_SECONDS > horizon}
+        for user_id, before in loaded_users.items():
+            user_cutoffs[user_id] = max(before, user_cutoffs.get(user_id, 0))
+        self._token_ids, self._user_cutoffs = token_ids, user_cutoffs
+        self.refreshes += 1
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        if self._task is None:
+            await self.refresh(db)
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                # Keep the last good lists; revocations made here are already applied
+                self.refresh_failures += 1
+                logger.error(f"Refreshing the session denylist failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "revokedTokens": len(self._token_ids),
+            "revokedUsers": len(self._user_cutoffs),
+            "refreshes": self.refreshes,
+            "refreshFailures": self.refresh_failures,
+        }
+
+session_signer = SessionSigner(parse_keys(SESSION_SIGNING_KEYS))
+session_denylist = SessionDenylist()
+
+if SESSION_MODE == "signed" and not session_signer.enabled:
+    raise RuntimeError("SESSION_MODE=signed needs SESSION_SIGNING_KEYS")
+
+async def revoke_user_sessions(db: AsyncIOMotorDatabase, user_ids: List[str]) -> int:
+    """Forced sign-out: cut off signed tokens and delete database sessions.
+
+    Deleted tokens are invalidated in this process's session cache, which
+    forwards them to any invalidation listeners. Without a listener, other
+    workers keep serving a cached session for up to SESSION_CACHE_TTL_SECONDS,
+    and signed tokens stay valid until the next denylist refresh
+    (SESSION_DENYLIST_REFRESH_SECONDS).
+    """
+    for user_id in user_ids:
+        await session_denylist.revoke_user(db, user_id)
+    query = {"userId": {"$in": user_ids}}
+    tokens = [session["sessionToken"] async for session in db.sessions.find(query, {"sessionToken": 1})]
+    result = await db.sessions.delete_many(query)
+    for token in tokens:
+        session_cache.invalidate(token)
+    return result.deleted_count
@@ -0,0 +1,157 @@
+"""Per-day schedule of a trip's destinations with travel times and conflicts"""
+import os
+import re
+from typing import Dict, List, Optional
+import numpy as np
+from models import TimelineDay, TimelineStop
+from routing import haversine_km
+
+class SpeedModel:
+    """Door-to-door travel time from straight-line distance.
+
+    Straight lines are stretched by a detour factor; short hops are walked,
+    longer ones use the ride speed, and every ride pays a fixed overhead
+    (parking, waiting for transit).
+    """
+
+    def __init__(self, walk_kmh: float, walk_max_km: float, ride_kmh: float,
+                 ride_overhead_minutes: float = 0.0, detour_factor: float = 1.3):
+        self.walk_kmh = walk_kmh
+        self.walk_max_km = walk_max_km
+        self.ride_kmh = ride_kmh
+        self.ride_overhead_minutes = ride_overhead_minutes
+        self.detour_factor = detour_factor
+
+    def travel_minutes(self, distance_km: np.ndarray) -> np.ndarray:
+        route_km = distance_km * self.detour_factor
+        walk = route_km / self.walk_kmh * 60
+        ride = route_km / self.ride_kmh * 60 + self.ride_overhead_minutes
+        return np.where(route_km <= self.walk_max_km, walk, ride)
+
+def _env(name: str, default: str) -> float:
+    return float(os.environ.get(name, default))
+
+SPEED_MODELS: Dict[str, SpeedModel] = {
+    # Walk short hops, take transit or a taxi for the rest
+    "auto": SpeedModel(
+        walk_kmh=_env("TIMELINE_WALK_KMH", "4.5"),
+        walk_max_km=_env("TIMELINE_WALK_MAX_KM", "1.5"),
+        ride_kmh=_env("TIMELINE_RIDE_KMH", "25"),
+        ride_overhead_minutes=_env("TIMELINE_RIDE_OVERHEAD_MINUTES", "10"),
+        detour_factor=_env("TIMELINE_DETOUR_FACTOR", "1.3"),
+    ),
+    "walk": SpeedModel(
+        walk_kmh=_env("TIMELINE_WALK_KMH", "4.5"),
+        walk_max_km=float("inf"),
+        ride_kmh=1.0,
+        detour_factor=_env("TIMELINE_DETOUR_FACTOR", "1.3"),
+    ),
+    "drive": SpeedModel(
+        walk_kmh=1.0,
+        walk_max_km=0.0,
+        ride_kmh=_env("TIMELINE_DRIVE_KMH", "40"),
+        ride_overhead_minutes=_env("TIMELINE_DRIVE_OVERHEAD_MINUTES", "5"),
+        detour_factor=_env("TIMELINE_DETOUR_FACTOR", "1.3"),
+    ),
+}
+
+_TIME_PATTERN = re.compile(r"^\s*(\d{1,2})(?:\s*[:.h]\s*(\d{2}))?\s*(?:([ap])\.?\s*m?\.?)?\s*$", re.IGNORECASE)
+
+def parse_time(text: Optional[str]) -> Optional[int]:
+    """Minutes after midnight for "14:30", "2:30 PM", "9am", "14h30"; None if unrecognised"""
+    match = _TIME_PATTERN.match(text or "")
+    if not match:
+        return None
+
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = (match.group(3) or "").lower()
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+def format_minutes(minutes: int) -> str:
+    """HH:MM, with +Nd for stops that run past midnight"""
+    days, minutes = divmod(int(minutes), 24 * 60)
+    clock = f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return f"{clock}+{days}d" if days else clock
+
+def build_day(day: int, stops: List[dict], speed: SpeedModel) -> TimelineDay:
+    """Annotate one day's stops in time order.
+
+    Stops are sorted by parsed start time (unparseable times last, by their
+    manual order). A single sweep tracks the latest end seen so far, so a
+    stop overlapping any earlier stop is flagged, not just its neighbour.
+    """
+    starts = [parse_time(stop.get("time")) for stop in stops]
+    sequence = sorted(range(len(stops)), key=lambda i: (starts[i] is None, starts[i] or 0, stops[i].get("order", 0)))
+    stops = [stops[i] for i in sequence]
+    starts = [starts[i] for i in sequence]
+
+    # Legs between consecutive stops, all at once
+    lat = np.array([stop["lat"] for stop in stops], dtype=float)
+    lng = np.array([stop["lng"] for stop in stops], dtype=float)
+    leg_km = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    leg_minutes = speed.travel_minutes(leg_km)
+    # Travel time from stop 0 to each stop, for legs spanning several stops
+    reach_minutes = np.concatenate(([0.0], np.cumsum(leg_minutes)))
+
+    annotated = []
+    conflicts = 0
+    latest_end: Optional[int] = None
+    latest_id: Optional[str] = None
+    previous_end: Optional[int] = None
+    previous_index: Optional[int] = None
+    for i, (stop, start) in enumerate(zip(stops, starts)):
+        stop_id = str(stop["_id"])
+        duration = int(stop.get("duration") or 0)
+        end = start + duration if start is not None else None
+        travel = float(leg_minutes[i - 1]) if i else None
+
+        gap = overlaps_with = None
+        unreachable = False
+        if start is not None and previous_end is not None:
+            gap = start - previous_end
+            # The gap runs from the last stop with a time, so is the travel via any untimed stops between
+            unreachable = gap >= 0 and gap < float(reach_minutes[i] - reach_minutes[previous_index])
+        if start is not None and latest_end is not None and start < latest_end:
+            overlaps_with = latest_id
+        if overlaps_with or unreachable:
+            conflicts += 1
+
+        annotated.append(TimelineStop(
+            id=stop_id,
+            name=stop.get("name", ""),
+            time=stop.get("time"),
+            start=format_minutes(start) if start is not None else None,
+            end=format_minutes(end) if end is not None else None,
+            durationMinutes=duration,
+            distanceFromPreviousKm=round(float(leg_km[i - 1]), 3) if i else None,
+            travelMinutesFromPrevious=round(travel, 1) if travel is not None else None,
+            gapMinutes=gap,
+            overlapsWith=overlaps_with,
+            unreachable=unreachable,
+        ))
+
+        if end is not None:
+            previous_end, previous_index = end, i
+            if latest_end is None or end > latest_end:
+                latest_end, latest_id = end, stop_id
+
+    return TimelineDay(
+        day=day,
+        stops=annotated,
+        totalDistanceKm=round(float(leg_km.sum()), 3),
+        totalTravelMinutes=round(float(leg_minutes.sum()), 1),
+        conflicts=conflicts,
+    )
+
+def build_timeline(stops: List[dict], speed: SpeedModel) -> List[TimelineDay]:
+    """Group a trip's destinations by day and annotate each day"""
+    days: Dict[int, List[dict]] = {}
+    for stop in stops:
+        days.setdefault(stop["day"], []).append(stop)
+    return [build_day(day, days[day], speed) for day in sorted(days)]
@@ -0,0 +1,412 @@
+"""Streaming trip export (JSON lines, CSV, iCalendar) and import (JSON lines, CSV).
+
+Export reads each child collection through a Motor cursor in batches and
+yields encoded chunks as it goes, so memory stays flat however large the
+trip is. Import parses the request body as it arrives, one line (or CSV
+record) at a time, and writes validated rows in insert_many batches; the
+trip's counters, spent total and flight schedule are updated once at the
+end, for whatever was written.
+"""
+import os
+import csv
+import io
+import asyncio
+import json
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models import (
+    DestinationBase, DestinationCreate, ExpenseBase, ExpenseCreate, FlightBase, FlightCreate,
+    TripImportError, TripImportResponse, TripResponse, TripSummary
+)
+from destinations import DESTINATION_PROJECTION, DESTINATION_SORT, destination_from_doc
+from flights import FLIGHT_PROJECTION, FLIGHT_SORT, flight_from_doc
+from expenses import EXPENSE_PROJECTION, EXPENSE_SORT, expense_from_doc
+from geo import set_location
+from pagination import NDJSON_MEDIA_TYPE
+from reaper import bump_child_version
+from timeline import parse_time
+from trip_summary import count_inc, schedule_entry, schedule_update
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Lines are gathered into chunks of about this size before each send
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", "65536"))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "200000"))
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("IMPORT_MAX_LINE_BYTES", "1048576"))
+IMPORT_MAX_ERRORS = 50
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+ICS_MEDIA_TYPE = "text/calendar; charset=utf-8"
+EXPORT_FORMATS = {"jsonl": NDJSON_MEDIA_TYPE, "csv": CSV_MEDIA_TYPE, "ics": ICS_MEDIA_TYPE}
+IMPORT_FORMATS = ("jsonl", "csv")
+
+# kind -> (collection, projection, sort, document -> response model)
+EXPORT_SECTIONS = {
+    "destination": ("destinations", DESTINATION_PROJECTION, DESTINATION_SORT, destination_from_doc),
+    "flight": ("flights", FLIGHT_PROJECTION, FLIGHT_SORT, flight_from_doc),
+    "expense": ("expenses", EXPENSE_PROJECTION, EXPENSE_SORT, expense_from_doc),
+}
+# kind -> (collection, model an imported row is validated against)
+IMPORT_KINDS = {
+    "destination": ("destinations", DestinationCreate),
+    "flight": ("flights", FlightCreate),
+    "expense": ("expenses", ExpenseCreate),
+}
+
+def _columns() -> List[str]:
+    """kind and id, then the union of the child models' fields in declaration order"""
+    columns = ["kind", "id"]
+    for model in (DestinationBase, FlightBase, ExpenseBase):
+        for name, field in model.model_fields.items():
+            column = field.alias or name
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+CSV_COLUMNS = _columns()
+
+async def _documents(db: AsyncIOMotorDatabase, trip_id: str, kind: str) -> AsyncIterator[BaseModel]:
+    collection, projection, sort, convert = EXPORT_SECTIONS[kind]
+    cursor = db[collection].find({"tripId": trip_id}, projection).sort(sort).batch_size(EXPORT_BATCH_SIZE)
+    async for doc in cursor:
+        yield convert(doc)
+
+async def _chunked(pieces: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Coalesce small pieces so each send carries about EXPORT_CHUNK_BYTES"""
+    buffer: List[bytes] = []
+    size = 0
+    async for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def _tagged_json(kind: str, model: BaseModel) -> bytes:
+    # The model's own JSON with the kind spliced in as the first key
+    return b'{"kind":"' + kind.encode() + b'",' + model.model_dump_json(by_alias=True)[1:].encode() + b"\n"
+
+async def _jsonl(db: AsyncIOMotorDatabase, trip: TripResponse) -> AsyncIterator[bytes]:
+    yield _tagged_json("trip", trip)
+    for kind in EXPORT_SECTIONS:
+        async for item in _documents(db, trip.id, kind):
+            yield _tagged_json(kind, item)
+
+def _csv_line(values: Iterable) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\r\n").writerow(values)
+    return out.getvalue().encode()
+
+async def _csv(db: AsyncIOMotorDatabase, trip: TripResponse) -> AsyncIterator[bytes]:
+    yield _csv_line(CSV_COLUMNS)
+    for kind in EXPORT_SECTIONS:
+        async for item in _documents(db, trip.id, kind):
+            fields = item.model_dump(mode="json", by_alias=True)
+            fields["kind"] = kind
+            fields["id"] = fields.pop("_id", None)
+            yield _csv_line("" if fields.get(column) is None else fields[column] for column in CSV_COLUMNS)
+
+def _ics_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+def _ics_line(name: str, value: str) -> bytes:
+    """One content line, folded at 75 octets without splitting a UTF-8 sequence"""
+    data = f"{name}:{value}".encode()
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+def _ics_times(day: date, start_text: Optional[str], end_minutes: Callable[[int], Optional[int]]) -> List[Tuple[str, str]]:
+    """DTSTART/DTEND as floating local times, or an all-day entry when the time is not understood"""
+    start = parse_time(start_text)
+    if start is None:
+        return [("DTSTART;VALUE=DATE", day.strftime("%Y%m%d")), ("DTEND;VALUE=DATE", (day + timedelta(days=1)).strftime("%Y%m%d"))]
+    begin = datetime.combine(day, time()) + timedelta(minutes=start)
+    end = end_minutes(start)
+    finish = datetime.combine(day, time()) + timedelta(minutes=end) if end is not None else begin
+    return [("DTSTART", begin.strftime("%Y%m%dT%H%M%S")), ("DTEND", finish.strftime("%Y%m%dT%H%M%S"))]
+
+def _ics_event(uid: str, stamp: str, times: List[Tuple[str, str]], summary: str, location: str, description: str) -> bytes:
+    lines = [("BEGIN", "VEVENT"), ("UID", f"{uid}@tripnext"), ("DTSTAMP", stamp), *times, ("SUMMARY", _ics_text(summary))]
+    if location:
+        lines.append(("LOCATION", _ics_text(location)))
+    if description:
+        lines.append(("DESCRIPTION", _ics_text(description)))
+    lines.append(("END", "VEVENT"))
+    return b"".join(_ics_line(name, value) for name, value in lines)
+
+async def _ics(db: AsyncIOMotorDatabase, trip: TripResponse) -> AsyncIterator[bytes]:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield b"".join(_ics_line(name, value) for name, value in [
+        ("BEGIN", "VCALENDAR"), ("VERSION", "2.0"), ("PRODID", "-//TripNext//Trip export//EN"),
+        ("CALSCALE", "GREGORIAN"), ("X-WR-CALNAME", _ics_text(trip.name)),
+    ])
+
+    async for flight in _documents(db, trip.id, "flight"):
+        arrive = parse_time(flight.arriveTime)
+        # An arrival earlier than the departure lands the next day
+        times = _ics_times(flight.date.date(), flight.departTime, lambda start: None if arrive is None else arrive + (24 * 60 if arrive < start else 0))
+        details = [f"Terminal {flight.terminal}" if flight.terminal else "", f"Gate {flight.gate}" if flight.gate else "",
+                   f"Confirmation {flight.confirmation}" if flight.confirmation else "", flight.status]
+        yield _ics_event(str(flight.id), stamp, times, f"{flight.airline} {flight.flightNumber} {flight.from_} → {flight.to}",
+                         flight.from_, " · ".join(filter(None, details)))
+
+    # Itinerary stops are placed by day number, which needs the trip's start date
+    if trip.startDate:
+        first_day = datetime.fromisoformat(trip.startDate).date()
+        async for dest in _documents(db, trip.id, "destination"):
+            day = first_day + timedelta(days=dest.day - 1)
+            times = _ics_times(day, dest.time, lambda start: start + dest.duration)
+            yield _ics_event(str(dest.id), stamp, times, dest.name, dest.address, dest.notes or "")
+
+    yield _ics_line("END", "VCALENDAR")
+
+EXPORTERS = {"jsonl": _jsonl, "csv": _csv, "ics": _ics}
+
+def export_chunks(db: AsyncIOMotorDatabase, trip: TripResponse, format: str) -> AsyncIterator[bytes]:
+    return _chunked(EXPORTERS[format](db, trip))
+
+def export_response(db: AsyncIOMotorDatabase, trip: TripResponse, format: str) -> StreamingResponse:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    headers = {"Content-Disposition": f'attachment; filename="trip-{trip.id}.{format}"'}
+    return StreamingResponse(export_chunks(db, trip, format), media_type=EXPORT_FORMATS[format], headers=headers)
+
+def import_format(format: Optional[str], content_type: str) -> str:
+    """Explicit ?format=, else guessed from the Content-Type (JSON lines by default)"""
+    format = format or ("csv" if content_type.startswith("text/csv") else "jsonl")
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported import format: {format}")
+    return format
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered text lines as the body arrives; only the unfinished last line is buffered"""
+    pending = b""
+    number = 0
+    async for chunk in body:
+        pending += chunk
+        if b"\n" in chunk:
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                number += 1
+                yield number, _decode(line, number)
+        if len(pending) > IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Lines are limited to {IMPORT_MAX_LINE_BYTES} bytes")
+    if pending:
+        yield number + 1, _decode(pending, number + 1)
+
+def _decode(line: bytes, number: int) -> str:
+    try:
+        text = line.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"Line {number} is not valid UTF-8")
+    if number == 1:
+        text = text.lstrip("\ufeff")
+    return text.rstrip("\r")
+
+async def _jsonl_rows(lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Tuple[int, object]]:
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, f"Invalid JSON: {e}"
+
+async def _csv_rows(lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Tuple[int, object]]:
+    """Rows keyed by the header; a quoted field may span lines, so a record
+    ends at the first line break outside quotes (an even quote count)"""
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    size = quotes = start = 0
+    async for number, line in lines:
+        if not record:
+            start = number
+        record.append(line)
+        size += len(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if size > IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Records are limited to {IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+
+        text = "\n".join(record)
+        record, size, quotes = [], 0, 0
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, f"Invalid CSV: {e}"
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        yield start, {column: value for column, value in zip(header, values) if value != ""}
+
+    if record:
+        yield start, "Invalid CSV: unterminated quoted field"
+
+ROW_PARSERS = {"jsonl": _jsonl_rows, "csv": _csv_rows}
+
+def _validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+class TripImport:
+    """Validates rows, buffers them per collection and writes each full buffer with insert_many"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, trip_id: str, user_id: str):
+        self.db = db
+        self.trip_id = trip_id
+        self.user_id = user_id
+        # collection -> (line number, document) waiting for the next insert_many
+        self.pending: Dict[str, List[Tuple[int, dict]]] = {collection: [] for collection, _ in IMPORT_KINDS.values()}
+        self.inserted: Dict[str, int] = {collection: 0 for collection in self.pending}
+        self.spent = 0.0
+        self.schedule: List[dict] = []
+        self.rows = 0
+        self.rejected = 0
+        self.errors: List[TripImportError] = []
+
+    def reject(self, line: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(TripImportError(line=line, error=error))
+
+    def document(self, kind: str, fields: dict) -> dict:
+        """Storage document for a validated row; the row's own ids and timestamps are not kept"""
+        collection, model = IMPORT_KINDS[kind]
+        doc = model(**fields).dict()
+        if collection == "destinations":
+            doc = set_location(doc)
+        elif collection == "expenses":
+            doc["paidBy"] = doc["paidBy"] or self.user_id
+        now = datetime.now(timezone.utc)
+        # Assigned here so a failed batch can be checked for what landed
+        doc["_id"] = ObjectId()
+        doc["tripId"] = self.trip_id
+        doc["createdAt"] = now
+        doc["updatedAt"] = now
+        return doc
+
+    async def add(self, line: int, row: object):
+        if isinstance(row, str):
+            self.reject(line, row)
+            return
+        if not isinstance(row, dict):
+            self.reject(line, "Expected an object")
+            return
+
+        kind = row.get("kind")
+        if kind == "trip":
+            # The trip line of a JSON lines export; the target trip keeps its own details
+            return
+        if kind not in IMPORT_KINDS:
+            self.reject(line, f"Unknown kind: {kind}")
+            return
+
+        self.rows += 1
+        if self.rows > IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Imports are limited to {IMPORT_MAX_ROWS} rows")
+        try:
+            doc = self.document(kind, row)
+        except ValidationError as e:
+            self.reject(line, _validation_message(e))
+            return
+
+        collection = IMPORT_KINDS[kind][0]
+        self.pending[collection].append((line, doc))
+        if len(self.pending[collection]) >= IMPORT_BATCH_SIZE:
+            await self.flush(collection)
+
+    async def flush(self, collection: str):
+        batch = self.pending[collection]
+        if not batch:
+            return
+        self.pending[collection] = []
+        failed: Dict[int, str] = {}
+        try:
+            await self.db[collection].insert_many([doc for _, doc in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything but the failed indexes was inserted (nInserted of them)
+            failed = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+        except PyMongoError as e:
+            # A network error or timeout may still have written part of the batch
+            try:
+                landed = {doc["_id"] async for doc in self.db[collection].find({"_id": {"$in": [doc["_id"] for _, doc in batch]}}, {"_id": 1})}
+            except PyMongoError:
+                logger.error(f"Import on trip {self.trip_id} lost track of a {collection} batch; run manage.py rebuild-summaries and reconcile-spent for it")
+                raise
+            failed = {index: str(e) or "Write failed" for index, (_, doc) in enumerate(batch) if doc["_id"] not in landed}
+        for index, error in failed.items():
+            self.reject(batch[index][0], error)
+
+        docs = [doc for index, (_, doc) in enumerate(batch) if index not in failed]
+        self.inserted[collection] += len(docs)
+        if collection == "expenses":
+            self.spent += sum(doc["amount"] for doc in docs)
+        elif collection == "flights":
+            # Keep only what the schedule needs
+            self.schedule += [{"_id": doc["_id"], **schedule_entry(doc)} for doc in docs]
+
+    async def record(self) -> Optional[int]:
+        """Fold what was written into the trip in one version bump; None if nothing was"""
+        if not any(self.inserted.values()):
+            return None
+        inc = {"spent": self.spent} if self.spent else {}
+        for collection, count in self.inserted.items():
+            inc.update(count_inc(collection, count))
+        return await bump_child_version(self.db, self.trip_id, inc=inc, update=schedule_update(self.schedule))
+
+    def response(self, version: Optional[int]) -> TripImportResponse:
+        return TripImportResponse(version=version, inserted=TripSummary(**self.inserted), rejected=self.rejected, errors=self.errors)
+
+async def _record_failed(job: TripImport):
+    try:
+        await job.record()
+    except Exception as e:
+        logger.error(f"Recording a failed import on trip {job.trip_id} failed too: {e}")
+
+async def import_rows(db: AsyncIOMotorDatabase, trip_id: str, user_id: str, body: AsyncIterator[bytes], format: str) -> TripImportResponse:
+    """Parse and write the body incrementally.
+
+    Bad rows are reported and skipped. If the stream fails part way (a
+    malformed line, a size limit, a dropped connection) the batches already
+    written stay, and the trip is still updated to account for them.
+    """
+    job = TripImport(db, trip_id, user_id)
+    try:
+        async for line, row in ROW_PARSERS[format](_lines(body)):
+            await job.add(line, row)
+        for collection in job.pending:
+            await job.flush(collection)
+    except Exception:
+        # Account for the written batches, but let the caller see the original error
+        await _record_failed(job)
+        raise
+    except asyncio.CancelledError:
+        # The client went away; the accounting must still finish
+        await asyncio.shield(_record_failed(job))
+        raise
+    return job.response(await job.record())
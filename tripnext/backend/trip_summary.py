@@ -0,0 +1,141 @@
+"""Per-trip counters and flight schedule kept on the trip document for the dashboard.
+
+Child write handlers fold these into the trip's version bump, so they
+change in the same atomic update as the version. The flight schedule is
+a map of flight id -> departure fields, so creates, edits and deletes
+(including mixed bulk batches) are plain $set/$unset on distinct paths;
+the next flight is picked from it when the trip is read.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models import TripNextFlight, TripSummary
+from revisions import NOT_DELETED, bump_trip_version, trip_key
+from events import publish_change
+
+SUMMARY_FIELD = "summary"
+SCHEDULE_FIELD = "flightSchedule"
+COUNTED = ("destinations", "flights", "expenses")
+
+SCHEDULE_KEYS = ("date", "flightNumber", "from_", "to", "departTime")
+SCHEDULE_PROJECTION = {key: 1 for key in SCHEDULE_KEYS}
+# Tries per trip before a repair gives way to concurrent child writes
+REBUILD_ATTEMPTS = 3
+
+def count_inc(collection: str, delta: int) -> dict:
+    """$inc fragment for a child collection's counter; empty when nothing changed"""
+    return {f"{SUMMARY_FIELD}.{collection}": delta} if delta else {}
+
+def schedule_entry(flight: dict) -> dict:
+    return {key: flight.get(key) for key in SCHEDULE_KEYS}
+
+def schedule_update(written: Iterable[dict] = (), removed_ids: Iterable[str] = ()) -> dict:
+    """$set/$unset for flights written (full documents with _id) and removed"""
+    update = {}
+    sets = {f"{SCHEDULE_FIELD}.{flight['_id']}": schedule_entry(flight) for flight in written}
+    unsets = {f"{SCHEDULE_FIELD}.{flight_id}": "" for flight_id in removed_ids}
+    if sets:
+        update["$set"] = sets
+    if unsets:
+        update["$unset"] = unsets
+    return update
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def next_flight(schedule: Optional[Dict[str, dict]], now: Optional[datetime] = None) -> Optional[TripNextFlight]:
+    """Earliest flight dated today or later (flight dates carry no reliable time of day)"""
+    today = (now or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+    upcoming = [
+        (_as_utc(entry["date"]), entry.get("departTime") or "", flight_id, entry)
+        for flight_id, entry in (schedule or {}).items()
+        if isinstance(entry.get("date"), datetime) and _as_utc(entry["date"]) >= today
+    ]
+    if not upcoming:
+        return None
+    date, _, flight_id, entry = min(upcoming, key=lambda item: item[:3])
+    return TripNextFlight(
+        id=flight_id,
+        date=date,
+        flightNumber=entry.get("flightNumber") or "",
+        **{"from": entry.get("from_") or ""},
+        to=entry.get("to") or "",
+        departTime=entry.get("departTime") or "",
+    )
+
+def summary_from_doc(trip: dict) -> dict:
+    """Response fields for a trip document: counters plus the next flight"""
+    return {
+        "summary": TripSummary(**(trip.get(SUMMARY_FIELD) or {})),
+        "nextFlight": next_flight(trip.get(SCHEDULE_FIELD)),
+    }
+
+async def trip_children_summary(db: AsyncIOMotorDatabase, trip_id: str) -> Tuple[Dict[str, int], Dict[str, dict]]:
+    """Counters and flight schedule of one trip, read from its child collections"""
+    summary = {collection: await db[collection].count_documents({"tripId": trip_id}) for collection in ("destinations", "expenses")}
+    schedule = {str(flight["_id"]): schedule_entry(flight) async for flight in db.flights.find({"tripId": trip_id}, SCHEDULE_PROJECTION)}
+    summary["flights"] = len(schedule)
+    return {collection: summary[collection] for collection in COUNTED}, schedule
+
+async def repair_summary(db: AsyncIOMotorDatabase, trip_id: str) -> Optional[int]:
+    """Reset one trip's counters and schedule from its children; returns the new version, None if nothing was fixed.
+
+    Same scheme as expenses.repair_spent: the fix is a version bump
+    conditioned on the version read before counting, so a child write that
+    lands in between makes it retry instead of being overwritten.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        trip = await db.trips.find_one({"_id": trip_key(trip_id), **NOT_DELETED}, {SUMMARY_FIELD: 1, SCHEDULE_FIELD: 1, "version": 1})
+        if not trip:
+            return None
+        summary, schedule = await trip_children_summary(db, trip_id)
+        if trip.get(SUMMARY_FIELD) == summary and (trip.get(SCHEDULE_FIELD) or {}) == schedule:
+            return None
+        version = await bump_trip_version(
+            db, trip_id,
+            expected_version=trip.get("version", 0),
+            update={"$set": {SUMMARY_FIELD: summary, SCHEDULE_FIELD: schedule}}
+        )
+        if version is not None:
+            await publish_change(trip_id, "trip", "updated", [trip_id], version)
+            return version
+    return None
+
+async def rebuild_summaries(db: AsyncIOMotorDatabase, trip_ids: Optional[List[str]] = None) -> int:
+    """Recompute counters and flight schedules from the child collections.
+
+    One grouping pipeline per child collection finds the trips that
+    drifted; each is then rechecked and fixed on its own with
+    repair_summary. Returns the number of trips whose stored summary changed.
+    """
+    match = {"$match": {"tripId": {"$in": trip_ids}} if trip_ids else {}}
+    counts: Dict[str, Dict[str, int]] = {}
+    for collection in ("destinations", "expenses"):
+        async for row in db[collection].aggregate([match, {"$group": {"_id": "$tripId", "count": {"$sum": 1}}}]):
+            counts.setdefault(row["_id"], {})[collection] = row["count"]
+
+    schedules: Dict[str, Dict[str, dict]] = {}
+    async for row in db.flights.aggregate([
+        match,
+        {"$group": {"_id": "$tripId", "count": {"$sum": 1}, "flights": {"$push": {
+            "id": {"$toString": "$_id"}, **{key: f"${key}" for key in SCHEDULE_KEYS}
+        }}}}
+    ]):
+        counts.setdefault(row["_id"], {})["flights"] = row["count"]
+        schedules[row["_id"]] = {flight.pop("id"): flight for flight in row["flights"]}
+
+    trip_filter = {"_id": {"$in": [trip_key(t) for t in trip_ids]}} if trip_ids else {}
+    trip_filter.update(NOT_DELETED)
+    candidates = []
+    async for trip in db.trips.find(trip_filter, {SUMMARY_FIELD: 1, SCHEDULE_FIELD: 1}):
+        key = str(trip["_id"])
+        summary = {collection: counts.get(key, {}).get(collection, 0) for collection in COUNTED}
+        if trip.get(SUMMARY_FIELD) != summary or (trip.get(SCHEDULE_FIELD) or {}) != schedules.get(key, {}):
+            candidates.append(key)
+
+    changed = 0
+    for trip_id in candidates:
+        if await repair_summary(db, trip_id) is not None:
+            changed += 1
+
+    return changed
@@ -1,41 +1,112 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import List, Optional
 from datetime import datetime, timezone
+import asyncio
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import Trip, TripCreate, TripResponse, User, Collaborator
+from pymongo import ReturnDocument
+from models import Trip, TripCreate, TripResponse, TripBundleResponse, TripImportResponse, User, Collaborator
 from auth import get_current_user
 from database import get_database
+from destinations import list_destinations
+from flights import list_flights
+from expenses import list_expenses
+from access import ACCESS_PROJECTION, NOT_DELETED, TripAccess, invalidate_trip_access, member_query
+from reaper import trip_reaper
+from transfer import export_response, import_format, import_rows
+from events import publish_change
+from trip_summary import COUNTED, SCHEDULE_FIELD, SUMMARY_FIELD, summary_from_doc
+from pagination import MAX_PAGE_SIZE, fetch_page, next_cursor_headers, stream_ndjson, wants_ndjson
+from serialization import model_list_response, model_response, projection_for
+from conditional import etag_headers, is_not_modified, make_etag, not_modified, trips_state
 
 trips_router = APIRouter(prefix="/trips", tags=["trips"])
 
+BUNDLE_SECTIONS = {
+    "destinations": list_destinations,
+    "flights": list_flights,
+    "expenses": list_expenses,
+}
+
+# Response fields plus userId for the access check and the schedule nextFlight is picked from
+TRIP_PROJECTION = projection_for(TripResponse, "userId", SCHEDULE_FIELD)
+TRIP_SORT = [("_id", 1)]
+# Enough to authorize a conditional read and compute its ETag
+TRIP_VERSION_PROJECTION = {**ACCESS_PROJECTION, "version": 1}
+
+def today() -> str:
+    """Part of trip ETags: nextFlight moves on at midnight UTC without a version bump"""
+    return datetime.now(timezone.utc).date().isoformat()
+
+def trip_from_doc(trip: dict) -> TripResponse:
+    """Convert ObjectId to string and format dates"""
+    trip["id"] = str(trip["_id"])
+    if trip.get("startDate"):
+        trip["startDate"] = trip["startDate"].isoformat() if isinstance(trip["startDate"], datetime) else trip["startDate"]
+    if trip.get("endDate"):
+        trip["endDate"] = trip["endDate"].isoformat() if isinstance(trip["endDate"], datetime) else trip["endDate"]
+    trip.update(summary_from_doc(trip))
+    return TripResponse(**trip)
+
+async def find_member_trip(db: AsyncIOMotorDatabase, trip_id: str, user_id: str, projection: dict) -> dict:
+    """Load a live trip the user belongs to, or raise 404/403"""
+    try:
+        trip = await db.trips.find_one({"_id": ObjectId(trip_id), **NOT_DELETED}, projection)
+    except:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    
+    # Check if user has access
+    if TripAccess.from_doc(trip).role_of(user_id) is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return trip
+
+def listing_etag(request: Request, user_id: str, trips: List[dict], next_cursor: Optional[str]) -> str:
+    """ETag of one page of the trip listing, from its (id, version) pairs and next cursor"""
+    return make_etag(request, user_id, trips_state(trips), next_cursor, today())
+
+async def probe_not_modified(db: AsyncIOMotorDatabase, trip_id: str, user_id: str, request: Request) -> Optional[Response]:
+    """Answer a conditional read with 304 after only a projected version lookup"""
+    if not request.headers.get("if-none-match"):
+        return None
+    
+    trip = await find_member_trip(db, trip_id, user_id, TRIP_VERSION_PROJECTION)
+    etag = make_etag(request, trip_id, trip.get("version", 0), today())
+    return not_modified(etag) if is_not_modified(request, etag) else None
+
 @trips_router.get("", response_model=List[TripResponse])
 async def get_trips(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all trips for current user"""
+    """Get trips for current user, paged by limit/after or streamed as NDJSON"""
     user_id = str(current_user.id)
+    query = member_query(user_id)
+    
+    # A page only changes when one of its trips is added, removed or bumped, or
+    # the next cursor moves. Revalidation (and the stream, whose headers go out
+    # before any row) reads just the versions of the page being asked for.
+    if request.headers.get("if-none-match") or wants_ndjson(request):
+        versions, next_cursor = await fetch_page(db.trips, query, TRIP_SORT, limit, after, {"version": 1})
+        etag = listing_etag(request, user_id, versions, next_cursor)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        if wants_ndjson(request):
+            response = stream_ndjson(db.trips, query, TRIP_SORT, trip_from_doc, limit, after, TRIP_PROJECTION)
+            response.headers.update(etag_headers(etag))
+            return response
     
-    # Find trips where user is owner or collaborator
-    trips = await db.trips.find({
-        "$or": [
-            {"userId": user_id},
-            {"collaborators.userId": user_id}
-        ]
-    }).to_list(1000)
-    
-    # Convert ObjectId to string and format dates
-    result = []
-    for trip in trips:
-        trip["id"] = str(trip["_id"])
-        if trip.get("startDate"):
-            trip["startDate"] = trip["startDate"].isoformat() if isinstance(trip["startDate"], datetime) else trip["startDate"]
-        if trip.get("endDate"):
-            trip["endDate"] = trip["endDate"].isoformat() if isinstance(trip["endDate"], datetime) else trip["endDate"]
-        result.append(TripResponse(**trip))
-    
-    return result
+    trips, next_cursor = await fetch_page(db.trips, query, TRIP_SORT, limit, after, TRIP_PROJECTION)
+    etag = listing_etag(request, user_id, trips, next_cursor)
+    
+    return model_list_response(TripResponse, [trip_from_doc(trip) for trip in trips], etag_headers(etag, next_cursor_headers(next_cursor)))
 
 @trips_router.post("", response_model=TripResponse)
 async def create_trip(
@@ -50,6 +121,8 @@ async def create_trip(
     trip_dict = trip_data.dict(exclude={"collaboratorEmails"})
     trip_dict["userId"] = user_id
     trip_dict["spent"] = 0.0
+    trip_dict["version"] = 0
+    trip_dict[SUMMARY_FIELD] = {collection: 0 for collection in COUNTED}
     trip_dict["createdAt"] = datetime.now(timezone.utc)
     trip_dict["updatedAt"] = datetime.now(timezone.utc)
     
@@ -66,6 +139,7 @@ async def create_trip(
     
     result = await db.trips.insert_one(trip_dict)
     trip_dict["id"] = str(result.inserted_id)
+    invalidate_trip_access(trip_dict["id"], [user_id])
     
     # Format dates for response
     if trip_dict.get("startDate"):
@@ -78,34 +152,21 @@ async def create_trip(
 @trips_router.get("/{trip_id}", response_model=TripResponse)
 async def get_trip(
     trip_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get trip by ID"""
     user_id = str(current_user.id)
     
-    try:
-        trip = await db.trips.find_one({"_id": ObjectId(trip_id)})
-    except:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    # Check if user has access
-    has_access = trip["userId"] == user_id or any(
-        c["userId"] == user_id for c in trip.get("collaborators", [])
-    )
-    if not has_access:
-        raise HTTPException(status_code=403, detail="Access denied")
+    unchanged = await probe_not_modified(db, trip_id, user_id, request)
+    if unchanged:
+        return unchanged
     
-    trip["id"] = str(trip["_id"])
-    if trip.get("startDate"):
-        trip["startDate"] = trip["startDate"].isoformat() if isinstance(trip["startDate"], datetime) else trip["startDate"]
-    if trip.get("endDate"):
-        trip["endDate"] = trip["endDate"].isoformat() if isinstance(trip["endDate"], datetime) else trip["endDate"]
+    trip = await find_member_trip(db, trip_id, user_id, TRIP_PROJECTION)
+    etag = make_etag(request, trip_id, trip.get("version", 0), today())
     
-    return TripResponse(**trip)
+    return model_response(trip_from_doc(trip), etag_headers(etag))
 
 @trips_router.put("/{trip_id}", response_model=TripResponse)
 async def update_trip(
@@ -118,39 +179,31 @@ async def update_trip(
     user_id = str(current_user.id)
     
     try:
-        trip = await db.trips.find_one({"_id": ObjectId(trip_id)})
+        trip_oid = ObjectId(trip_id)
     except:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    # Check if user has access
-    has_access = trip["userId"] == user_id or any(
-        c["userId"] == user_id for c in trip.get("collaborators", [])
-    )
-    if not has_access:
-        raise HTTPException(status_code=403, detail="Access denied")
-    
     # Update trip
     update_data = trip_data.dict(exclude={"collaboratorEmails"}, exclude_unset=True)
     update_data["updatedAt"] = datetime.now(timezone.utc)
     
-    await db.trips.update_one(
-        {"_id": ObjectId(trip_id)},
-        {"$set": update_data}
+    # Access check is part of the filter, so a successful edit is one round trip
+    updated_trip = await db.trips.find_one_and_update(
+        {"_id": trip_oid, **member_query(user_id)},
+        {"$set": update_data, "$inc": {"version": 1}},
+        projection=TRIP_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
     
-    # Get updated trip
-    updated_trip = await db.trips.find_one({"_id": ObjectId(trip_id)})
-    updated_trip["id"] = str(updated_trip["_id"])
+    if not updated_trip:
+        if not await db.trips.find_one({"_id": trip_oid, **NOT_DELETED}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Trip not found")
+        raise HTTPException(status_code=403, detail="Access denied")
     
-    if updated_trip.get("startDate"):
-        updated_trip["startDate"] = updated_trip["startDate"].isoformat() if isinstance(updated_trip["startDate"], datetime) else updated_trip["startDate"]
-    if updated_trip.get("endDate"):
-        updated_trip["endDate"] = updated_trip["endDate"].isoformat() if isinstance(updated_trip["endDate"], datetime) else updated_trip["endDate"]
+    invalidate_trip_access(trip_id)
+    await publish_change(trip_id, "trip", "updated", [trip_id], updated_trip.get("version"))
     
-    return TripResponse(**updated_trip)
+    return model_response(trip_from_doc(updated_trip))
 
 @trips_router.delete("/{trip_id}")
 async def delete_trip(
@@ -162,21 +215,94 @@ async def delete_trip(
     user_id = str(current_user.id)
     
     try:
-        trip = await db.trips.find_one({"_id": ObjectId(trip_id)})
+        trip_oid = ObjectId(trip_id)
     except:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
+    # Only owner can delete. The trip is tombstoned and disappears from every
+    # query at once; its children are removed by the background reaper.
+    trip = await db.trips.find_one_and_update(
+        {"_id": trip_oid, "userId": user_id, **NOT_DELETED},
+        {"$set": {"deletedAt": datetime.now(timezone.utc)}},
+        projection=ACCESS_PROJECTION
+    )
     
-    # Only owner can delete
-    if trip["userId"] != user_id:
+    if not trip:
+        if not await db.trips.find_one({"_id": trip_oid, **NOT_DELETED}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Trip not found")
         raise HTTPException(status_code=403, detail="Only owner can delete trip")
     
-    # Delete trip and related data
-    await db.trips.delete_one({"_id": ObjectId(trip_id)})
-    await db.destinations.delete_many({"tripId": trip_id})
-    await db.flights.delete_many({"tripId": trip_id})
-    await db.expenses.delete_many({"tripId": trip_id})
+    access = TripAccess.from_doc(trip)
+    invalidate_trip_access(trip_id, [access.owner_id, *access.members])
+    trip_reaper.schedule(trip_id)
+    await publish_change(trip_id, "trip", "deleted", [trip_id])
+    
+    return {"message": "Trip deleted successfully"}
+
+@trips_router.get("/{trip_id}/bundle", response_model=TripBundleResponse, response_model_exclude_unset=True)
+async def get_trip_bundle(
+    trip_id: str,
+    request: Request,
+    include: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get trip with its destinations, flights and expenses in one call"""
+    user_id = str(current_user.id)
+    
+    # include=destinations,flights limits the child sections; default is all
+    if include:
+        sections = [s.strip() for s in include.split(",") if s.strip()]
+        unknown = [s for s in sections if s not in BUNDLE_SECTIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown include section: {', '.join(unknown)}")
+    else:
+        sections = list(BUNDLE_SECTIONS)
+    
+    unchanged = await probe_not_modified(db, trip_id, user_id, request)
+    if unchanged:
+        return unchanged
+    
+    # Check access once for the whole bundle; the version is read before the children
+    trip = await find_member_trip(db, trip_id, user_id, TRIP_PROJECTION)
+    etag = make_etag(request, trip_id, trip.get("version", 0), today())
+    
+    # Fetch the child collections concurrently
+    pages = await asyncio.gather(*(BUNDLE_SECTIONS[section](db, trip_id) for section in sections))
+    children = {section: items for section, (items, _) in zip(sections, pages)}
+    
+    bundle = TripBundleResponse(trip=trip_from_doc(trip), **children)
+    
+    return model_response(bundle, etag_headers(etag), exclude_unset=True)
+
+@trips_router.get("/{trip_id}/export")
+async def export_trip(
+    trip_id: str,
+    format: str = Query("jsonl"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Download a trip and its children as JSON lines, CSV or an iCalendar file"""
+    trip = await find_member_trip(db, trip_id, str(current_user.id), TRIP_PROJECTION)
+    
+    # Rows are streamed from the cursors as they are read, never held as a whole
+    return export_response(db, trip_from_doc(trip), format)
+
+@trips_router.post("/{trip_id}/import", response_model=TripImportResponse)
+async def import_trip(
+    trip_id: str,
+    request: Request,
+    format: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Add destinations, flights and expenses from a JSON lines or CSV export"""
+    user_id = str(current_user.id)
+    format = import_format(format, request.headers.get("content-type", ""))
+    await find_member_trip(db, trip_id, user_id, ACCESS_PROJECTION)
+    
+    result = await import_rows(db, trip_id, user_id, request.stream(), format)
+    if result.version is not None:
+        await publish_change(trip_id, "trip", "imported", [trip_id], result.version)
     
-    return {"message": "Trip deleted successfully"}
\ No newline at end of file
+    return model_response(result)
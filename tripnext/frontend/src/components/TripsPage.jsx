@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from './ui/button';
 import { Card } from './ui/card';
-import { Plus, Calendar, MapPin, Users, DollarSign, MoreVertical } from 'lucide-react';
+import { Plus, Calendar, MapPin, Users, DollarSign, MoreVertical, Plane } from 'lucide-react';
 import { tripsAPI } from '../services/api';
 import { useToast } from '../hooks/use-toast';
 
@@ -150,6 +150,20 @@ const TripsPage = () => {
                         ({Math.round((trip.spent / trip.budget) * 100)}%)
                       </span>
                     </div>
+
+                    {trip.summary && (
+                      <div className="text-xs text-gray-500">
+                        {trip.summary.destinations} stops · {trip.summary.flights} flights · {trip.summary.expenses} expenses
+                      </div>
+                    )}
+
+                    {trip.nextFlight && (
+                      <div className="flex items-center">
+                        <Plane className="w-4 h-4 mr-2 text-gray-400" />
+                        {trip.nextFlight.flightNumber} {trip.nextFlight.from} → {trip.nextFlight.to},{' '}
+                        {new Date(trip.nextFlight.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' })} {trip.nextFlight.departTime}
+                      </div>
+                    )}
                   </div>
                 </div>
               </Card>
@@ -68,6 +68,11 @@ export const tripsAPI = {
     const response = await api.get(`/trips/${tripId}`);
     return response.data;
   },
+  getBundle: async (tripId, include) => {
+    const params = include ? { include: include.join(',') } : undefined;
+    const response = await api.get(`/trips/${tripId}/bundle`, { params });
+    return response.data;
+  },
   create: async (tripData) => {
     const response = await api.post('/trips', tripData);
     return response.data;
@@ -80,6 +85,17 @@ export const tripsAPI = {
     const response = await api.delete(`/trips/${tripId}`);
     return response.data;
   },
+  // format: jsonl, csv or ics; resolves to a Blob for download
+  export: async (tripId, format = 'jsonl') => {
+    const response = await api.get(`/trips/${tripId}/export`, { params: { format }, responseType: 'blob' });
+    return response.data;
+  },
+  // file: a File from an <input type="file">, sent as the raw request body
+  import: async (tripId, file, format) => {
+    const contentType = (format || (file.name.endsWith('.csv') ? 'csv' : 'jsonl')) === 'csv' ? 'text/csv' : 'application/x-ndjson';
+    const response = await api.post(`/trips/${tripId}/import`, file, { headers: { 'Content-Type': contentType } });
+    return response.data;
+  },
 };
 
 // Destinations API
@@ -100,6 +116,30 @@ export const destinationsAPI = {
     const response = await api.delete(`/destinations/${destinationId}`);
     return response.data;
   },
+  bulk: async (tripId, operations, ordered = true) => {
+    const response = await api.post(`/destinations/trip/${tripId}/bulk`, { operations, ordered });
+    return response.data;
+  },
+  reorder: async (tripId, version, items) => {
+    const response = await api.patch(`/destinations/trip/${tripId}/order`, { version, items });
+    return response.data;
+  },
+  getTimeline: async (tripId, mode = 'auto') => {
+    const response = await api.get(`/destinations/trip/${tripId}/timeline`, { params: { mode } });
+    return response.data;
+  },
+  optimize: async (tripId, options = {}) => {
+    const response = await api.post(`/destinations/trip/${tripId}/optimize`, options);
+    return response.data;
+  },
+  getNear: async (lat, lng, radius, tripId) => {
+    const response = await api.get('/destinations/near', { params: { lat, lng, radius, tripId } });
+    return response.data;
+  },
+  getWithin: async ({ minLat, minLng, maxLat, maxLng }, tripId) => {
+    const response = await api.get('/destinations/within', { params: { minLat, minLng, maxLat, maxLng, tripId } });
+    return response.data;
+  },
 };
 
 // Flights API
@@ -120,6 +160,10 @@ export const flightsAPI = {
     const response = await api.delete(`/flights/${flightId}`);
     return response.data;
   },
+  bulk: async (tripId, operations, ordered = true) => {
+    const response = await api.post(`/flights/trip/${tripId}/bulk`, { operations, ordered });
+    return response.data;
+  },
 };
 
 // Expenses API
@@ -128,6 +172,10 @@ export const expensesAPI = {
     const response = await api.get(`/expenses/trip/${tripId}`);
     return response.data;
   },
+  getSummary: async (tripId) => {
+    const response = await api.get(`/expenses/trip/${tripId}/summary`);
+    return response.data;
+  },
   create: async (tripId, expenseData) => {
     const response = await api.post(`/expenses/trip/${tripId}`, expenseData);
     return response.data;
@@ -140,6 +188,24 @@ export const expensesAPI = {
     const response = await api.delete(`/expenses/${expenseId}`);
     return response.data;
   },
+  bulk: async (tripId, operations, ordered = true) => {
+    const response = await api.post(`/expenses/trip/${tripId}/bulk`, { operations, ordered });
+    return response.data;
+  },
+};
+
+// Live trip changes (server-sent events, authenticated by the session cookie)
+export const eventsAPI = {
+  subscribe: (tripId, onEvent, onReady) => {
+    const source = new EventSource(`${API_BASE}/events/trip/${tripId}`, { withCredentials: true });
+    if (onReady) {
+      source.addEventListener('ready', (e) => onReady(JSON.parse(e.data)));
+    }
+    source.onmessage = (e) => onEvent(JSON.parse(e.data));
+    // Sent when the user lost access to the trip; the server has closed the stream
+    source.addEventListener('revoked', () => source.close());
+    return () => source.close();
+  },
 };
 
 export default api;
\ No newline at end of file
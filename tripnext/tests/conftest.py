@@ -0,0 +1,60 @@
+import os
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pytest
+from bson import ObjectId
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "tripnext_test")
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import database
+from server import app
+from fastapi.testclient import TestClient
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory database behind get_database for each test"""
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "db", client["tripnext_test"])
+    return database.db
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion, for seeding and reading the database directly"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+@pytest.fixture
+def sign_up(db, run):
+    """Factory for users with a live session; tokens are unique so cached sessions never leak between tests"""
+    def create() -> dict:
+        user_id = ObjectId()
+        token = f"test-{user_id}"
+        now = datetime.now(timezone.utc)
+        run(db.users.insert_one({"_id": user_id, "email": f"{user_id}@test.example", "name": "Test User", "createdAt": now, "updatedAt": now}))
+        run(db.sessions.insert_one({"userId": str(user_id), "sessionToken": token, "expiresAt": now + timedelta(days=1), "createdAt": now}))
+        return {"id": str(user_id), "token": token, "client": TestClient(app, headers={"Authorization": f"Bearer {token}"})}
+    return create
+
+@pytest.fixture
+def user(sign_up) -> dict:
+    return sign_up()
+
+@pytest.fixture
+def api(user) -> TestClient:
+    """The app without its lifespan (no reaper or event broker), signed in as user"""
+    return user["client"]
+
+@pytest.fixture
+def trip(api) -> dict:
+    response = api.post("/api/trips", json={"name": "Test trip", "destination": "Paris", "budget": 1000.0})
+    assert response.status_code == 200
+    return response.json()
@@ -0,0 +1,33 @@
+from bson import ObjectId
+
+EXPENSE = {"category": "food", "amount": 12.0, "description": "Lunch"}
+
+def add_expense(api, trip_id: str) -> str:
+    response = api.post(f"/api/expenses/trip/{trip_id}", json=EXPENSE)
+    assert response.status_code == 200
+    return response.json()["_id"]
+
+def test_child_writes_need_access_to_the_childs_trip(api, trip, sign_up):
+    expense_id = add_expense(api, trip["id"])
+    stranger = sign_up()["client"]
+
+    assert stranger.put(f"/api/expenses/{expense_id}", json={**EXPENSE, "amount": 1.0}).status_code == 403
+    assert stranger.delete(f"/api/expenses/{expense_id}").status_code == 403
+    assert stranger.delete(f"/api/expenses/{'0' * 24}").status_code == 404
+    assert api.get(f"/api/trips/{trip['id']}").json()["spent"] == 12.0
+
+def test_a_new_collaborator_is_not_held_back_by_a_cached_denial(api, trip, sign_up, db, run):
+    expense_id = add_expense(api, trip["id"])
+    friend = sign_up()
+    assert friend["client"].delete(f"/api/expenses/{expense_id}").status_code == 403
+
+    # Written behind the cache's back, as by another worker
+    run(db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$push": {"collaborators": {"userId": friend["id"], "role": "editor"}}}))
+    assert friend["client"].delete(f"/api/expenses/{expense_id}").status_code == 200
+
+def test_child_of_a_deleted_trip_is_not_found(api, trip, sign_up):
+    expense_id = add_expense(api, trip["id"])
+    assert api.delete(f"/api/trips/{trip['id']}").status_code == 200
+
+    assert api.put(f"/api/expenses/{expense_id}", json=EXPENSE).status_code == 404
+    assert sign_up()["client"].delete(f"/api/expenses/{expense_id}").status_code == 404
@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+import admission
+from admission import ConcurrencyLimiter, TokenBucket, client_ip
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def request(peer: str = "10.0.0.1", headers: dict = None) -> Request:
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": raw, "client": (peer, 1234)})
+
+def test_token_bucket_allows_the_burst_then_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, burst=2, clock=clock)
+    assert bucket.take("a") == 0
+    assert bucket.take("a") == 0
+    assert bucket.take("a") == pytest.approx(1.0)
+    # Other keys have their own bucket
+    assert bucket.take("b") == 0
+
+    clock.now = 1.0
+    assert bucket.take("a") == 0
+
+def test_token_bucket_forgets_the_least_recently_used_key():
+    bucket = TokenBucket(rate_per_minute=60, burst=1, max_keys=2, clock=FakeClock())
+    bucket.take("a")
+    bucket.take("b")
+    bucket.take("c")
+    assert len(bucket) == 2
+    assert bucket.take("a") == 0
+
+def test_client_ip_trusts_only_the_configured_proxy_hops():
+    forwarded = {"X-Forwarded-For": "6.6.6.6, 1.2.3.4, 10.0.0.9"}
+    assert client_ip(request(), hops=0) == "10.0.0.1"
+    assert client_ip(request(headers=forwarded), hops=0) == "10.0.0.1"
+    assert client_ip(request(headers=forwarded), hops=2) == "1.2.3.4"
+    assert client_ip(request(headers=forwarded), hops=5) == "10.0.0.1"
+
+def test_rate_limit_sheds_with_429_and_retry_after(monkeypatch):
+    monkeypatch.setattr(admission.auth_admission, "by_ip", TokenBucket(60, 1, clock=FakeClock()))
+    admission.auth_admission.check_rate(request())
+    with pytest.raises(HTTPException) as shed:
+        admission.auth_admission.check_rate(request())
+    assert shed.value.status_code == 429
+    assert shed.value.headers["Retry-After"] == "1"
+
+def test_session_id_is_limited_across_addresses(monkeypatch):
+    monkeypatch.setattr(admission.auth_admission, "by_ip", TokenBucket(60, 10, clock=FakeClock()))
+    monkeypatch.setattr(admission.auth_admission, "by_session_id", TokenBucket(60, 1, clock=FakeClock()))
+    admission.auth_admission.check_rate(request("10.0.0.1", {"X-Session-ID": "s"}))
+    with pytest.raises(HTTPException) as shed:
+        admission.auth_admission.check_rate(request("10.0.0.2", {"X-Session-ID": "s"}))
+    assert shed.value.status_code == 429
+
+def test_login_route_returns_429_once_the_bucket_is_empty(api, monkeypatch):
+    monkeypatch.setattr(admission.auth_admission, "by_ip", TokenBucket(60, 1, clock=FakeClock()))
+    assert api.post("/api/auth/session", headers={"X-Session-ID": "unknown"}).status_code != 429
+    response = api.post("/api/auth/session", headers={"X-Session-ID": "unknown"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+def test_limiter_sheds_when_the_queue_is_full():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter:
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert (limiter.in_flight, limiter.waiting) == (1, 1)
+
+        with pytest.raises(HTTPException) as shed:
+            async with limiter:
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert (limiter.in_flight, limiter.waiting) == (0, 0)
+        return shed.value
+
+    shed = asyncio.run(scenario())
+    assert shed.status_code == 503
+
+def test_limiter_sheds_waiters_that_time_out():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+        async with limiter:
+            with pytest.raises(HTTPException) as shed:
+                async with limiter:
+                    pass
+        assert (limiter.in_flight, limiter.waiting) == (0, 0)
+        # The slot is free again
+        async with limiter:
+            pass
+        return shed.value
+
+    assert asyncio.run(scenario()).status_code == 503
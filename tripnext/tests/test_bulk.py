@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+
+def expense(amount: float) -> dict:
+    return {"category": "food", "amount": amount, "description": f"Expense {amount}"}
+
+def bulk(api, trip_id: str, operations: list, ordered: bool = True) -> dict:
+    response = api.post(f"/api/expenses/trip/{trip_id}/bulk", json={"operations": operations, "ordered": ordered})
+    assert response.status_code == 200
+    return response.json()
+
+def test_spent_follows_a_bulk_batch(api, trip):
+    created = bulk(api, trip["id"], [{"op": "create", "data": expense(amount)} for amount in (10.0, 20.0, 30.0)])
+    ids = [result["id"] for result in created["results"]]
+    assert all(ids)
+    assert api.get(f"/api/trips/{trip['id']}").json()["spent"] == 60.0
+
+    bulk(api, trip["id"], [
+        {"op": "update", "id": ids[0], "data": expense(15.0)},
+        {"op": "delete", "id": ids[1]},
+        {"op": "create", "data": expense(1.0)},
+    ])
+    fetched = api.get(f"/api/trips/{trip['id']}").json()
+    assert fetched["spent"] == 46.0
+    assert fetched["summary"]["expenses"] == 3
+
+def test_missing_targets_do_not_change_spent(api, trip):
+    created = bulk(api, trip["id"], [{"op": "create", "data": expense(10.0)}])
+    expense_id = created["results"][0]["id"]
+
+    missing = "0" * 24
+    result = bulk(api, trip["id"], [
+        {"op": "delete", "id": expense_id},
+        {"op": "delete", "id": expense_id},
+        {"op": "update", "id": missing, "data": expense(99.0)},
+    ], ordered=False)
+    # Unordered operations run concurrently, so either delete may be the one that finds it
+    assert sorted(r["status"] for r in result["results"][:2]) == ["error", "ok"]
+    assert result["results"][2]["status"] == "error"
+    assert api.get(f"/api/trips/{trip['id']}").json()["spent"] == 0.0
+
+def test_updates_and_deletes_share_one_bulk_write(api, trip, db, monkeypatch):
+    created = bulk(api, trip["id"], [{"op": "create", "data": expense(float(amount))} for amount in range(1, 21)])
+    ids = [result["id"] for result in created["results"]]
+
+    collection = type(db.expenses)
+    calls = {"bulk_write": 0, "single": 0}
+    bulk_write = collection.bulk_write
+    find_one_and_update = collection.find_one_and_update
+
+    async def counted_bulk_write(self, *args, **kwargs):
+        calls["bulk_write"] += self.name == "expenses"
+        return await bulk_write(self, *args, **kwargs)
+
+    async def counted_single(self, *args, **kwargs):
+        # The trip's version bump goes through the same class
+        calls["single"] += self.name == "expenses"
+        return await find_one_and_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection, "bulk_write", counted_bulk_write)
+    monkeypatch.setattr(collection, "find_one_and_update", counted_single)
+    result = bulk(api, trip["id"], [{"op": "update", "id": i, "data": expense(1.0)} for i in ids[:10]]
+                  + [{"op": "delete", "id": i} for i in ids[10:]])
+    assert result["updated"] == 10 and result["deleted"] == 10
+    assert calls == {"bulk_write": 1, "single": 0}
+    assert api.get(f"/api/trips/{trip['id']}").json()["spent"] == 10.0
+
+def test_a_target_changed_mid_batch_is_retried_against_its_new_state(api, trip, db, run, monkeypatch):
+    created = bulk(api, trip["id"], [{"op": "create", "data": expense(10.0)}, {"op": "create", "data": expense(20.0)}])
+    first, second = [result["id"] for result in created["results"]]
+
+    collection = type(db.expenses)
+    bulk_write = collection.bulk_write
+
+    async def collaborator_edits_first(self, *args, **kwargs):
+        # Lands after run_bulk read the pre-images; the trip's spent follows it as a real edit would
+        await db.expenses.update_one({"_id": ObjectId(first)}, {"$set": {"amount": 50.0, "updatedAt": datetime.now(timezone.utc)}})
+        await db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$inc": {"spent": 40.0, "version": 1}})
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection, "bulk_write", collaborator_edits_first)
+    result = bulk(api, trip["id"], [
+        {"op": "update", "id": first, "data": expense(15.0)},
+        {"op": "update", "id": second, "data": expense(25.0)},
+        {"op": "delete", "id": second},
+    ])
+    assert [r["status"] for r in result["results"]] == ["ok", "ok", "ok"]
+    assert api.get(f"/api/trips/{trip['id']}").json()["spent"] == 15.0
+    assert run(db.expenses.count_documents({"_bulkTag": {"$exists": True}})) == 0
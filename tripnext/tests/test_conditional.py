@@ -0,0 +1,34 @@
+def revalidate(api, path: str):
+    first = api.get(path)
+    assert first.status_code == 200
+    return first.headers["etag"]
+
+def test_trip_is_not_modified_until_a_child_write(api, trip):
+    path = f"/api/trips/{trip['id']}"
+    etag = revalidate(api, path)
+    assert api.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    expense = {"category": "food", "amount": 12.0, "description": "Lunch"}
+    assert api.post(f"/api/expenses/trip/{trip['id']}", json=expense).status_code == 200
+    changed = api.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["spent"] == 12.0
+
+def test_child_listing_follows_writes_to_any_child(api, trip):
+    path = f"/api/destinations/trip/{trip['id']}"
+    etag = revalidate(api, path)
+    assert api.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    # Any child write bumps the trip version, which the listing's ETag is built on
+    flight = {"airline": "Test Air", "flightNumber": "TA1", "from": "CDG", "to": "LHR",
+              "departTime": "09:00", "arriveTime": "10:15", "date": "2024-06-01T00:00:00Z", "price": 120.0}
+    assert api.post(f"/api/flights/trip/{trip['id']}", json=flight).status_code == 200
+    assert api.get(path, headers={"If-None-Match": etag}).status_code == 200
+
+def test_trip_listing_is_not_modified_until_a_write(api, trip):
+    etag = revalidate(api, "/api/trips")
+    assert api.get("/api/trips", headers={"If-None-Match": etag}).status_code == 304
+
+    assert api.put(f"/api/trips/{trip['id']}", json={"name": "Renamed", "destination": "Paris", "budget": 1000.0}).status_code == 200
+    assert api.get("/api/trips", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+
+def destination(name: str, lat: float, lng: float, day: int = 1, order: int = 0) -> dict:
+    return {"name": name, "address": "1 Test Street", "lat": lat, "lng": lng, "type": "attraction",
+            "day": day, "time": "10:00", "duration": 60, "order": order}
+
+def add(api, trip_id: str, *stops: dict) -> list:
+    ids = []
+    for stop in stops:
+        response = api.post(f"/api/destinations/trip/{trip_id}", json=stop)
+        assert response.status_code == 200
+        ids.append(response.json()["_id"])
+    return ids
+
+def version(api, trip_id: str) -> int:
+    return api.get(f"/api/trips/{trip_id}").json()["version"]
+
+def test_reorder_applies_a_layout_at_the_expected_version(api, trip):
+    first, second = add(api, trip["id"], destination("A", 48.85, 2.35), destination("B", 48.86, 2.36, order=1))
+    current = version(api, trip["id"])
+
+    response = api.patch(f"/api/destinations/trip/{trip['id']}/order", json={
+        "version": current, "items": [{"id": first, "day": 2, "order": 1}, {"id": second, "day": 2, "order": 0}]})
+    assert response.status_code == 200
+    assert response.json() == {"version": current + 1, "updated": 2}
+    listed = api.get(f"/api/destinations/trip/{trip['id']}").json()
+    assert [(stop["_id"], stop["day"], stop["order"]) for stop in listed] == [(second, 2, 0), (first, 2, 1)]
+
+def test_reorder_against_an_old_version_is_a_conflict(api, trip):
+    (first,) = add(api, trip["id"], destination("A", 48.85, 2.35))
+    stale = version(api, trip["id"])
+    add(api, trip["id"], destination("B", 48.86, 2.36))
+
+    response = api.patch(f"/api/destinations/trip/{trip['id']}/order", json={"version": stale, "items": [{"id": first, "day": 1, "order": 5}]})
+    assert response.status_code == 409
+    assert api.get(f"/api/destinations/trip/{trip['id']}").json()[0]["order"] == 0
+
+def test_reorder_rejects_an_empty_layout_without_bumping(api, trip):
+    current = version(api, trip["id"])
+    response = api.patch(f"/api/destinations/trip/{trip['id']}/order", json={"version": current, "items": []})
+    assert response.status_code == 422
+    assert version(api, trip["id"]) == current
+
+def test_reorder_on_a_trip_deleted_meanwhile_is_not_found(api, trip, db, run):
+    (first,) = add(api, trip["id"], destination("A", 48.85, 2.35))
+    current = version(api, trip["id"])
+    # Still cached as accessible, as on a worker that has not seen the delete
+    run(db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$set": {"deletedAt": datetime.now(timezone.utc)}}))
+
+    response = api.patch(f"/api/destinations/trip/{trip['id']}/order", json={"version": current, "items": [{"id": first, "day": 1, "order": 1}]})
+    assert response.status_code == 404
+
+def test_optimize_reorders_a_zigzag_day_into_a_shorter_route(api, trip):
+    # Along one street, entered out of order: west, east, middle-west, middle-east
+    ids = add(api, trip["id"], *(destination(name, 48.85, lng, order=order)
+                                 for order, (name, lng) in enumerate([("W", 2.30), ("E", 2.40), ("MW", 2.33), ("ME", 2.37)])))
+    west, east, middle_west, middle_east = ids
+    current = version(api, trip["id"])
+
+    response = api.post(f"/api/destinations/trip/{trip['id']}/optimize", json={"version": current})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] == current + 1
+    (day,) = body["days"]
+    assert day["order"] in ([west, middle_west, middle_east, east], [east, middle_east, middle_west, west])
+    assert day["distanceKm"] < day["previousDistanceKm"]
+    listed = api.get(f"/api/destinations/trip/{trip['id']}").json()
+    assert [stop["_id"] for stop in listed] == day["order"]
+
+def test_optimize_honours_pinned_endpoints(api, trip):
+    ids = add(api, trip["id"], *(destination(str(lng), 48.85, lng, order=order) for order, lng in enumerate([2.30, 2.40, 2.33, 2.37])))
+    west, east, middle_west, middle_east = ids
+
+    response = api.post(f"/api/destinations/trip/{trip['id']}/optimize", json={"days": [{"day": 1, "firstId": middle_west, "lastId": east}]})
+    assert response.status_code == 200
+    order = response.json()["days"][0]["order"]
+    assert (order[0], order[-1]) == (middle_west, east)
+    assert sorted(order) == sorted(ids)
+
+def test_optimize_rejects_inconsistent_pins(api, trip):
+    (stop,) = add(api, trip["id"], destination("A", 48.85, 2.35))
+    current = version(api, trip["id"])
+    url = f"/api/destinations/trip/{trip['id']}/optimize"
+
+    assert api.post(url, json={"days": [{"day": 1}, {"day": 1}]}).status_code == 400
+    assert api.post(url, json={"days": [{"day": 1, "firstId": stop, "lastId": stop}]}).status_code == 400
+    assert api.post(url, json={"days": [{"day": 2, "firstId": stop}]}).status_code == 400
+    assert version(api, trip["id"]) == current
+
+def test_optimize_against_an_old_version_is_a_conflict(api, trip):
+    add(api, trip["id"], destination("A", 48.85, 2.30), destination("B", 48.85, 2.40, order=1), destination("C", 48.85, 2.33, order=2))
+    stale = version(api, trip["id"]) - 1
+
+    response = api.post(f"/api/destinations/trip/{trip['id']}/optimize", json={"version": stale})
+    assert response.status_code == 409
+    assert [stop["name"] for stop in api.get(f"/api/destinations/trip/{trip['id']}").json()] == ["A", "B", "C"]
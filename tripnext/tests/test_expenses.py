@@ -0,0 +1,23 @@
+def expense(category: str, amount: float, date: str) -> dict:
+    return {"category": category, "amount": amount, "description": category, "date": date}
+
+def test_summary_totals_come_from_the_expenses(api, trip, user):
+    for data in (expense("food", 10.0, "2024-06-01T12:00:00Z"), expense("food", 5.0, "2024-06-02T12:00:00Z"),
+                 expense("transport", 30.0, "2024-06-02T08:00:00Z")):
+        assert api.post(f"/api/expenses/trip/{trip['id']}", json=data).status_code == 200
+
+    summary = api.get(f"/api/expenses/trip/{trip['id']}/summary").json()
+    assert (summary["budget"], summary["spent"], summary["remaining"], summary["count"]) == (1000.0, 45.0, 955.0, 3)
+    assert {row["key"]: (row["total"], row["count"]) for row in summary["byCategory"]} == {"food": (15.0, 2), "transport": (30.0, 1)}
+    assert {row["key"]: row["total"] for row in summary["byDay"]} == {"2024-06-01": 10.0, "2024-06-02": 35.0}
+    assert [(row["key"], row["total"]) for row in summary["byCollaborator"]] == [(user["id"], 45.0)]
+
+def test_summary_follows_expense_writes(api, trip):
+    created = api.post(f"/api/expenses/trip/{trip['id']}", json=expense("food", 10.0, "2024-06-01T12:00:00Z")).json()
+    first = api.get(f"/api/expenses/trip/{trip['id']}/summary")
+    assert api.get(f"/api/expenses/trip/{trip['id']}/summary", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    assert api.put(f"/api/expenses/{created['_id']}", json=expense("food", 25.0, "2024-06-01T12:00:00Z")).status_code == 200
+    changed = api.get(f"/api/expenses/trip/{trip['id']}/summary", headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.json()["spent"] == 25.0
@@ -0,0 +1,48 @@
+from bson import ObjectId
+from geo import LOCATION_FIELD, box_filter, geo_point, near_filter, set_location
+from .test_destinations import add, destination
+
+def polygons(query: dict) -> list:
+    """The rings of a box filter, one per box"""
+    boxes = query.get("$or", [query])
+    return [box[LOCATION_FIELD]["$geoWithin"]["$geometry"]["coordinates"][0] for box in boxes]
+
+def longitudes(ring: list) -> tuple:
+    return min(point[0] for point in ring), max(point[0] for point in ring)
+
+def test_geo_point_uses_lng_lat_order_and_drops_invalid_coordinates():
+    assert geo_point(48.85, 2.35) == {"type": "Point", "coordinates": [2.35, 48.85]}
+    assert geo_point(91, 0) is None
+    assert geo_point(0, -181) is None
+    assert geo_point(None, 0) is None
+    assert set_location({"lat": 1, "lng": 2})[LOCATION_FIELD]["coordinates"] == [2.0, 1.0]
+    assert LOCATION_FIELD not in set_location({"lat": 1})
+
+def test_near_filter_is_in_metres():
+    near = near_filter(48.85, 2.35, 1.5)[LOCATION_FIELD]["$nearSphere"]
+    assert near["$geometry"]["coordinates"] == [2.35, 48.85]
+    assert near["$maxDistance"] == 1500
+
+def test_box_filter_rings_are_closed_and_counter_clockwise():
+    (ring,) = polygons(box_filter(48.0, 2.0, 49.0, 3.0))
+    assert ring[0] == ring[-1]
+    area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+    assert area > 0
+
+def test_box_filter_splits_at_the_antimeridian_and_wide_boxes():
+    assert [longitudes(ring) for ring in polygons(box_filter(-10, 170, 10, -170))] == [(170, 180), (-180, -170)]
+    assert [longitudes(ring) for ring in polygons(box_filter(-60, -170, 60, 170))] == [(-170, 0), (0, 170)]
+
+def test_destinations_keep_the_location_mirror_in_step(api, trip, db, run):
+    (stop,) = add(api, trip["id"], destination("A", 48.85, 2.35))
+    stored = run(db.destinations.find_one({"_id": ObjectId(stop)}))
+    assert stored[LOCATION_FIELD] == {"type": "Point", "coordinates": [2.35, 48.85]}
+
+    assert api.put(f"/api/destinations/{stop}", json=destination("A", 51.5, -0.12)).status_code == 200
+    stored = run(db.destinations.find_one({"_id": ObjectId(stop)}))
+    assert stored[LOCATION_FIELD] == {"type": "Point", "coordinates": [-0.12, 51.5]}
+
+def test_map_queries_validate_their_bounds(api):
+    assert api.get("/api/destinations/within", params={"minLat": 10, "minLng": 0, "maxLat": 5, "maxLng": 1}).status_code == 400
+    assert api.get("/api/destinations/near", params={"lat": 95, "lng": 0}).status_code == 422
+    assert api.get("/api/destinations/near", params={"lat": 0, "lng": 0, "radius": 0}).status_code == 422
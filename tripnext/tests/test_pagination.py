@@ -0,0 +1,45 @@
+import json
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pagination import NEXT_CURSOR_HEADER
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+def seed_expenses(db, run, trip_id: str, dated: int, undated: int) -> set:
+    """Expenses sort newest first; the undated ones (no date field at all) come last"""
+    start = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    docs = [{"_id": ObjectId(), "tripId": trip_id, "category": "food", "amount": 1.0, "description": f"d{i}",
+             "date": start + timedelta(days=i % 3)} for i in range(dated)]
+    docs += [{"_id": ObjectId(), "tripId": trip_id, "category": "food", "amount": 1.0, "description": f"u{i}"} for i in range(undated)]
+    run(db.expenses.insert_many(docs))
+    return {str(doc["_id"]) for doc in docs}
+
+def test_cursor_pages_cover_every_row_once(api, trip, db, run):
+    expected = seed_expenses(db, run, trip["id"], dated=7, undated=4)
+    seen, after, pages = [], None, 0
+    while True:
+        response = api.get(f"/api/expenses/trip/{trip['id']}", params={"limit": 3, **({"after": after} if after else {})})
+        assert response.status_code == 200
+        seen += [expense["_id"] for expense in response.json()]
+        pages += 1
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if not after:
+            break
+    assert len(seen) == len(expected) and set(seen) == expected
+    assert pages == 4
+
+def test_ndjson_pages_end_with_the_next_cursor(api, trip, db, run):
+    expected = seed_expenses(db, run, trip["id"], dated=3, undated=2)
+    seen, after = [], None
+    while True:
+        params = {"limit": 2, **({"after": after} if after else {})}
+        lines = [json.loads(line) for line in api.get(f"/api/expenses/trip/{trip['id']}", params=params, headers=NDJSON).text.splitlines()]
+        after = lines.pop()["nextCursor"] if lines and "nextCursor" in lines[-1] else None
+        assert len(lines) <= 2
+        seen += [expense["_id"] for expense in lines]
+        if not after:
+            break
+    assert len(seen) == len(expected) and set(seen) == expected
+
+def test_a_forged_cursor_is_rejected(api, trip):
+    assert api.get(f"/api/expenses/trip/{trip['id']}", params={"limit": 2, "after": "not-a-cursor"}).status_code == 400
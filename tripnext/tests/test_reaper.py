@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from access import trip_access_cache
+from reaper import reap_all
+
+EXPENSE = {"category": "food", "amount": 12.0, "description": "Lunch"}
+
+def test_deleted_trip_is_hidden_then_reaped(api, trip, db, run):
+    assert api.post(f"/api/expenses/trip/{trip['id']}", json=EXPENSE).status_code == 200
+    assert api.delete(f"/api/trips/{trip['id']}").status_code == 200
+    assert api.get(f"/api/trips/{trip['id']}").status_code == 404
+    assert api.get(f"/api/expenses/trip/{trip['id']}").status_code == 404
+
+    assert run(reap_all(db)) == 1
+    assert run(db.expenses.count_documents({"tripId": trip["id"]})) == 0
+
+def test_child_write_racing_a_delete_leaves_no_orphan(api, trip, db, run):
+    # Warm the access cache, then tombstone the trip behind its back, as
+    # another worker would
+    assert api.get(f"/api/expenses/trip/{trip['id']}").status_code == 200
+    assert trip_access_cache.get(trip["id"]) is not None
+    run(db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$set": {"deletedAt": datetime.now(timezone.utc)}}))
+
+    assert api.post(f"/api/expenses/trip/{trip['id']}", json=EXPENSE).status_code == 404
+    assert run(db.expenses.count_documents({"tripId": trip["id"]})) == 0
+    assert run(db.trips.find_one({"_id": ObjectId(trip["id"])}))["summary"]["expenses"] == 0
@@ -0,0 +1,42 @@
+import itertools
+import numpy as np
+import pytest
+from routing import haversine_km, haversine_matrix, route_length, solve_route
+
+def brute_force(dist: np.ndarray, first=None, last=None) -> float:
+    """Length of the best open path, for checking the heuristic on small inputs"""
+    best = np.inf
+    for route in itertools.permutations(range(len(dist))):
+        if (first is None or route[0] == first) and (last is None or route[-1] == last):
+            best = min(best, route_length(dist, route))
+    return best
+
+def test_haversine_matches_a_known_distance():
+    # Paris to London is about 344 km
+    assert float(haversine_km(48.8566, 2.3522, 51.5074, -0.1278)) == pytest.approx(343.5, abs=1.0)
+    dist = haversine_matrix([0, 0], [0, 1])
+    assert dist[0, 0] == 0
+    assert dist[0, 1] == pytest.approx(dist[1, 0])
+
+@pytest.mark.parametrize("n", [0, 1, 2])
+def test_tiny_inputs_respect_pins(n):
+    dist = haversine_matrix([0.0] * n, [float(i) for i in range(n)])
+    assert sorted(solve_route(dist)) == list(range(n))
+    if n == 2:
+        assert solve_route(dist, first=1) == [1, 0]
+        assert solve_route(dist, last=0) == [1, 0]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_route_visits_every_point_once_and_is_near_optimal(seed):
+    rng = np.random.default_rng(seed)
+    lat, lng = rng.uniform(48.8, 48.9, 7), rng.uniform(2.2, 2.5, 7)
+    dist = haversine_matrix(lat, lng)
+
+    for first, last in [(None, None), (0, None), (None, 6), (0, 6)]:
+        route = solve_route(dist, first, last)
+        assert sorted(route) == list(range(7))
+        if first is not None:
+            assert route[0] == first
+        if last is not None:
+            assert route[-1] == last
+        assert route_length(dist, route) <= brute_force(dist, first, last) * 1.1
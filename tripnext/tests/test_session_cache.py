@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import session_cache as session_cache_module
+from models import User
+from session_cache import SessionCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def someone(name: str = "Ada") -> User:
+    return User(email="ada@test.example", name=name)
+
+def later(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    cache = SessionCache(max_entries=10, ttl_seconds=60, clock=clock)
+    cache.set("t", someone(), later(3600))
+    assert cache.get("t").name == "Ada"
+
+    clock.now = 60
+    assert cache.get("t") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_never_outlive_the_session():
+    clock = FakeClock()
+    cache = SessionCache(max_entries=10, ttl_seconds=60, clock=clock)
+    cache.set("t", someone(), later(5))
+    clock.now = 10
+    assert cache.get("t") is None
+
+    # Already expired, and naive datetimes are read as UTC
+    cache.set("t", someone(), datetime.utcnow() - timedelta(seconds=1))
+    assert cache.get("t") is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SessionCache(max_entries=2, ttl_seconds=60, clock=FakeClock())
+    cache.set("a", someone("A"), later(3600))
+    cache.set("b", someone("B"), later(3600))
+    cache.get("a")
+    cache.set("c", someone("C"), later(3600))
+    assert cache.get("b") is None
+    assert cache.get("a").name == "A"
+    assert cache.evictions == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = SessionCache(max_entries=10, ttl_seconds=0, clock=FakeClock())
+    cache.set("t", someone(), later(3600))
+    assert cache.get("t") is None
+
+def test_invalidation_is_forwarded_unless_applied_from_elsewhere():
+    cache = SessionCache(max_entries=10, ttl_seconds=60, clock=FakeClock())
+    heard = []
+    cache.add_invalidation_listener(heard.append)
+    cache.set("t", someone(), later(3600))
+    cache.invalidate("t")
+    assert cache.get("t") is None
+    cache.invalidate("u", broadcast=False)
+    assert heard == ["t"]
+
+    cache.remove_invalidation_listener(heard.append)
+    cache.invalidate("v")
+    assert heard == ["t"]
+
+def test_logout_drops_the_cached_session(user):
+    client = user["client"]
+    assert client.get("/api/auth/me").status_code == 200
+    assert session_cache_module.session_cache.get(user["token"]) is not None
+
+    client.cookies.set("session_token", user["token"])
+    assert client.post("/api/auth/logout").status_code == 200
+    client.cookies.clear()
+    assert session_cache_module.session_cache.get(user["token"]) is None
+    assert client.get("/api/auth/me").status_code == 401
@@ -0,0 +1,84 @@
+import time
+import pytest
+import auth
+import session_tokens
+from session_tokens import SessionDenylist, SessionSigner, parse_keys
+
+@pytest.fixture
+def signer(monkeypatch) -> SessionSigner:
+    """Signed sessions switched on with a fresh denylist, as SESSION_MODE=signed would"""
+    signer = SessionSigner(parse_keys("k2:new-secret,k1:old-secret"))
+    denylist = SessionDenylist()
+    monkeypatch.setattr(auth, "session_signer", signer)
+    monkeypatch.setattr(auth, "session_denylist", denylist)
+    monkeypatch.setattr(session_tokens, "session_denylist", denylist)
+    return signer
+
+def test_parse_keys_rejects_malformed_entries():
+    assert list(parse_keys("a:one, b:two")) == ["a", "b"]
+    for spec in ["nosecret", "a:", ":secret", "a.b:secret"]:
+        with pytest.raises(ValueError):
+            parse_keys(spec)
+
+def test_verify_round_trips_claims(signer):
+    token, expires = signer.issue("user-1")
+    claims = signer.verify(token)
+    assert claims.user_id == "user-1"
+    assert claims.expires == expires
+    assert token.split(".")[1] == "k2"
+
+def test_verify_rejects_tampering_and_unknown_keys(signer):
+    token, _ = signer.issue("user-1")
+    parts = token.split(".")
+    assert signer.verify(".".join(parts[:2] + ["user-2"] + parts[3:])) is None
+    assert signer.verify(".".join(parts[:-1] + [parts[-1][::-1]])) is None
+    assert signer.verify(".".join(["s1", "k9"] + parts[2:])) is None
+    assert signer.verify("not-a-token") is None
+
+def test_verify_accepts_rotated_keys_and_rejects_expired_tokens():
+    old = SessionSigner(parse_keys("k1:old-secret"))
+    token, _ = old.issue("user-1")
+    assert SessionSigner(parse_keys("k2:new-secret,k1:old-secret")).verify(token) is not None
+    assert SessionSigner(parse_keys("k2:new-secret")).verify(token) is None
+
+    expired, _ = SessionSigner(parse_keys("k1:old-secret"), ttl_seconds=-1).issue("user-1")
+    assert old.verify(expired) is None
+
+def test_logout_revokes_a_cached_signed_session(signer, db, user):
+    token, _ = signer.issue(user["id"])
+    client = user["client"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    client.cookies.set("session_token", token)
+    assert client.post("/api/auth/logout").status_code == 200
+    client.cookies.clear()
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_forced_sign_out_cuts_off_earlier_tokens(signer, db, run, user):
+    token, _ = signer.issue(user["id"])
+    headers = {"Authorization": f"Bearer {token}"}
+    client = user["client"]
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    assert run(session_tokens.revoke_user_sessions(db, [user["id"]])) == 1
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    # The database session went too
+    assert client.get("/api/auth/me").status_code == 401
+
+def test_refresh_picks_up_other_workers_revocations(signer, db, run):
+    token, _ = signer.issue("user-1")
+    claims = signer.verify(token)
+    here, elsewhere = SessionDenylist(), SessionDenylist()
+    run(here.revoke_session(db, claims))
+    assert here.is_revoked(claims)
+    assert not elsewhere.is_revoked(claims)
+
+    run(elsewhere.refresh(db))
+    assert elsewhere.is_revoked(claims)
+
+    run(here.revoke_user(db, "user-2"))
+    run(elsewhere.refresh(db))
+    later = claims._replace(user_id="user-2", token_id="other")
+    assert elsewhere.is_revoked(later)
+    assert not elsewhere.is_revoked(later._replace(issued_at=int(time.time()) + 5))
@@ -0,0 +1,16 @@
+import pytest
+import server
+
+STATUS_PATHS = ["/api/status/db-pool", "/api/status/events", "/api/status/sessions", "/api/status/auth", "/api/status/reaper"]
+
+@pytest.mark.parametrize("path", STATUS_PATHS)
+def test_status_hidden_without_a_configured_token(api, monkeypatch, path):
+    monkeypatch.setattr(server, "STATUS_TOKEN", "")
+    assert api.get(path, headers={"X-Status-Token": ""}).status_code == 404
+
+@pytest.mark.parametrize("path", STATUS_PATHS)
+def test_status_requires_the_token(api, monkeypatch, path):
+    monkeypatch.setattr(server, "STATUS_TOKEN", "ops-secret")
+    assert api.get(path).status_code == 403
+    assert api.get(path, headers={"X-Status-Token": "wrong"}).status_code == 403
+    assert api.get(path, headers={"X-Status-Token": "ops-secret"}).status_code == 200
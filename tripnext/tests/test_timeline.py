@@ -0,0 +1,36 @@
+from bson import ObjectId
+from timeline import SpeedModel, build_day, format_minutes, parse_time
+
+# 6 km/h everywhere and no detour: 1 km takes 10 minutes
+FLAT = SpeedModel(walk_kmh=6.0, walk_max_km=float("inf"), ride_kmh=6.0, detour_factor=1.0)
+KM_LAT = 1 / 111.195  # one kilometre of latitude
+
+def stop(name: str, time, km: float, duration: int = 60, order: int = 0) -> dict:
+    return {"_id": ObjectId(), "name": name, "time": time, "lat": km * KM_LAT, "lng": 0.0, "duration": duration, "order": order}
+
+def test_parse_time_accepts_common_spellings():
+    assert [parse_time(text) for text in ("14:30", "2:30 PM", "9am", "14h30", "12am", "noon", "25:00")] == [870, 870, 540, 870, 0, None, None]
+    assert format_minutes(25 * 60 + 5) == "01:05+1d"
+
+def test_a_stop_starting_inside_an_earlier_one_overlaps_it():
+    first = stop("A", "09:00", 0, duration=180)
+    day = build_day(1, [first, stop("B", "10:00", 0, duration=30), stop("C", "11:00", 0)], FLAT)
+    # C clears B but not A, which is still running
+    assert [s.overlapsWith for s in day.stops] == [None, str(first["_id"]), str(first["_id"])]
+    assert day.conflicts == 2
+
+def test_a_stop_too_far_to_reach_in_the_gap_is_unreachable():
+    day = build_day(1, [
+        stop("A", "09:00", 0),
+        stop("B", "10:05", 2),   # 5 minutes after A ends, 20 minutes away
+        stop("C", "13:00", 2.1),
+    ], FLAT)
+    assert [(s.gapMinutes, s.unreachable) for s in day.stops] == [(None, False), (5, True), (115, False)]
+    assert day.conflicts == 1
+
+def test_untimed_stops_go_last_and_are_not_judged():
+    day = build_day(1, [stop("Later", None, 5, order=0), stop("A", "9am", 0), stop("B", "10:30", 0.5)], FLAT)
+    assert [s.name for s in day.stops] == ["A", "B", "Later"]
+    assert day.stops[1].gapMinutes == 30 and not day.stops[1].unreachable
+    assert day.stops[2].gapMinutes is None and not day.stops[2].unreachable
+    assert day.stops[2].travelMinutesFromPrevious == 45.0
@@ -0,0 +1,98 @@
+import json
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+DESTINATION = {"name": "Louvre", "address": "Rue de Rivoli", "lat": 48.86, "lng": 2.34, "type": "museum",
+               "day": 1, "time": "10:00", "duration": 120, "order": 0}
+FLIGHT = {"airline": "Test Air", "flightNumber": "TA1", "from": "CDG", "to": "LHR",
+          "departTime": "09:00", "arriveTime": "10:15", "date": "2024-06-01T00:00:00Z", "price": 120.0}
+EXPENSE = {"category": "food", "amount": 42.5, "description": "Dinner, with \"quotes\"\nand a newline", "date": "2024-06-01T00:00:00Z"}
+
+# Assigned on insert, so they differ between the source and the imported copy
+VOLATILE = {"_id", "id", "tripId", "createdAt", "updatedAt"}
+
+def children(api, trip_id: str) -> list:
+    lines = api.get(f"/api/trips/{trip_id}/export", params={"format": "jsonl"}).text.splitlines()
+    rows = [json.loads(line) for line in lines if line]
+    assert rows[0]["kind"] == "trip"
+    return [{key: value for key, value in row.items() if key not in VOLATILE} for row in rows[1:]]
+
+def seed(api, trip_id: str):
+    assert api.post(f"/api/destinations/trip/{trip_id}", json=DESTINATION).status_code == 200
+    assert api.post(f"/api/destinations/trip/{trip_id}", json={**DESTINATION, "name": "Orsay", "order": 1}).status_code == 200
+    assert api.post(f"/api/flights/trip/{trip_id}", json=FLIGHT).status_code == 200
+    assert api.post(f"/api/expenses/trip/{trip_id}", json=EXPENSE).status_code == 200
+    assert api.post(f"/api/expenses/trip/{trip_id}", json={**EXPENSE, "amount": 7.5, "description": "Coffee", "date": "2024-06-02T00:00:00Z"}).status_code == 200
+
+def new_trip(api) -> dict:
+    return api.post("/api/trips", json={"name": "Copy", "destination": "Paris", "budget": 1000.0}).json()
+
+@pytest.mark.parametrize("format,content_type", [("jsonl", "application/x-ndjson"), ("csv", "text/csv")])
+def test_export_import_round_trip(api, trip, format, content_type):
+    seed(api, trip["id"])
+    exported = api.get(f"/api/trips/{trip['id']}/export", params={"format": format})
+    assert exported.status_code == 200
+
+    copy = new_trip(api)
+    result = api.post(f"/api/trips/{copy['id']}/import", content=exported.content, headers={"Content-Type": content_type})
+    assert result.status_code == 200
+    body = result.json()
+    assert body["inserted"] == {"destinations": 2, "flights": 1, "expenses": 2}
+    assert body["rejected"] == 0
+
+    assert children(api, copy["id"]) == children(api, trip["id"])
+    imported = api.get(f"/api/trips/{copy['id']}").json()
+    assert imported["spent"] == 50.0
+    assert imported["summary"] == {"destinations": 2, "flights": 1, "expenses": 2}
+
+def test_import_rejects_invalid_rows_by_line(api, trip):
+    body = "\n".join([
+        json.dumps({"kind": "expense", **EXPENSE}),
+        json.dumps({"kind": "expense", "category": "food"}),
+        json.dumps({"kind": "boat"}),
+    ]).encode()
+    result = api.post(f"/api/trips/{trip['id']}/import", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    assert result["inserted"]["expenses"] == 1
+    assert result["rejected"] == 2
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+
+def test_import_counts_rows_a_batch_failed_to_write(api, trip, db, monkeypatch):
+    collection = type(db.expenses)
+    insert_many = collection.insert_many
+
+    async def second_row_fails(self, docs, ordered=True):
+        # What mongod reports for an unordered batch with one duplicate key
+        docs = list(docs)
+        written = docs[:1] + docs[2:]
+        await insert_many(self, written, ordered=ordered)
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}], "nInserted": len(written)})
+
+    monkeypatch.setattr(collection, "insert_many", second_row_fails)
+    body = "".join(json.dumps({"kind": "expense", **EXPENSE, "amount": amount}) + "\n" for amount in (1.0, 2.0, 4.0)).encode()
+    result = api.post(f"/api/trips/{trip['id']}/import", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    assert result["inserted"]["expenses"] == 2
+    assert result["errors"] == [{"line": 2, "error": "duplicate key"}]
+
+    imported = api.get(f"/api/trips/{trip['id']}").json()
+    assert imported["spent"] == 5.0
+    assert imported["summary"]["expenses"] == 2
+
+def test_import_counts_what_landed_when_a_batch_fails_midway(api, trip, db, monkeypatch):
+    collection = type(db.expenses)
+    insert_many = collection.insert_many
+
+    async def connection_drops(self, docs, ordered=True):
+        # The first row reached the server before the connection went
+        docs = list(docs)
+        await insert_many(self, docs[:1], ordered=ordered)
+        raise AutoReconnect("connection closed")
+
+    monkeypatch.setattr(collection, "insert_many", connection_drops)
+    body = "".join(json.dumps({"kind": "expense", **EXPENSE, "amount": amount}) + "\n" for amount in (1.0, 2.0)).encode()
+    result = api.post(f"/api/trips/{trip['id']}/import", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    assert result["inserted"]["expenses"] == 1
+    assert result["errors"] == [{"line": 2, "error": "connection closed"}]
+
+    imported = api.get(f"/api/trips/{trip['id']}").json()
+    assert imported["spent"] == 1.0
+    assert imported["summary"]["expenses"] == 1
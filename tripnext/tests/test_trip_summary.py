@@ -0,0 +1,40 @@
+from bson import ObjectId
+import trip_summary
+from trip_summary import rebuild_summaries
+
+FLIGHT = {"airline": "Test Air", "flightNumber": "TA1", "from": "CDG", "to": "LHR",
+          "departTime": "09:00", "arriveTime": "10:15", "date": "2099-06-01T00:00:00Z", "price": 120.0}
+EXPENSE = {"category": "food", "amount": 12.0, "description": "Lunch"}
+
+def stored(db, run, trip_id: str) -> dict:
+    return run(db.trips.find_one({"_id": ObjectId(trip_id)}))
+
+def test_rebuild_repairs_drift_and_bumps_the_version(api, trip, db, run):
+    assert api.post(f"/api/flights/trip/{trip['id']}", json=FLIGHT).status_code == 200
+    assert api.post(f"/api/expenses/trip/{trip['id']}", json=EXPENSE).status_code == 200
+    run(db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$set": {"summary.expenses": 7, "flightSchedule": {}}}))
+    etag = api.get(f"/api/trips/{trip['id']}").headers["etag"]
+
+    assert run(rebuild_summaries(db, [trip["id"]])) == 1
+    repaired = api.get(f"/api/trips/{trip['id']}", headers={"If-None-Match": etag})
+    assert repaired.status_code == 200
+    assert repaired.json()["summary"] == {"destinations": 0, "flights": 1, "expenses": 1}
+    assert repaired.json()["nextFlight"]["flightNumber"] == "TA1"
+
+    assert run(rebuild_summaries(db, [trip["id"]])) == 0
+
+def test_rebuild_does_not_overwrite_a_concurrent_child_write(api, trip, db, run, monkeypatch):
+    run(db.trips.update_one({"_id": ObjectId(trip["id"])}, {"$set": {"summary.expenses": 5}}))
+    count = trip_summary.trip_children_summary
+
+    async def write_while_counting(db, trip_id):
+        # An expense lands after the repair read the version but before it writes
+        result = await count(db, trip_id)
+        if not await db.expenses.count_documents({"tripId": trip_id}):
+            await db.expenses.insert_one({**EXPENSE, "tripId": trip_id})
+            await db.trips.update_one({"_id": ObjectId(trip_id)}, {"$inc": {"version": 1, "summary.expenses": 1}})
+        return result
+
+    monkeypatch.setattr(trip_summary, "trip_children_summary", write_while_counting)
+    assert run(rebuild_summaries(db, [trip["id"]])) == 1
+    assert stored(db, run, trip["id"])["summary"]["expenses"] == 1